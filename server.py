@@ -1,15 +1,18 @@
+import asyncio
+import hashlib
 import json
 import os
 import re
 import time
 import sys
+import threading
+import httpx
 import requests
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-import subprocess
 
 app = FastAPI()
 
@@ -30,32 +33,29 @@ USERS_LIST_FILE = os.path.join(DATA_DIR, "users_list.json")
 RAW_USERS_DIR = os.path.join(DATA_DIR, "raw_users")
 CONFIG_FILE = os.path.join(ROOT_DIR, "config.json")
 SRC_DIR = os.path.join(ROOT_DIR, "src")
-PIPELINE_SCRIPT = os.path.join(SRC_DIR, "run_pipeline.py")
+sys.path.insert(0, SRC_DIR)
+from vector_store import SimpleVectorStore, VECTOR_STORE_FILE, create_index
+from embedding_client import EmbeddingClient, QueryEmbeddingCache
+from generate_search_embeddings import index_users
+from data_cache import load_json_cached
+from storage import open_storage
+from http_clients import AsyncHTTPClients
+from report_cache import ReportCache, report_key
+from http_cache import HTTPCache
+from github_client import TokenPool, load_github_tokens
+from mining_queue import MiningQueue, PRIORITIES, PRIORITY_INTERACTIVE
+import run_pipeline as pipeline
 DEVELOPER_VECTORS_FILE = os.path.join(DATA_DIR, "developer_vectors.json")
 
-# In-memory status for mining jobs
-mining_status = {} # username -> status ("processing", "done", "failed")
-
-def run_pipeline_for_user(username: str):
-    """Background task to run pipeline for a user"""
-    print(f"Starting background mining for {username}")
-    mining_status[username] = "processing"
-    try:
-        # Run the pipeline script via subprocess
-        result = subprocess.run(
-            [sys.executable, PIPELINE_SCRIPT, "--username", username],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        print(f"Mining for {username} completed.")
-        mining_status[username] = "done"
-    except subprocess.CalledProcessError as e:
-        print(f"Mining for {username} failed: {e.stderr}")
-        mining_status[username] = "failed"
-    except Exception as e:
-        print(f"Mining for {username} error: {str(e)}")
-        mining_status[username] = "failed"
+def run_pipeline_for_user(username: str, on_step=None):
+    """Mining job run by the queue workers: pipeline, then index and cache upkeep."""
+    if not pipeline.run_pipeline(username, on_step=on_step):
+        return False
+    # Insert the freshly mined user into the vector store / ANN index
+    run_embedding_indexer([username])
+    # Reports for the old data are keyed by the old payload hash; drop them now
+    report_cache.invalidate(username)
+    return True
 
 def load_config():
     if os.path.exists(CONFIG_FILE):
@@ -64,12 +64,13 @@ def load_config():
     return {}
 
 config = load_config()
+# Data access goes through the configured backend (JSON file tree or SQLite)
+storage = open_storage(config, cache_documents=True)
 MAXKB_API_URL = os.environ.get("MAXKB_API_URL") or config.get("maxkb_api_url", "")
 if MAXKB_API_URL:
     MAXKB_API_URL = f"{MAXKB_API_URL.rstrip('/')}/chat/completions"
 
 MAXKB_API_KEY = os.environ.get("MAXKB_API_KEY") or config.get("maxkb_api_key", "")
-GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN") or config.get("github_token") or ((config.get("github_tokens") or [None])[0])
 LLM_API_URL = os.environ.get("LLM_API_URL") or config.get("LLM_api_url") or config.get("llm_api_url")
 LLM_API_KEY = os.environ.get("LLM_API_KEY") or config.get("LLM_api_key") or config.get("llm_api_key", "")
 LLM_MODEL = os.environ.get("LLM_MODEL") or config.get("LLM_model") or config.get("llm_model")
@@ -84,143 +85,144 @@ QWEN_API_URL = os.environ.get("QWEN_API_URL") or LLM_API_URL or config.get("qwen
 QWEN_API_KEY = os.environ.get("QWEN_API_KEY") or LLM_API_KEY or config.get("qwen_api_key", "")
 QWEN_EMBEDDING_MODEL = os.environ.get("QWEN_EMBEDDING_MODEL") or LLM_EMBEDDING_MODEL or config.get("qwen_embedding_model", "text-embedding-v4")
 
-USER_EMBEDDINGS_CACHE_FILE = os.path.join(DATA_DIR, "vector_store.json")
-
-class SimpleVectorStore:
-    def __init__(self, storage_file=USER_EMBEDDINGS_CACHE_FILE):
-        self.storage_file = storage_file
-        self.vectors = {}
-        self.load()
-
-    def load(self):
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    self.vectors = json.load(f)
-            except Exception as e:
-                print(f"Failed to load vector store: {e}")
-                self.vectors = {}
-        # Migration from old filename if exists and new one doesn't
-        elif os.path.exists(os.path.join(DATA_DIR, "user_embeddings_cache.json")):
-             try:
-                with open(os.path.join(DATA_DIR, "user_embeddings_cache.json"), 'r', encoding='utf-8') as f:
-                    self.vectors = json.load(f)
-                self.save() # Save to new location
-             except:
-                 pass
-
-    def save(self):
-        try:
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(self.vectors, f)
-        except Exception as e:
-            print(f"Failed to save vector store: {e}")
-
-    def add(self, key, vector):
-        self.vectors[key] = vector
-
-    def get(self, key):
-        return self.vectors.get(key)
-    
-    def has(self, key):
-        return key in self.vectors
-
-    def search(self, query_vector, limit=10):
-        results = []
-        for key, vector in self.vectors.items():
-            score = cosine_similarity(query_vector, vector)
-            results.append((key, score))
-        
-        results.sort(key=lambda x: x[1], reverse=True)
-        return results[:limit]
+# Embedding backfill: texts per /embeddings request and concurrent requests
+EMBEDDING_BATCH_SIZE = int(config.get("embedding_batch_size", 10))
+EMBEDDING_CONCURRENCY = int(config.get("embedding_concurrency", 4))
+# Background embedding indexer: seconds between runs (0 disables the periodic task)
+EMBEDDING_INDEXER_INTERVAL = int(config.get("embedding_indexer_interval", 600))
+
+# Query embedding cache: max entries, TTL in seconds, and persistence across restarts
+QUERY_CACHE_SIZE = int(config.get("query_cache_size", 1024))
+QUERY_CACHE_TTL = float(config.get("query_cache_ttl", 86400))
+QUERY_CACHE_FILE = os.path.join(DATA_DIR, "query_embedding_cache.json") if config.get("query_cache_persist", True) else None
+
+# Outbound HTTP: pooled async clients, one per upstream service (connection limit per host)
+HTTP_MAX_CONNECTIONS_PER_HOST = int(config.get("http_max_connections_per_host", 20))
+HTTP_MAX_KEEPALIVE = int(config.get("http_max_keepalive", 10))
+
+# MaxKB analysis reports cached on disk by payload hash (0 disables)
+REPORT_CACHE_DIR = os.path.join(DATA_DIR, "report_cache")
+REPORT_CACHE_MAX_MB = float(config.get("report_cache_max_mb", 200))
+
+# /api/analyze-repo: GitHub responses revalidated by ETag, LLM summaries keyed by (repo, README hash, model)
+GITHUB_HTTP_CACHE_DIR = os.path.join(DATA_DIR, "http_cache")
+GITHUB_HTTP_CACHE_MAX_MB = float(config.get("github_cache_max_mb", 100))
+REPO_SUMMARY_CACHE_DIR = os.path.join(DATA_DIR, "repo_summary_cache")
+REPO_SUMMARY_CACHE_MAX_MB = float(config.get("repo_summary_cache_max_mb", 20))
+
+# Mining job queue: worker threads, max queued jobs, and seconds before a failed user is retried
+MINING_WORKERS = int(config.get("mining_workers", 2))
+MINING_QUEUE_MAX = int(config.get("mining_queue_max", 100))
+MINING_RETRY_AFTER = float(config.get("mining_retry_after", 3600))
+MINING_QUEUE_DB = os.path.join(DATA_DIR, "mining_jobs.db")
+
+# Vector index: "exact" (brute-force scan) or "ivf" (approximate, for large stores)
+VECTOR_INDEX = os.environ.get("VECTOR_INDEX") or config.get("vector_index", "exact")
+VECTOR_INDEX_NLIST = config.get("vector_index_nlist")
+VECTOR_INDEX_NPROBE = config.get("vector_index_nprobe", 8)
+VECTOR_INDEX_MIN_VECTORS = config.get("vector_index_min_vectors", 10000)
 
 # Initialize global vector store
-vector_store = SimpleVectorStore()
+vector_store = SimpleVectorStore(
+    VECTOR_STORE_FILE,
+    # With the SQLite backend the vectors live in its embeddings table
+    storage=storage if storage.backend == "sqlite" else None,
+    index=create_index(
+        VECTOR_INDEX,
+        VECTOR_STORE_FILE,
+        nlist=VECTOR_INDEX_NLIST,
+        nprobe=VECTOR_INDEX_NPROBE,
+        min_vectors=VECTOR_INDEX_MIN_VECTORS,
+    ),
+)
+
+http_clients = AsyncHTTPClients(
+    max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+    max_keepalive=HTTP_MAX_KEEPALIVE,
+)
+
+embedding_client = EmbeddingClient(
+    QWEN_API_URL,
+    QWEN_API_KEY,
+    QWEN_EMBEDDING_MODEL,
+    batch_size=EMBEDDING_BATCH_SIZE,
+    max_concurrency=EMBEDDING_CONCURRENCY,
+    async_http=lambda: http_clients.get("embeddings"),
+)
+
+report_cache = ReportCache(REPORT_CACHE_DIR, max_bytes=int(REPORT_CACHE_MAX_MB * 1024 * 1024))
+github_http_cache = HTTPCache(GITHUB_HTTP_CACHE_DIR, max_bytes=int(GITHUB_HTTP_CACHE_MAX_MB * 1024 * 1024))
+# All configured GitHub tokens, picked by remaining rate-limit budget (shared logic with the pipeline client)
+github_tokens = TokenPool(load_github_tokens(config))
+mining_queue = MiningQueue(MINING_QUEUE_DB, run_pipeline_for_user, workers=MINING_WORKERS, max_pending=MINING_QUEUE_MAX)
+repo_summary_cache = ReportCache(REPO_SUMMARY_CACHE_DIR, max_bytes=int(REPO_SUMMARY_CACHE_MAX_MB * 1024 * 1024))
+
+query_embedding_cache = QueryEmbeddingCache(
+    embedding_client,
+    max_size=QUERY_CACHE_SIZE,
+    ttl=QUERY_CACHE_TTL,
+    persist_file=QUERY_CACHE_FILE,
+)
 
 def generate_qwen_embedding(text: str):
     """Generate embedding using Qwen/DeepSeek API"""
-    if not QWEN_API_KEY:
-        print("Warning: QWEN_API_KEY not found")
-        return []
-    
-    # Normalize URL
-    api_url = QWEN_API_URL.rstrip("/")
-    if not api_url.endswith("/embeddings"):
-         if "v1" not in api_url:
-             api_url = f"{api_url}/v1/embeddings"
-         else:
-             api_url = f"{api_url}/embeddings"
+    return embedding_client.embed(text)
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {QWEN_API_KEY}"
-    }
-    
-    payload = {
-        "model": QWEN_EMBEDDING_MODEL,
-        "input": text
-    }
-    
+@app.on_event("shutdown")
+def save_query_embedding_cache():
+    query_embedding_cache.save()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await http_clients.aclose()
+
+def run_embedding_indexer(users=None):
+    """Embed users that are missing from the vector store or whose search text changed."""
+    if not QWEN_API_KEY:
+        return
+    if users is None:
+        users = load_users_list()
     try:
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        if "data" in data and len(data["data"]) > 0:
-            return data["data"][0]["embedding"]
-        return []
+        embedded, up_to_date, failed = index_users(vector_store, embedding_client, users, storage=storage)
+        if embedded or failed:
+            print(f"Embedding indexer: {embedded} embedded, {up_to_date} up to date, {failed} failed.")
     except Exception as e:
-        print(f"Embedding generation failed: {e}")
-        return []
+        print(f"Embedding indexer error: {e}")
 
-def get_user_search_text(username: str):
-    """Aggregate user data for search"""
-    text_parts = []
-    
-    # 1. Diversity Data (Languages & Topics)
-    diversity_path = os.path.join(RAW_USERS_DIR, username, f"{username}_diversity.json")
-    if os.path.exists(diversity_path):
-        try:
-            div_data = load_json(diversity_path)
-            raw = div_data.get("raw_metrics", {})
-            langs = raw.get("distinct_languages", [])
-            topics = raw.get("distinct_topics", [])
-            if langs:
-                text_parts.append(f"Languages: {', '.join(langs)}")
-            if topics:
-                text_parts.append(f"Topics: {', '.join(topics)}")
-        except Exception as e:
-            print(f"Error reading diversity for {username}: {e}")
+def _embedding_indexer_loop():
+    while True:
+        run_embedding_indexer()
+        time.sleep(EMBEDDING_INDEXER_INTERVAL)
 
-    # 2. Tech Stack (Repo descriptions & READMEs)
-    tech_stack_path = os.path.join(RAW_USERS_DIR, username, "tech_stack.json")
-    if os.path.exists(tech_stack_path):
-        try:
-            stack_data = load_json(tech_stack_path)
-            if isinstance(stack_data, list):
-                for repo in stack_data:
-                    name = repo.get("name", "")
-                    desc = repo.get("description", "")
-                    if name:
-                        text_parts.append(f"Project: {name}")
-                    if desc:
-                        text_parts.append(f"Description: {desc}")
-                    
-                    files = repo.get("files", {})
-                    readme = files.get("README.md", "")
-                    if readme:
-                        # Truncate readme to avoid token limits (approx 500 chars)
-                        text_parts.append(f"Readme: {readme[:500]}")
-        except Exception as e:
-            print(f"Error reading tech stack for {username}: {e}")
-            
-    return "\n".join(text_parts)
+@app.on_event("startup")
+def start_mining_queue():
+    mining_queue.start()
+
+@app.on_event("shutdown")
+def stop_mining_queue():
+    mining_queue.stop()
 
+@app.on_event("startup")
+def start_embedding_indexer():
+    if EMBEDDING_INDEXER_INTERVAL > 0:
+        threading.Thread(target=_embedding_indexer_loop, name="embedding-indexer", daemon=True).start()
 
 
 class RepoAnalysisRequest(BaseModel):
     repo_url: str
 
 
+GITHUB_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+# GitHub logins: letters, digits and hyphens, starting with a letter or digit, at most 39 characters
+GITHUB_LOGIN_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9-]{0,38}$")
+
+
+def validate_username(username: str):
+    """Reject anything that is not a GitHub login; usernames become storage paths and cache keys."""
+    if not GITHUB_LOGIN_RE.match(username or ""):
+        raise HTTPException(status_code=400, detail="Invalid GitHub username")
+
+
 def _parse_github_repo_url(repo_url: str):
     match = re.search(r"github\.com/([^/]+)/([^/#?]+)", repo_url or "")
     if not match:
@@ -228,6 +230,10 @@ def _parse_github_repo_url(repo_url: str):
     owner, repo = match.groups()
     if repo.endswith(".git"):
         repo = repo[:-4]
+    # The names end up in API URLs and cache keys; reject anything that could be a path segment like ".."
+    for part in (owner, repo):
+        if not GITHUB_NAME_RE.match(part) or part in (".", ".."):
+            raise HTTPException(status_code=400, detail="Invalid GitHub URL")
     return owner, repo
 
 
@@ -241,27 +247,60 @@ def _normalize_deepseek_api_url(raw_url: str):
     return f"{url}/chat/completions"
 
 
-def fetch_github_repo_content(repo_url: str):
+async def github_api_get(url: str, headers: dict):
+    """GET from the GitHub API with the token that has the most budget left; rate-limited or rejected tokens are skipped."""
+    client = http_clients.get("github")
+    resp = None
+    for _ in range(len(github_tokens.tokens) + 1):
+        token, wait = github_tokens.acquire("core")
+        if token is None:
+            raise HTTPException(status_code=503, detail=f"GitHub rate limit exhausted, retry in {wait:.0f}s")
+        request_headers = dict(headers)
+        if token:
+            request_headers["Authorization"] = f"token {token}"
+        resp = await client.get(url, headers=request_headers)
+        if resp.status_code == 401 and token:
+            github_tokens.discard(token)
+            continue
+        if not github_tokens.update(token, "core", resp):
+            break
+    return resp
+
+
+async def github_get_cached(url: str, headers: dict):
+    """GET through the ETag cache; returns (status, body text). A 304 replays the stored body."""
+    accept = headers.get("Accept", "")
+    entry = await asyncio.to_thread(github_http_cache.lookup, url, accept)
+    resp = await github_api_get(url, {**headers, **HTTPCache.conditional_headers(entry)})
+    if resp.status_code == 304 and entry:
+        return entry["status"], entry["body"]
+    if resp.status_code == 200:
+        await asyncio.to_thread(github_http_cache.store, url, accept, resp.status_code, resp.headers, resp.text)
+    return resp.status_code, resp.text
+
+
+async def fetch_github_repo_content(repo_url: str):
     owner, repo = _parse_github_repo_url(repo_url)
 
     headers = {"Accept": "application/vnd.github+json"}
-    if GITHUB_TOKEN:
-        headers["Authorization"] = f"token {GITHUB_TOKEN}"
 
     repo_api_url = f"https://api.github.com/repos/{owner}/{repo}"
-    repo_resp = requests.get(repo_api_url, headers=headers, timeout=15)
-    if repo_resp.status_code != 200:
-        raise HTTPException(status_code=repo_resp.status_code, detail=f"Repository fetch failed: {repo_resp.text}")
-    repo_data = repo_resp.json()
-
-    description = repo_data.get("description") or ""
-    topics = repo_data.get("topics") or []
-
     readme_url = f"https://api.github.com/repos/{owner}/{repo}/readme"
     readme_headers = dict(headers)
     readme_headers["Accept"] = "application/vnd.github.raw"
-    readme_resp = requests.get(readme_url, headers=readme_headers, timeout=20)
-    readme_content = readme_resp.text if readme_resp.status_code == 200 else ""
+
+    # Metadata and README are independent; fetch them concurrently
+    (repo_status, repo_body), (readme_status, readme_body) = await asyncio.gather(
+        github_get_cached(repo_api_url, headers),
+        github_get_cached(readme_url, readme_headers),
+    )
+    if repo_status != 200:
+        raise HTTPException(status_code=repo_status, detail=f"Repository fetch failed: {repo_body}")
+    repo_data = json.loads(repo_body)
+
+    description = repo_data.get("description") or ""
+    topics = repo_data.get("topics") or []
+    readme_content = readme_body if readme_status == 200 else ""
 
     return {
         "name": f"{owner}/{repo}",
@@ -272,7 +311,7 @@ def fetch_github_repo_content(repo_url: str):
     }
 
 
-def stream_deepseek_repo_summary(repo_data: dict, api_url: str, api_key: str, model: str):
+async def stream_deepseek_repo_summary(repo_data: dict, api_url: str, api_key: str, model: str, on_complete=None):
     if not api_key:
         yield "DeepSeek API Key 未配置，无法进行仓库分析。".encode("utf-8")
         return
@@ -306,49 +345,62 @@ def stream_deepseek_repo_summary(repo_data: dict, api_url: str, api_key: str, mo
     }
 
     try:
-        resp = requests.post(api_url, json=payload, headers=headers, stream=True, timeout=120)
-        if resp.status_code == 401:
-            yield "DeepSeek 鉴权失败(401)。请检查 config.json 中的 deepseek_api_key 是否正确、是否有权限使用该模型。".encode("utf-8")
-            return
-        if resp.status_code == 404:
-            yield f"DeepSeek 接口地址不存在(404)：{api_url}。请检查 deepseek_api_url 配置。".encode("utf-8")
-            return
-        resp.raise_for_status()
-
-        for raw_line in resp.iter_lines(decode_unicode=True):
-            if not raw_line:
-                continue
-            line = raw_line.strip()
-            if line.startswith("data:"):
-                line = line[len("data:") :].strip()
-            if line == "[DONE]":
-                break
-            try:
-                data = json.loads(line)
-            except Exception:
-                continue
-            try:
-                delta = data.get("choices", [{}])[0].get("delta", {}).get("content")
-                if delta:
-                    yield delta.encode("utf-8")
-            except Exception:
-                continue
+        async with http_clients.get("llm").stream("POST", api_url, json=payload, headers=headers) as resp:
+            if resp.status_code == 401:
+                yield "DeepSeek 鉴权失败(401)。请检查 config.json 中的 deepseek_api_key 是否正确、是否有权限使用该模型。".encode("utf-8")
+                return
+            if resp.status_code == 404:
+                yield f"DeepSeek 接口地址不存在(404)：{api_url}。请检查 deepseek_api_url 配置。".encode("utf-8")
+                return
+            resp.raise_for_status()
+
+            parts = []
+            async for raw_line in resp.aiter_lines():
+                if not raw_line:
+                    continue
+                line = raw_line.strip()
+                if line.startswith("data:"):
+                    line = line[len("data:") :].strip()
+                if line == "[DONE]":
+                    break
+                try:
+                    data = json.loads(line)
+                except Exception:
+                    continue
+                try:
+                    delta = data.get("choices", [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta.encode("utf-8")
+                except Exception:
+                    continue
     except Exception as e:
         yield f"\n\n[分析失败] DeepSeek 连接异常：{str(e)}".encode("utf-8")
         return
 
-# Load data
+    # Only complete, successful summaries reach the callback (and the cache)
+    if on_complete and parts:
+        await asyncio.to_thread(on_complete, "".join(parts))
+
+
+async def replay_text_stream(text: str, chunk_size: int = 32):
+    """Stream a cached summary in small pieces, like a live generation."""
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i + chunk_size].encode("utf-8")
+        await asyncio.sleep(0)
+
+# Load data (the JSON backend keeps parsed copies in memory and reloads them only when the file changes)
 def load_radar_scores():
-    if os.path.exists(RADAR_FILE):
-        with open(RADAR_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return storage.load_radar_scores()
 
 def load_macro_data():
-    if os.path.exists(MACRO_DATA_FILE):
-        with open(MACRO_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return storage.load_macro_data()
+
+def get_user_radar(username: str):
+    return storage.get_radar(username)
+
+def get_user_macro(username: str):
+    return storage.get_macro(username)
 
 def calculate_recent_sum(data_dict):
     """
@@ -392,29 +444,16 @@ def extract_monthly_series(data_dict, max_points=48):
     return labels, values
 
 def load_users_list():
-    if os.path.exists(USERS_LIST_FILE):
-        with open(USERS_LIST_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+    return storage.load_users()
 
 def ensure_user_dir(username: str):
-    user_dir = os.path.join(RAW_USERS_DIR, username)
-    os.makedirs(user_dir, exist_ok=True)
-    return user_dir
+    return storage.user_dir(username, create=True)
 
 def load_cached_github_profile(username: str):
-    path = os.path.join(RAW_USERS_DIR, username, "github_profile.json")
-    if not os.path.exists(path):
-        return None
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return None
+    return storage.load_user_document(username, "github_profile")
 
-def cache_github_profile(username: str, data: dict):
+async def cache_github_profile(username: str, data: dict):
     user_dir = ensure_user_dir(username)
-    profile_path = os.path.join(user_dir, "github_profile.json")
     cached = {
         "login": data.get("login"),
         "name": data.get("name"),
@@ -426,34 +465,30 @@ def cache_github_profile(username: str, data: dict):
     avatar_file = None
     if avatar_url:
         try:
-            r = requests.get(avatar_url, stream=True, timeout=20)
-            if r.status_code == 200:
-                content_type = (r.headers.get("content-type") or "").split(";")[0].strip().lower()
-                ext = ".jpg"
-                if content_type == "image/png":
-                    ext = ".png"
-                elif content_type in ("image/jpeg", "image/jpg"):
+            async with http_clients.get("avatars").stream("GET", avatar_url) as r:
+                if r.status_code == 200:
+                    content_type = (r.headers.get("content-type") or "").split(";")[0].strip().lower()
                     ext = ".jpg"
-                elif content_type == "image/gif":
-                    ext = ".gif"
-                avatar_file = f"github_avatar{ext}"
-                avatar_path = os.path.join(user_dir, avatar_file)
-                with open(avatar_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=1024 * 64):
-                        if chunk:
-                            f.write(chunk)
+                    if content_type == "image/png":
+                        ext = ".png"
+                    elif content_type in ("image/jpeg", "image/jpg"):
+                        ext = ".jpg"
+                    elif content_type == "image/gif":
+                        ext = ".gif"
+                    avatar_file = f"github_avatar{ext}"
+                    avatar_path = os.path.join(user_dir, avatar_file)
+                    with open(avatar_path, "wb") as f:
+                        async for chunk in r.aiter_bytes(chunk_size=1024 * 64):
+                            if chunk:
+                                f.write(chunk)
         except:
             avatar_file = None
     if avatar_file:
         cached["avatar_file"] = avatar_file
-    with open(profile_path, "w", encoding="utf-8") as f:
-        json.dump(cached, f, ensure_ascii=False, indent=2)
+    storage.save_user_document(username, "github_profile", cached)
 
 def load_json(path):
-    if os.path.exists(path):
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return load_json_cached(path, dict)
 
 def load_developer_vectors():
     """Load developer vectors from file"""
@@ -554,11 +589,9 @@ def search_developers(query_vector, vectors, limit=10):
 
 def generate_payload(username):
     # 1. Load Data
-    github_profile = load_json(os.path.join(RAW_USERS_DIR, username, "github_profile.json"))
-    radar_scores = load_json(RADAR_FILE)
-    macro_data = load_json(MACRO_DATA_FILE)
-    tech_stack = load_json(os.path.join(RAW_USERS_DIR, username, "tech_stack.json"))
-    diversity = load_json(os.path.join(RAW_USERS_DIR, username, f"{username}_diversity.json"))
+    github_profile = storage.load_user_document(username, "github_profile", {})
+    tech_stack = storage.load_user_document(username, "tech_stack", {})
+    diversity = storage.load_dimension(username, "diversity") or {}
 
     # --- Agent A: Six_Dimension ---
     # Github Profile
@@ -568,10 +601,10 @@ def generate_payload(username):
     }
     
     # Radar Scores
-    user_radar = radar_scores.get(username, [])
+    user_radar = get_user_radar(username) or []
 
     # OpenRank (Monthly)
-    user_macro = macro_data.get(username, {}).get("openrank", {})
+    user_macro = (get_user_macro(username) or {}).get("openrank", {})
     # Filter for YYYY-MM
     month_key_re = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
     monthly_openrank = {k: v for k, v in user_macro.items() if month_key_re.match(k)}
@@ -624,12 +657,24 @@ def generate_payload(username):
 
 @app.post("/api/analyze-repo")
 async def analyze_repo(request: RepoAnalysisRequest):
-    repo_data = fetch_github_repo_content(request.repo_url)
+    repo_data = await fetch_github_repo_content(request.repo_url)
     runtime_config = load_config()
     api_url = runtime_config.get("deepseek_api_url") or DEEPSEEK_API_URL
     api_key = runtime_config.get("deepseek_api_key") or DEEPSEEK_API_KEY
     model = runtime_config.get("deepseek_model") or DEEPSEEK_MODEL
-    return StreamingResponse(stream_deepseek_repo_summary(repo_data, api_url, api_key, model), media_type="text/plain; charset=utf-8")
+
+    readme_hash = hashlib.sha256(repo_data.get("readme", "").encode("utf-8")).hexdigest()
+    cache_key = hashlib.sha256(f"{repo_data['name']}\0{readme_hash}\0{model}".encode("utf-8")).hexdigest()
+    cached_summary = await asyncio.to_thread(repo_summary_cache.get, repo_data["name"], cache_key)
+    if cached_summary:
+        return StreamingResponse(replay_text_stream(cached_summary), media_type="text/plain; charset=utf-8",
+                                 headers={"X-Summary-Cache": "hit"})
+
+    def store_summary(text):
+        repo_summary_cache.put(repo_data["name"], cache_key, text)
+
+    return StreamingResponse(stream_deepseek_repo_summary(repo_data, api_url, api_key, model, on_complete=store_summary),
+                             media_type="text/plain; charset=utf-8", headers={"X-Summary-Cache": "miss"})
 
 @app.get("/")
 async def get_index():
@@ -643,12 +688,92 @@ async def get_search():
 async def get_profile(username: str):
     return FileResponse(PROFILE_HTML_FILE)
 
+def _sse_event(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _maxkb_chunk_fields(data: dict):
+    """(agent node id or None, content delta) from one MaxKB stream chunk."""
+    choice = (data.get("choices") or [{}])[0] or {}
+    delta = choice.get("delta") or {}
+    content = delta.get("content")
+    if content is None:
+        content = data.get("content")
+    node_id = None
+    for source in (data, choice, delta):
+        node_id = source.get("real_node_id") or source.get("node_id") or source.get("runtime_node_id")
+        if node_id:
+            break
+    return node_id, content or ""
+
+
+async def stream_maxkb_analysis(payload: dict, headers: dict, on_report=None):
+    """
+    Relay a MaxKB multi-agent run as SSE.
+
+    `chunk` events carry `{"agent": index, "node_id": ..., "content": delta}`,
+    with agents indexed in order of first appearance. A final `done` event
+    carries the assembled report in the non-streaming shape
+    (`choices[0].answer_list`) and is passed to `on_report`; failures end the
+    stream with an `error` event.
+    """
+    payload = dict(payload, stream=True)
+    agents = []  # [{"node_id": ..., "content": ...}] in order of first appearance
+    agent_index = {}
+    try:
+        async with http_clients.get("maxkb").stream("POST", MAXKB_API_URL, json=payload, headers=headers) as resp:
+            if resp.status_code != 200:
+                body = (await resp.aread()).decode("utf-8", errors="replace")
+                yield _sse_event("error", {"status": resp.status_code, "detail": f"Error from MaxKB: {body}"})
+                return
+            async for raw_line in resp.aiter_lines():
+                line = raw_line.strip()
+                if not line.startswith("data:"):
+                    continue
+                line = line[len("data:"):].strip()
+                if line == "[DONE]":
+                    break
+                try:
+                    data = json.loads(line)
+                except Exception:
+                    continue
+                node_id, content = _maxkb_chunk_fields(data)
+                if not content:
+                    continue
+                if node_id not in agent_index:
+                    agent_index[node_id] = len(agents)
+                    agents.append({"node_id": node_id, "content": ""})
+                idx = agent_index[node_id]
+                agents[idx]["content"] += content
+                yield _sse_event("chunk", {"agent": idx, "node_id": node_id, "content": content})
+    except Exception as e:
+        yield _sse_event("error", {"status": 500, "detail": f"Internal Server Error: {str(e)}"})
+        return
+
+    report = {"choices": [{"index": 0, "answer_list": agents}]}
+    if on_report and agents:
+        await asyncio.to_thread(on_report, report)
+    yield _sse_event("done", report)
+
+
+async def replay_report_stream(report: dict):
+    """Replay a cached report with the same events as `stream_maxkb_analysis`."""
+    choice = (report.get("choices") or [{}])[0] or {}
+    answers = choice.get("answer_list")
+    if answers is None and choice.get("message"):
+        answers = [{"content": choice["message"].get("content", "")}]
+    for idx, answer in enumerate(answers or []):
+        yield _sse_event("chunk", {"agent": idx, "node_id": answer.get("node_id"), "content": answer.get("content") or ""})
+    yield _sse_event("done", report)
+
+
 @app.get("/api/analyze/{username}")
-def analyze_user(username: str):
+async def analyze_user(username: str, response: Response, stream: bool = False, refresh: bool = False):
+    validate_username(username)
     print(f"--- Analyzing User: {username} ---")
 
     # 1. Generate New Payload Structure
-    inputs_data = generate_payload(username)
+    inputs_data = await asyncio.to_thread(generate_payload, username)
     
     # 2. Prepare MaxKB Payload (Official Form Data Format)
     message = "请根据传入的表单数据生成深度分析报告。"
@@ -665,25 +790,51 @@ def analyze_user(username: str):
         "Content-Type": "application/json"
     }
 
-    # 3. Request from MaxKB (Non-streaming for structured output)
+    # 3. Cached report for this exact payload + agent config (?refresh=1 bypasses it)
+    # The API key selects the MaxKB application (and its agents); only its hash goes into the key
+    agent_id = hashlib.sha256(MAXKB_API_KEY.encode("utf-8")).hexdigest()
+    cache_key = report_key(inputs_data, (MAXKB_API_URL, agent_id, message))
+    cached_report = None if refresh else await asyncio.to_thread(report_cache.get, username, cache_key)
+    cache_status = "hit" if cached_report is not None else "miss"
+
+    def store_report(report):
+        report_cache.put(username, cache_key, report)
+
+    # 4a. Streaming mode: relay agent output as it is generated
+    if stream:
+        events = replay_report_stream(cached_report) if cached_report is not None \
+            else stream_maxkb_analysis(payload, headers, on_report=store_report)
+        return StreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Report-Cache": cache_status},
+        )
+
+    response.headers["X-Report-Cache"] = cache_status
+    if cached_report is not None:
+        return cached_report
+
+    # 4b. Request from MaxKB (Non-streaming for structured output)
     try:
         # Change stream=True to stream=False to get the full JSON with multiple agent outputs
         payload["stream"] = False
-        r = requests.post(MAXKB_API_URL, json=payload, headers=headers, timeout=(10, 300))
+        r = await http_clients.get("maxkb").post(MAXKB_API_URL, json=payload, headers=headers)
         
         if r.status_code != 200:
             raise HTTPException(status_code=r.status_code, detail=f"Error from MaxKB: {r.text}")
             
-        return r.json()
+        report = r.json()
+        # MaxKB reports some failures as HTTP 200 with an error code in the body
+        if isinstance(report, dict) and report.get("code", 200) == 200:
+            await asyncio.to_thread(store_report, report)
+        return report
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @app.get("/api/radar/{username}")
-def get_radar_score(username: str, background_tasks: BackgroundTasks):
-    scores = load_radar_scores()
-    macro_data = load_macro_data()
-    
+def get_radar_score(username: str):
+    validate_username(username)
     # Base response structure
     response = {
         "username": username,
@@ -691,6 +842,7 @@ def get_radar_score(username: str, background_tasks: BackgroundTasks):
         "found": False,
         "mining": False,
         "mining_status": "none",
+        "mining_progress": [],
         "activity_sum": 0.0,
         "openrank_sum": 0.0,
         "openrank_labels": [],
@@ -699,40 +851,47 @@ def get_radar_score(username: str, background_tasks: BackgroundTasks):
     }
 
     # Check mining status first
-    if username in mining_status:
-        status = mining_status[username]
+    job = mining_queue.status(username)
+    if job:
+        status = job["status"]
         response["mining_status"] = status
-        if status == "processing":
+        response["mining_progress"] = job["steps"]
+        if status in ("queued", "running"):
             response["mining"] = True
-            response["message"] = "Mining in progress..."
+            response["message"] = "Mining in progress..." if status == "running" else f"Queued for mining (position {job['position']})."
             return response
         elif status == "failed":
             response["message"] = "Mining failed."
             # Don't return yet, maybe we have old data? Or just failed state.
         elif status == "done":
-            # If done, reload scores to get fresh data
-            scores = load_radar_scores()
-            macro_data = load_macro_data()
+            # Fresh data is picked up automatically: the caches reload when the files change
             # Clean up status so we don't return "done" forever, or keep it?
             # Let's keep it "done" until next restart or clear.
             # But "found" will become True below if data is there.
+            pass
 
-    if username in scores:
-        response["radar"] = scores[username]
+    user_radar = get_user_radar(username)
+    if user_radar is not None:
+        response["radar"] = user_radar
         response["found"] = True
         response["message"] = "Success"
     else:
-        # Not found and not mining -> Start Mining
-        if response["mining_status"] == "none":
-             print(f"User {username} not found. Triggering auto-mining.")
-             background_tasks.add_task(run_pipeline_for_user, username)
-             response["mining"] = True
-             response["mining_status"] = "processing"
-             response["message"] = "User not found locally. Auto-mining started."
+        # Not found and not mining -> Start Mining (failed users again once the retry window has passed)
+        retry_failed = job and job["status"] == "failed" and time.time() - (job["finished_at"] or 0) > MINING_RETRY_AFTER
+        if response["mining_status"] == "none" or retry_failed:
+            print(f"User {username} not found. Triggering auto-mining.")
+            job = mining_queue.submit(username, priority=PRIORITY_INTERACTIVE)
+            if job is None:
+                response["message"] = "Mining queue is full. Please try again later."
+                return response
+            response["mining"] = True
+            response["mining_status"] = job["status"]
+            response["mining_progress"] = job["steps"]
+            response["message"] = "User not found locally. Auto-mining started."
     
     # Add Macro Data if available
-    if username in macro_data:
-        user_macro = macro_data[username]
+    user_macro = get_user_macro(username)
+    if user_macro is not None:
         response["activity_sum"] = calculate_recent_sum(user_macro.get("activity", {}))
         response["openrank_sum"] = calculate_recent_sum(user_macro.get("openrank", {}))
         labels, series = extract_monthly_series(user_macro.get("openrank", {}), max_points=48)
@@ -741,34 +900,58 @@ def get_radar_score(username: str, background_tasks: BackgroundTasks):
     
     return response
 
+@app.get("/api/mining/{username}")
+def get_mining_status(username: str):
+    validate_username(username)
+    job = mining_queue.status(username)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No mining job for this user")
+    return job
+
+@app.post("/api/mining/{username}")
+def submit_mining_job(username: str, priority: str = "batch"):
+    validate_username(username)
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {sorted(PRIORITIES)}")
+    job = mining_queue.submit(username, priority=PRIORITIES[priority])
+    if job is None:
+        raise HTTPException(status_code=503, detail="Mining queue is full")
+    return job
+
 @app.get("/api/users")
 def get_users():
     return load_users_list()
 
-@app.get("/api/github/{username}")
-def get_github_user(username: str, background_tasks: BackgroundTasks):
+def cached_github_user(username: str):
+    """The stored profile in the API response shape, or None (file reads; runs in a worker thread)."""
     cached = load_cached_github_profile(username)
+    if not cached:
+        return None
+    avatar_file = cached.get("avatar_file")
+    avatar_url = None
+    if avatar_file:
+        avatar_path = os.path.join(storage.user_dir(username), avatar_file)
+        if os.path.exists(avatar_path):
+            avatar_url = f"/api/avatar/{username}"
+    return {
+        "login": cached.get("login"),
+        "name": cached.get("name"),
+        "avatar_url": avatar_url or cached.get("avatar_remote_url"),
+        "html_url": cached.get("html_url")
+    }
+
+@app.get("/api/github/{username}")
+async def get_github_user(username: str, background_tasks: BackgroundTasks):
+    validate_username(username)
+    cached = await asyncio.to_thread(cached_github_user, username)
     if cached:
-        avatar_file = cached.get("avatar_file")
-        avatar_url = None
-        if avatar_file:
-            avatar_path = os.path.join(RAW_USERS_DIR, username, avatar_file)
-            if os.path.exists(avatar_path):
-                avatar_url = f"/api/avatar/{username}"
-        return {
-            "login": cached.get("login"),
-            "name": cached.get("name"),
-            "avatar_url": avatar_url or cached.get("avatar_remote_url"),
-            "html_url": cached.get("html_url")
-        }
+        return cached
 
     url = f"https://api.github.com/users/{username}"
-    headers = {"Accept": "application/vnd.github+json"}
-    if GITHUB_TOKEN:
-        headers["Authorization"] = f"token {GITHUB_TOKEN}"
-    r = requests.get(url, headers=headers, timeout=15)
-    if r.status_code == 401 and GITHUB_TOKEN:
-        r = requests.get(url, headers={"Accept": "application/vnd.github+json"}, timeout=15)
+    try:
+        r = await github_api_get(url, {"Accept": "application/vnd.github+json"})
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"GitHub request failed: {str(e)}")
     if r.status_code == 404:
         raise HTTPException(status_code=404, detail="GitHub user not found")
     if r.status_code >= 400:
@@ -784,89 +967,54 @@ def get_github_user(username: str, background_tasks: BackgroundTasks):
 
 
 @app.get("/api/tech_stack/{username}")
-async def get_tech_stack(username: str):
-    path = os.path.join(RAW_USERS_DIR, username, "tech_stack.json")
-    if not os.path.exists(path):
-        # Return empty list for consistency
-        return []
+def get_tech_stack(username: str):
+    validate_username(username)
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        # Return empty list for consistency
+        return storage.load_user_document(username, "tech_stack", [])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/representative/{username}")
-async def get_representative_repos(username: str):
-    path = os.path.join(RAW_USERS_DIR, username, "representative_repos.json")
-    if not os.path.exists(path):
-        return []
+def get_representative_repos(username: str):
+    validate_username(username)
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return storage.load_user_document(username, "representative_repos", [])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/avatar/{username}")
 def get_cached_avatar(username: str):
+    validate_username(username)
     cached = load_cached_github_profile(username)
     if cached and cached.get("avatar_file"):
-        avatar_path = os.path.join(RAW_USERS_DIR, username, cached["avatar_file"])
+        avatar_path = os.path.join(storage.user_dir(username), cached["avatar_file"])
         if os.path.exists(avatar_path):
             return FileResponse(avatar_path)
     raise HTTPException(status_code=404, detail="Avatar not cached")
 
-@app.post("/api/search")
-def search_users(query: dict):
-    """Search users based on natural language query using Qwen embeddings"""
-    print(f"--- Searching Users: {query} ---")
-    
-    query_text = query.get("query", "")
-    limit = query.get("limit", 5)
-    
-    if not query_text:
-        return []
-
-    # 1. Generate Query Embedding
-    query_vector = generate_qwen_embedding(query_text)
-    if not query_vector:
-        # Fallback or error?
-        # If Qwen fails, we can't search.
-        print("Failed to generate query embedding")
-        return []
-
-    # 2. Use Vector Store
-    users_list = load_users_list()
-    
-    cache_updated = False
-    
-    # 3. Ensure all users have embeddings
-    # Only process users that have raw data locally
-    available_users = []
-    for user in users_list:
-        if os.path.exists(os.path.join(RAW_USERS_DIR, user)):
-             available_users.append(user)
-    
-    # Check if we need to generate new embeddings
-    for username in available_users:
-        if not vector_store.has(username):
-            print(f"Generating embedding for {username}...")
-            user_text = get_user_search_text(username)
-            if user_text:
-                vec = generate_qwen_embedding(user_text)
-                if vec:
-                    vector_store.add(username, vec)
-                    cache_updated = True
-            else:
-                print(f"No search text for {username}")
-    
-    if cache_updated:
-        vector_store.save()
-
-    # 4. Perform Search via Vector Store
-    top_results = vector_store.search(query_vector, limit)
-    
-    # 5. Format Response (skip step 6 label since logic is same)
+def parse_nprobe(value):
+    """`nprobe` from a search request as an int in [1, number of clusters]; 400 if it is not a number."""
+    if value is None:
+        value = VECTOR_INDEX_NPROBE
+    if isinstance(value, bool):
+        raise HTTPException(status_code=400, detail="nprobe must be an integer")
+    try:
+        nprobe = int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="nprobe must be an integer")
+    nlist = vector_store.index.nlist if vector_store.index is not None else 0
+    return max(1, min(nprobe, nlist) if nlist else nprobe)
+
+def search_vectors(query_vector, limit, nprobe=None):
+    """Vector search that first picks up vectors saved by another process (e.g. the CLI indexer)."""
+    # One stat (or one query on SQLite) when nothing changed
+    vector_store.reload_if_changed()
+    return vector_store.search(query_vector, limit, nprobe=nprobe)
+
+def format_search_results(top_results):
+    """Profile and top repos of each hit (storage reads; runs in a worker thread)."""
     formatted_results = []
     for username, score in top_results:
         try:
@@ -882,10 +1030,9 @@ def search_users(query: dict):
             
             # Fetch representative repos
             repos = []
-            repo_path = os.path.join(RAW_USERS_DIR, username, "representative_repos.json")
-            if os.path.exists(repo_path):
+            if storage.has_user_document(username, "representative_repos"):
                 try:
-                    all_repos = load_json(repo_path)
+                    all_repos = storage.load_user_document(username, "representative_repos", [])
                     # Take top 3, just name and description and primary language
                     for r in all_repos[:3]:
                         langs = r.get("languages", {})
@@ -911,6 +1058,36 @@ def search_users(query: dict):
         
     return formatted_results
 
+@app.post("/api/search")
+async def search_users(query: dict):
+    """Search users based on natural language query using Qwen embeddings"""
+    print(f"--- Searching Users: {query} ---")
+    
+    query_text = query.get("query", "")
+    try:
+        limit = int(query.get("limit", 5))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="limit must be an integer")
+    nprobe = parse_nprobe(query.get("nprobe"))
+    
+    if not query_text:
+        return []
+
+    # 1. Generate Query Embedding (cached; concurrent identical queries share one API call)
+    query_vector = await query_embedding_cache.aget(query_text)
+    if not query_vector:
+        # Fallback or error?
+        # If Qwen fails, we can't search.
+        print("Failed to generate query embedding")
+        return []
+
+    # 2. Search the vector store; user embeddings are maintained by the background indexer.
+    # The matrix product and the store lock would block the event loop, so both steps run in a thread.
+    top_results = await asyncio.to_thread(search_vectors, query_vector, limit, nprobe)
+
+    # 3. Format Response
+    return await asyncio.to_thread(format_search_results, top_results)
+
 if __name__ == "__main__":
     print("Starting OpenScout Server at http://localhost:8001")
     uvicorn.run(app, host="0.0.0.0", port=8001)
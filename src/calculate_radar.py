@@ -1,29 +1,30 @@
-import json
 import os
+import json
 import math
-import statistics
+import time
 
-# Configuration
-SRC_DIR = os.path.dirname(os.path.abspath(__file__))
-ROOT_DIR = os.path.dirname(SRC_DIR)
-DATA_DIR = os.path.join(ROOT_DIR, "data")
+import numpy as np
 
-USERS_LIST_FILE = os.path.join(DATA_DIR, "users_list.json")
-USER_DATA_DIR = os.path.join(DATA_DIR, "raw_users")
-OUTPUT_FILE = os.path.join(DATA_DIR, "radar_scores.json")
+from storage import get_storage, CONFIG_FILE
 
-def load_json(path):
-    try:
-        with open(path, 'r', encoding='utf-8') as f:
+DIMENSIONS_ORDER = ["influence", "contribution", "maintainership", "engagement", "diversity", "code_capability"]
+# Cached users x dimensions raw-score matrix (see raw_score_matrix)
+RAW_MATRIX_FILE = "radar_raw_matrix.npz"
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
-    except FileNotFoundError:
-        return None
-    except Exception as e:
-        print(f"Error loading {path}: {e}")
-        return None
+    return {}
+
+config = load_config()
+# Single-user runs score against the last full run's population statistics until the
+# population has changed by this fraction or the snapshot is this many seconds old
+RECALIBRATE_DRIFT = float(config.get("radar_recalibrate_drift", 0.05))
+RECALIBRATE_INTERVAL = float(config.get("radar_recalibrate_interval", 7 * 86400))
 
-def get_raw_metrics(username):
-    user_dir = os.path.join(USER_DATA_DIR, username)
+def get_raw_metrics(username, storage=None):
+    storage = storage or get_storage()
     
     # Initialize metrics with 0
     metrics = {
@@ -44,7 +45,7 @@ def get_raw_metrics(username):
     }
 
     # Load Influence
-    inf_data = load_json(os.path.join(user_dir, f"{username}_influence.json"))
+    inf_data = storage.load_dimension(username, "influence")
     if inf_data and "raw_metrics" in inf_data:
         rm = inf_data["raw_metrics"]
         metrics["stars"] = rm.get("total_stars", 0)
@@ -52,34 +53,34 @@ def get_raw_metrics(username):
         metrics["issues"] = rm.get("total_open_issues", 0)
 
     # Load Contribution
-    con_data = load_json(os.path.join(user_dir, f"{username}_contribution.json"))
+    con_data = storage.load_dimension(username, "contribution")
     if con_data and "raw_metrics" in con_data:
         rm = con_data["raw_metrics"]
         metrics["ext_prs"] = rm.get("accepted_external_prs", 0)
         metrics["created_issues"] = rm.get("created_issues", 0)
 
     # Load Maintainership
-    main_data = load_json(os.path.join(user_dir, f"{username}_maintainership.json"))
+    main_data = storage.load_dimension(username, "maintainership")
     if main_data and "raw_metrics" in main_data:
         rm = main_data["raw_metrics"]
         metrics["others_prs"] = rm.get("merged_external_pr_count_approx", 0)
 
     # Load Engagement
-    eng_data = load_json(os.path.join(user_dir, f"{username}_engagement.json"))
+    eng_data = storage.load_dimension(username, "engagement")
     if eng_data and "raw_metrics" in eng_data:
         rm = eng_data["raw_metrics"]
         metrics["issue_comments"] = rm.get("issue_comment_count", 0)
         metrics["review_comments"] = rm.get("pr_review_comment_count", 0)
 
     # Load Diversity
-    div_data = load_json(os.path.join(user_dir, f"{username}_diversity.json"))
+    div_data = storage.load_dimension(username, "diversity")
     if div_data and "raw_metrics" in div_data:
         rm = div_data["raw_metrics"]
         metrics["languages"] = rm.get("language_count", 0)
         metrics["topics"] = rm.get("topic_count", 0)
 
     # Load Code Capability
-    code_data = load_json(os.path.join(user_dir, f"{username}_code_capability.json"))
+    code_data = storage.load_dimension(username, "code_capability")
     if code_data and "raw_metrics" in code_data:
         rm = code_data["raw_metrics"]
         metrics["merged_prs_stars"] = rm.get("merged_prs_with_stars", [])
@@ -119,125 +120,200 @@ def calculate_raw_scores(metrics):
     
     return scores
 
-def normal_cdf(x, mu, sigma):
-    if sigma == 0:
-        return 0.5 # If no variance, everyone is average
-    z = (x - mu) / sigma
-    return 0.5 * (1 + math.erf(z / math.sqrt(2)))
+# Chebyshev coefficients for erfc (Numerical Recipes, 3rd ed., 6.2.2); matches math.erf to ~1e-16
+ERFC_COF = [-1.3026537197817094, 6.4196979235649026e-1, 1.9476473204185836e-2, -9.561514786808631e-3,
+            -9.46595344482036e-4, 3.66839497852761e-4, 4.2523324806907e-5, -2.0278578112534e-5,
+            -1.624290004647e-6, 1.303655835580e-6, 1.5626441722e-8, -8.5238095915e-8,
+            6.529054439e-9, 5.059343495e-9, -9.91364156e-10, -2.27365122e-10,
+            9.6467911e-11, 2.394038e-12, -6.886027e-12, 8.94487e-13,
+            3.13092e-13, -1.12708e-13, 3.81e-16, 7.106e-15,
+            -1.523e-15, -9.4e-17, 1.21e-16, -2.8e-17]
+# Rows scored per block; small blocks stay in CPU cache, which is several times faster than whole-array passes
+SCORE_BLOCK_ROWS = 16384
 
-def main():
-    import argparse
-    parser = argparse.ArgumentParser(add_help=False)
-    parser.add_argument('--refresh', action='store_true')
-    args, _ = parser.parse_known_args()
-    refresh = args.refresh or os.environ.get('REFRESH_DATA') in ('1', 'true', 'True')
+def erf(x):
+    """Element-wise erf of a float64 array (NumPy has none built in)."""
+    z = np.abs(x)
+    t = 2.0 / (2.0 + z)
+    ty = 4.0 * t - 2.0
+    d = np.zeros_like(z)
+    dd = np.zeros_like(z)
+    tmp = np.empty_like(z)
+    # Clenshaw recurrence, in place
+    for c in ERFC_COF[:0:-1]:
+        np.multiply(ty, d, out=tmp)
+        tmp -= dd
+        tmp += c
+        d, dd, tmp = tmp, d, dd
+    erfc = t * np.exp(-z * z + 0.5 * (ERFC_COF[0] + ty * d) - dd)
+    return np.where(x >= 0, 1.0 - erfc, erfc - 1.0)
+
+def compute_dimension_stats(log_matrix):
+    """Per-dimension {mu, sigma, n} of the ln(x + 1) columns, with each column's single largest value left out."""
+    n = log_matrix.shape[0]
+    if n == 0:
+        return {dim: {"mu": 0, "sigma": 1, "n": 0} for dim in DIMENSIONS_ORDER}
+    # Outlier handling: drop the max of every column (n > 1)
+    top = log_matrix.max(axis=0) if n > 1 else np.zeros(log_matrix.shape[1])
+    count = n - 1 if n > 1 else n
+    mu = (log_matrix.sum(axis=0) - top) / count
+    if count > 1:
+        sq_dev = ((log_matrix - mu) ** 2).sum(axis=0)
+        if n > 1:
+            sq_dev -= (top - mu) ** 2
+        sigma = np.sqrt(np.maximum(sq_dev, 0) / (count - 1))
+    else:
+        sigma = np.zeros(log_matrix.shape[1])
+    # Avoid zero sigma if all values are same
+    sigma[sigma == 0] = 1
 
+    dim_stats = {}
+    for i, dim in enumerate(DIMENSIONS_ORDER):
+        dim_stats[dim] = {"mu": float(mu[i]), "sigma": float(sigma[i]), "n": n}
+        print(f"Stats for {dim}: mu={mu[i]:.4f}, sigma={sigma[i]:.4f}")
+    return dim_stats
+
+def score_matrix(raw_matrix, dim_stats):
+    """Map a users x dimensions raw-score matrix to 50-100 radar scores (object array, 50 stays an int)."""
+    mu = np.array([dim_stats[dim]["mu"] for dim in DIMENSIONS_ORDER])
+    sigma = np.array([dim_stats[dim]["sigma"] for dim in DIMENSIONS_ORDER])
+    scores = np.empty(raw_matrix.shape, dtype=np.float64)
+    for start in range(0, raw_matrix.shape[0], SCORE_BLOCK_ROWS):
+        block = raw_matrix[start:start + SCORE_BLOCK_ROWS]
+        # Log transform -> Z-Score -> CDF -> 50-100 Mapping
+        z = (np.log1p(block) - mu) / sigma
+        cdf_prob = 0.5 * (1 + erf(z / math.sqrt(2)))
+        scores[start:start + SCORE_BLOCK_ROWS] = np.round(50 + cdf_prob * 50, 1)
+    scores = scores.astype(object)
+    # Zero handling: a flat 50 for dimensions without activity
+    scores[raw_matrix == 0] = 50
+    return scores
+
+def score_user(raw_scores, dim_stats):
+    """Map one user's raw dimension scores to the 50-100 radar scale."""
+    row = np.array([[raw_scores[dim] for dim in DIMENSIONS_ORDER]], dtype=np.float64)
+    return score_matrix(row, dim_stats)[0].tolist()
+
+def raw_score_matrix(users, storage, refresh=False):
+    """users x dimensions raw scores, reusing cached rows of users whose data did not change.
+
+    Rows live in `radar_raw_matrix.npz` next to the data, tagged with the
+    storage's per-user change stamp, so a recalibration only reads the
+    dimension files of users mined since the last run.
+    """
+    cache_file = os.path.join(storage.data_dir, RAW_MATRIX_FILE)
+    stamps = storage.dimension_stamps()
+    cached_rows, cached_stamps, built_at = {}, None, 0.0
+    if not refresh and os.path.exists(cache_file):
+        try:
+            with np.load(cache_file) as cache:
+                cached_rows = {u: i for i, u in enumerate(cache["users"].tolist())}
+                cached_raw, cached_stamps = cache["raw"], cache["stamps"]
+                built_at = float(cache["built_at"])
+        except Exception as e:
+            print(f"Ignoring unreadable {cache_file}: {e}")
+            cached_rows = {}
+
+    now = time.time()
+    raw = np.zeros((len(users), len(DIMENSIONS_ORDER)), dtype=np.float64)
+    row_stamps = np.zeros(len(users), dtype=np.float64)
+    recomputed = 0
+    for i, user in enumerate(users):
+        stamp = stamps.get(user)
+        if stamp is None:
+            continue # No data at all: all-zero raw scores
+        row_stamps[i] = stamp
+        j = cached_rows.get(user)
+        # A stamp as new as the cache itself may hide a write made right after it was built.
+        # SQLite stamps are whole seconds, so compare against the second the cache was built in.
+        if j is not None and cached_stamps[j] == stamp and stamp < math.floor(built_at):
+            raw[i] = cached_raw[j]
+            continue
+        raw_scores = calculate_raw_scores(get_raw_metrics(user, storage))
+        raw[i] = [raw_scores[dim] for dim in DIMENSIONS_ORDER]
+        recomputed += 1
+
+    print(f"Raw metrics: {len(users) - recomputed} cached, {recomputed} recomputed.")
+    if recomputed or len(cached_rows) != len(users):
+        tmp_path = f"{cache_file}.tmp.npz"
+        np.savez(tmp_path, users=np.array(users), raw=raw, stamps=row_stamps, built_at=now)
+        os.replace(tmp_path, cache_file)
+    return raw
+
+def calculate_radar_scores(refresh=False, storage=None):
+    """Pipeline stage: score every user against the population and save the radar scores."""
     print("Loading user list...")
-    users = load_json(USERS_LIST_FILE)
+    storage = storage or get_storage()
+    users = storage.load_users()
     if not users:
         print("Failed to load user list.")
-        return
+        return None
 
     print(f"Processing {len(users)} users...")
-    
-    # Load existing final output if any and not refreshing
-    existing_output = {}
-    if os.path.exists(OUTPUT_FILE) and not refresh:
-        try:
-            with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-                existing_output = json.load(f)
-        except:
-            existing_output = {}
-
-    # 1. Collect Raw Scores
-    user_raw_scores = {} # username -> {dim: score}
-    dimension_values = {
-        "influence": [],
-        "contribution": [],
-        "maintainership": [],
-        "engagement": [],
-        "diversity": [],
-        "code_capability": []
-    }
-    
-    # Compute for all users (ensures stats include full population)
-    users_to_compute = users
 
-    for user in users_to_compute:
-        metrics = get_raw_metrics(user)
-        raw_scores = calculate_raw_scores(metrics)
-        user_raw_scores[user] = raw_scores
-        for dim, val in raw_scores.items():
-            dimension_values[dim].append(val)
+    # 1. Collect Raw Scores (users x dimensions)
+    raw = raw_score_matrix(users, storage, refresh=refresh)
 
-    # 2. Calculate Stats (Mean, Std) for Log Values
-    dim_stats = {}
-    
-    for dim, values in dimension_values.items():
-        # Log transformation: ln(x + 1)
-        log_values = [math.log1p(v) for v in values]
-        
-        if not log_values:
-            dim_stats[dim] = {"mu": 0, "sigma": 1}
-            continue
-            
-        # Outlier handling: Remove max value for stat calculation if len > 1
-        calc_values = log_values[:]
-        if len(calc_values) > 1:
-            max_val = max(calc_values)
-            calc_values.remove(max_val)
-            
-        mu = statistics.mean(calc_values)
-        sigma = statistics.stdev(calc_values) if len(calc_values) > 1 else 0
-        
-        # Avoid zero sigma if all values are same
-        if sigma == 0:
-            sigma = 1 
-            
-        dim_stats[dim] = {"mu": mu, "sigma": sigma}
-        print(f"Stats for {dim}: mu={mu:.4f}, sigma={sigma:.4f}")
+    # 2. Calculate Stats (Mean, Std) for Log Values (computed for all users: stats include the full population)
+    dim_stats = compute_dimension_stats(np.log1p(raw))
 
     # 3. Calculate Final Scores
-    final_output = {}
-    
-    dimensions_order = ["influence", "contribution", "maintainership", "engagement", "diversity", "code_capability"]
-    
-    for user in users:
-        raw_scores = user_raw_scores[user]
-        user_final_scores = []
-        
-        for dim in dimensions_order:
-            raw_val = raw_scores[dim]
-            
-            # Zero handling
-            if raw_val == 0:
-                user_final_scores.append(50) # Tiny point for 0
-                continue
-                
-            # Log transform
-            log_val = math.log1p(raw_val)
-            
-            # Z-Score -> CDF -> 50-100 Mapping
-            stats = dim_stats[dim]
-            cdf_prob = normal_cdf(log_val, stats["mu"], stats["sigma"])
-            
-            # User request: Start at 50, then add based on performance
-            # Mapping 0-1 probability to 50-100 range
-            score = 50 + (cdf_prob * 50)
-            
-            # Round to 1 decimal
-            user_final_scores.append(round(score, 1))
-            
-        # Add 6th dimension (empty/zero)
-        # user_final_scores.append(0)
-        
-        final_output[user] = user_final_scores
-
-    # 4. Save Output
-    print(f"Saving results to {OUTPUT_FILE}...")
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_output, f, indent=2)
+    final_output = dict(zip(users, score_matrix(raw, dim_stats).tolist()))
+
+    # 4. Save Output, plus the population snapshot that incremental runs score against
+    print(f"Saving results ({storage.backend} storage)...")
+    previous = storage.load_radar_stats() or {}
+    with storage.transaction():
+        storage.save_radar_scores(final_output)
+        storage.save_radar_stats({
+            "version": previous.get("version", 0) + 1,
+            "computed_at": int(time.time()),
+            "population": len(users),
+            "dimensions": dim_stats,
+        })
     print("Done.")
+    return final_output
+
+def recalibration_reason(stats, population):
+    """Why the population snapshot can no longer be used, or None if it is still valid."""
+    if not stats or set(stats.get("dimensions", {})) != set(DIMENSIONS_ORDER):
+        return "no population snapshot"
+    if time.time() - stats.get("computed_at", 0) > RECALIBRATE_INTERVAL:
+        return "snapshot older than the recalibration interval"
+    base = max(1, stats.get("population", 0))
+    if abs(population - base) / base > RECALIBRATE_DRIFT:
+        return f"population drifted from {base} to {population} users"
+    return None
+
+def update_radar(username=None, refresh=False, storage=None):
+    """Score `username` against the saved population snapshot, or rescore everyone.
+
+    A full run happens without a username, with `refresh`, or when the
+    snapshot is missing, too old or the population has drifted too far.
+    Returns the scores that were written (`username -> radar`).
+    """
+    storage = storage or get_storage()
+    if username and not refresh:
+        stats = storage.load_radar_stats()
+        reason = recalibration_reason(stats, len(storage.load_users()))
+        if reason is None:
+            radar = score_user(calculate_raw_scores(get_raw_metrics(username, storage)), stats["dimensions"])
+            storage.save_radar_user(username, radar)
+            print(f"Scored {username} against population snapshot v{stats['version']} "
+                  f"({stats['population']} users): {radar}")
+            return {username: radar}
+        print(f"Full recalibration: {reason}.")
+    return calculate_radar_scores(refresh=refresh, storage=storage)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--refresh', action='store_true')
+    parser.add_argument('--username', type=str, help='Score a single user against the saved population snapshot')
+    args, _ = parser.parse_known_args()
+    refresh = args.refresh or os.environ.get('REFRESH_DATA') in ('1', 'true', 'True')
+
+    update_radar(args.username, refresh=refresh)
 
 if __name__ == "__main__":
     main()
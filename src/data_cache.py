@@ -0,0 +1,86 @@
+"""
+In-memory cache of parsed JSON data files.
+
+`JSONFileCache` keeps the parsed content of one file and re-reads it only
+when the file's (mtime, size) stamp changes, so hot endpoints stop re-parsing
+`radar_scores.json` / `macro_data_results.json` on every request.
+`load_json_cached` applies the same to arbitrary (per-user) files through a
+bounded registry.
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class JSONFileCache:
+    def __init__(self, path, default_factory=dict):
+        self.path = path
+        self.default_factory = default_factory
+        self._stamp = None
+        self._data = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Parsed file content, reloaded only if the file changed since the last read."""
+        stamp = _file_stamp(self.path)
+        if stamp is not None and stamp == self._stamp:
+            return self._data
+        with self._lock:
+            if stamp is None:
+                self._stamp = None
+                self._data = self.default_factory()
+                return self._data
+            if stamp == self._stamp:
+                return self._data
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                if self._data is None:
+                    raise
+                # Probably caught mid-write; serve the previous copy and retry next time
+                print(f"Failed to reload {self.path}, serving cached copy: {e}")
+                return self._data
+            self._data = data
+            self._stamp = stamp
+            return data
+
+    def lookup(self, key, default=None):
+        """Per-key lookup for files holding a `key -> value` object."""
+        data = self.get()
+        if isinstance(data, dict):
+            return data.get(key, default)
+        return default
+
+    def invalidate(self):
+        with self._lock:
+            self._stamp = None
+
+
+_registry = OrderedDict()  # path -> JSONFileCache, LRU-bounded
+_registry_lock = threading.Lock()
+REGISTRY_MAX_FILES = 4096
+
+
+def load_json_cached(path, default_factory=dict):
+    """Like json.load(open(path)) with an mtime-aware cache; missing files give default_factory()."""
+    with _registry_lock:
+        cache = _registry.get(path)
+        if cache is None:
+            cache = _registry[path] = JSONFileCache(path, default_factory)
+            while len(_registry) > REGISTRY_MAX_FILES:
+                _registry.popitem(last=False)
+        else:
+            _registry.move_to_end(path)
+    return cache.get()
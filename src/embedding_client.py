@@ -0,0 +1,272 @@
+"""
+Batched client for OpenAI-compatible `/embeddings` endpoints.
+
+`embed_many` splits the input into batches of `batch_size` texts (sent as a
+list `input` in one request) and runs up to `max_concurrency` batches in
+parallel over a pooled `requests.Session`. `aembed` is the async variant for
+request handlers; it uses the `httpx.AsyncClient` returned by `async_http`.
+
+`QueryEmbeddingCache` sits in front of the client for search queries.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def normalize_embeddings_url(raw_url: str) -> str:
+    api_url = (raw_url or "").rstrip("/")
+    if not api_url or api_url.endswith("/embeddings"):
+        return api_url
+    if "v1" not in api_url:
+        return f"{api_url}/v1/embeddings"
+    return f"{api_url}/embeddings"
+
+
+class EmbeddingClient:
+    def __init__(self, api_url: str, api_key: str, model: str, batch_size: int = 10,
+                 max_concurrency: int = 4, timeout: float = 30, async_http=None):
+        self.api_url = normalize_embeddings_url(api_url)
+        self.api_key = api_key
+        self.model = model
+        self.batch_size = max(1, int(batch_size))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+        self.async_http = async_http  # callable returning a shared httpx.AsyncClient
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        # One session per thread: requests.Session is not guaranteed thread-safe
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_maxsize=self.max_concurrency))
+            session.mount("https://", HTTPAdapter(pool_maxsize=self.max_concurrency))
+            session.headers.update({
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}",
+            })
+            self._local.session = session
+        return session
+
+    def _post_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        payload = {"model": self.model, "input": texts}
+        try:
+            resp = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            resp.raise_for_status()
+            items = resp.json().get("data") or []
+        except Exception as e:
+            print(f"Embedding generation failed for a batch of {len(texts)}: {e}")
+            return [None] * len(texts)
+        return self._parse_items(items, len(texts))
+
+    @staticmethod
+    def _parse_items(items, count: int) -> List[Optional[List[float]]]:
+        vectors = [None] * count
+        for pos, item in enumerate(items):
+            idx = item.get("index", pos)
+            if isinstance(idx, int) and 0 <= idx < count:
+                vectors[idx] = item.get("embedding") or None
+        return vectors
+
+    def embed(self, text: str) -> List[float]:
+        """Embed a single text; returns [] on failure."""
+        if not self.api_key:
+            print("Warning: embedding API key not configured")
+            return []
+        return self._post_batch([text])[0] or []
+
+    async def aembed(self, text: str) -> List[float]:
+        """Async `embed`; falls back to the blocking client in a worker thread if `async_http` is unset."""
+        if not self.api_key:
+            print("Warning: embedding API key not configured")
+            return []
+        if self.async_http is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.embed, text)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        try:
+            resp = await self.async_http().post(
+                self.api_url, json={"model": self.model, "input": [text]}, headers=headers
+            )
+            resp.raise_for_status()
+            items = resp.json().get("data") or []
+        except Exception as e:
+            print(f"Embedding generation failed: {e}")
+            return []
+        return self._parse_items(items, 1)[0] or []
+
+    def embed_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed texts in concurrent batches; failed entries come back as None."""
+        if not texts:
+            return []
+        if not self.api_key:
+            print("Warning: embedding API key not configured")
+            return [None] * len(texts)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._post_batch(batches[0])
+
+        results = []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            for vectors in executor.map(self._post_batch, batches):
+                results.extend(vectors)
+        return results
+
+
+def normalize_query(text: str) -> str:
+    """Case-fold and collapse whitespace so trivially different queries share a cache entry."""
+    return " ".join((text or "").split()).casefold()
+
+
+class _InFlight:
+    def __init__(self, future=None):
+        self.event = threading.Event()
+        self.future = future  # set when the leader is a coroutine (see `aget`)
+        self.result = []
+
+
+class QueryEmbeddingCache:
+    """
+    LRU + TTL cache of query embeddings keyed by (model, normalized query).
+
+    Concurrent misses for the same key are coalesced: the first caller embeds,
+    the others wait for its result instead of calling the API again. Failed
+    embeddings are not cached. With `persist_file` set, entries survive
+    restarts via `save()` / the constructor.
+    """
+    def __init__(self, client: EmbeddingClient, max_size: int = 1024, ttl: float = 86400,
+                 persist_file: Optional[str] = None):
+        self.client = client
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self.persist_file = persist_file
+        self._entries = OrderedDict()  # key -> (created_at, vector)
+        self._inflight = {}            # key -> _InFlight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if persist_file:
+            self.load()
+
+    def _key(self, text: str):
+        return (self.client.model, normalize_query(text))
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def _lookup(self, key, new_flight):
+        """Returns (cached vector or None, in-flight entry, is_leader)."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[0], now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], None, False
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = new_flight()
+            self.misses += 1
+            return None, flight, leader
+
+    def _finish(self, key, flight):
+        with self._lock:
+            if flight.result:
+                self._entries[key] = (time.time(), flight.result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        flight.event.set()
+        if flight.future is not None and not flight.future.done():
+            flight.future.set_result(flight.result)
+
+    def get(self, text: str) -> List[float]:
+        key = self._key(text)
+        if not key[1]:
+            return []
+        cached, flight, leader = self._lookup(key, _InFlight)
+        if cached is not None:
+            return cached
+
+        if not leader:
+            flight.event.wait()
+            return flight.result
+
+        try:
+            flight.result = self.client.embed(key[1]) or []
+        finally:
+            self._finish(key, flight)
+        return flight.result
+
+    async def aget(self, text: str) -> List[float]:
+        """`get` for request handlers: waits without blocking the event loop."""
+        key = self._key(text)
+        if not key[1]:
+            return []
+        loop = asyncio.get_running_loop()
+        cached, flight, leader = self._lookup(key, lambda: _InFlight(loop.create_future()))
+        if cached is not None:
+            return cached
+
+        if not leader:
+            if flight.future is not None and flight.future.get_loop() is loop:
+                return await asyncio.shield(flight.future)
+            # Leader is a plain thread (e.g. the sync `get`)
+            await loop.run_in_executor(None, flight.event.wait)
+            return flight.result
+
+        try:
+            flight.result = await self.client.aembed(key[1]) or []
+        finally:
+            self._finish(key, flight)
+        return flight.result
+
+    def load(self):
+        if not self.persist_file or not os.path.exists(self.persist_file):
+            return
+        try:
+            with open(self.persist_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Failed to load query embedding cache: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for item in data.get("entries", []):
+                try:
+                    key = (item["model"], item["query"])
+                    created_at = float(item["created_at"])
+                    vector = item["embedding"]
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if vector and not self._expired(created_at, now):
+                    self._entries[key] = (created_at, vector)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.persist_file:
+            return
+        with self._lock:
+            entries = [
+                {"model": model, "query": query, "created_at": created_at, "embedding": vector}
+                for (model, query), (created_at, vector) in self._entries.items()
+            ]
+        try:
+            tmp_file = f"{self.persist_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"entries": entries}, f)
+            os.replace(tmp_file, self.persist_file)
+        except Exception as e:
+            print(f"Failed to save query embedding cache: {e}")
@@ -1,89 +1,58 @@
 #!/usr/bin/env python3
 import os
-import json
-import time
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import get_storage
+from github_client import RateLimiter, get_github_client, load_config
+from user_repos import get_user_repos
 
 # 保持路径逻辑一致
 ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(ROOT, 'data')
-RAW_USERS = os.path.join(DATA_DIR, 'raw_users')
-CONFIG_FILE = os.path.join(ROOT, 'config.json')
-USERS_LIST = os.path.join(DATA_DIR, 'users_list.json')
 
 # 保持权重一致
 W_CODE = 0.5
 W_SOCIAL = 2.0
 W_MAINT = 10.0
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
-config = load_config()
-GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN') or config.get('github_token') or ((config.get('github_tokens') or [None])[0])
-
-HEADERS = {'Accept': 'application/vnd.github.v3+json'}
-if GITHUB_TOKEN:
-    HEADERS['Authorization'] = f'token {GITHUB_TOKEN}'
-
-# --- 增强：配置自动重试机制 ---
-SESSION = requests.Session()
-# 定义重试策略：针对 500/502/503/504 等错误重试 5 次
-retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-SESSION.mount('https://', HTTPAdapter(max_retries=retries))
-SESSION.headers.update(HEADERS)
-
-def ensure_user_dir(username):
-    d = os.path.join(RAW_USERS, username)
-    os.makedirs(d, exist_ok=True)
-    return d
+# 并发与限速：取代原先每个仓库 sleep(0.3)、每个用户 sleep(1) 的做法
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 10.0  # 每秒请求数（令牌桶），0 表示不限速
 
 def list_users():
-    if not os.path.exists(USERS_LIST):
-        return []
-    with open(USERS_LIST, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return get_storage().load_users()
 
-# --- 增强：安全的 Get 请求，带超时和异常处理 ---
-def safe_get(url):
+# --- 增强：安全的 Get 请求，带超时和异常处理（共享 GitHubClient：连接池、5xx 重试、多 Token 调度）---
+def safe_get(url, client=None, limiter=None):
     try:
+        if limiter:
+            limiter.acquire()
         # 将超时时间延长至 60 秒，减少 Read timeout
-        r = SESSION.get(url, timeout=60)
+        r = (client or get_github_client()).get(url, timeout=60)
         if r.status_code == 200:
             return r
         elif r.status_code == 403:
-            print("   [!] 触发频率限制，建议检查 TOKEN 或休眠...")
+            # 频率限制已由 GitHubClient 换 Token / 等待处理，这里是真正的拒绝访问
+            print(f"   [!] 请求被拒绝 (403): {url}")
     except Exception as e:
         print(f"   [!] 网络请求异常: {e}")
     return None
 
-def fetch_user_repos(username):
-    repos = []
-    page = 1
-    while True:
-        url = f'https://api.github.com/users/{username}/repos?per_page=100&page={page}&type=owner&sort=pushed'
-        r = safe_get(url)
-        if not r: break
-        batch = r.json()
-        if not batch: break
-        repos.extend(batch)
-        if len(batch) < 100: break
-        page += 1
-    return repos
-
-def fetch_repo_languages(owner, repo):
-    url = f'https://api.github.com/repos/{owner}/{repo}/languages'
-    r = safe_get(url)
+def fetch_user_repos(username, client=None, refresh=False, run_started_at=None):
+    # 与其它阶段共用 raw_users/<username>/repos.json，同一次运行中只抓取一次
+    try:
+        return get_user_repos(username, client, refresh=refresh, run_started_at=run_started_at)
+    except Exception as e:
+        print(f"   [!] 网络请求异常: {e}")
+        return []
+
+def fetch_repo_languages(owner, repo, client=None, limiter=None):
+    url = f'/repos/{owner}/{repo}/languages'
+    r = safe_get(url, client, limiter)
     return r.json() if r else {}
 
-def fetch_repo_contributions(owner, repo, username):
-    url = f'https://api.github.com/repos/{owner}/{repo}/contributors'
-    r = safe_get(url)
+def fetch_repo_contributions(owner, repo, username, client=None, limiter=None):
+    url = f'/repos/{owner}/{repo}/contributors'
+    r = safe_get(url, client, limiter)
     if not r: return 0
     try:
         for c in r.json():
@@ -100,57 +69,85 @@ def compute_contribution_score(languages_bytes, stars, forks, maint_count):
     score = (W_CODE * S_code) + (W_SOCIAL * S_social) + (W_MAINT * S_maint)
     return round(score, 2), S_code, S_social, S_maint
 
-def process_user(username):
-    user_dir = ensure_user_dir(username)
-    # --- 核心修改：检测文件是否存在，存在则跳过 ---
-    out_path = os.path.join(user_dir, 'representative_repos.json')
-    if os.path.exists(out_path) and not globals().get('REFRESH', False):
-        print(f'---> Skip: {username} (File already exists)')
+def build_repo_entry(r, lang_data, maint_count):
+    """representative_repos.json 中的一条记录（REST 与 GraphQL 两种抓取方式共用）"""
+    score, S_code, S_social, S_maint = compute_contribution_score(
+        lang_data, r['stargazers_count'], r['forks_count'], maint_count
+    )
+    return {
+        'name': r['name'],
+        'full_name': r['full_name'],
+        'html_url': r['html_url'],
+        'description': r['description'],
+        'stars': r['stargazers_count'],
+        'forks': r['forks_count'],
+        'languages': lang_data,
+        'contributions_by_user': maint_count,
+        'contribution_score': score,
+        'S_code': round(S_code, 2),
+        'S_social': S_social,
+        'S_maint': S_maint
+    }
+
+def score_repo(r, username, client=None, limiter=None):
+    owner = r['owner']['login']
+    repo_name = r['name']
+    lang_data = fetch_repo_languages(owner, repo_name, client, limiter)
+    maint_count = fetch_repo_contributions(owner, repo_name, username, client, limiter)
+    return build_repo_entry(r, lang_data, maint_count)
+
+def process_user(username, refresh=None, client=None, pool=None, limiter=None, run_started_at=None):
+    storage = get_storage()
+    if refresh is None:
+        refresh = globals().get('REFRESH', False)
+    # --- 核心修改：检测数据是否存在，存在则跳过 ---
+    if storage.has_user_document(username, 'representative_repos') and not refresh:
+        print(f'---> Skip: {username} (Data already exists)')
         return
 
     print(f'---> Processing: {username}')
-    repos = fetch_user_repos(username)
+    repos = fetch_user_repos(username, client, refresh, run_started_at)
     if not repos: return
 
-    result = []
-    for r in repos:
-        owner = r['owner']['login']
-        repo_name = r['name']
-        lang_data = fetch_repo_languages(owner, repo_name)
-        maint_count = fetch_repo_contributions(owner, repo_name, username)
-        
-        score, S_code, S_social, S_maint = compute_contribution_score(
-            lang_data, r['stargazers_count'], r['forks_count'], maint_count
-        )
-
-        result.append({
-            'name': repo_name,
-            'full_name': r['full_name'],
-            'html_url': r['html_url'],
-            'description': r['description'],
-            'stars': r['stargazers_count'],
-            'forks': r['forks_count'],
-            'languages': lang_data,
-            'contributions_by_user': maint_count,
-            'contribution_score': score,
-            'S_code': round(S_code, 2),
-            'S_social': S_social,
-            'S_maint': S_maint
-        })
-        # 适当休眠，降低 SSL 报错概率
-        time.sleep(0.3)
+    # 各仓库的语言与贡献请求并发执行，总速率由共享的令牌桶限制
+    if pool is None:
+        result = [score_repo(r, username, client, limiter) for r in repos]
+    else:
+        result = list(pool.map(lambda r: score_repo(r, username, client, limiter), repos))
 
     result.sort(key=lambda x: x['stars'], reverse=True)
-    with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    storage.save_user_document(username, 'representative_repos', result)
     print(f'DONE: Saved {username}')
 
+def fetch_representative_repos(users, refresh=False, client=None, workers=None, rate=None, run_started_at=None):
+    """Pipeline stage: score and save each user's owned repositories.
+
+    Repos are fetched by `workers` threads (config `representative_repos_workers`)
+    at no more than `rate` requests per second (config `representative_repos_rate`).
+    """
+    config = load_config()
+    workers = max(1, int(workers or config.get('representative_repos_workers', DEFAULT_WORKERS)))
+    rate = float(config.get('representative_repos_rate', DEFAULT_RATE) if rate is None else rate)
+    limiter = RateLimiter(rate)
+    print(f"Fetching representative repos for {len(users)} users ({workers} workers, {rate:g} req/s)...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for u in users:
+            username = u.get('login') if isinstance(u, dict) else u
+            if not username: continue
+            try:
+                process_user(username, refresh=refresh, client=client, pool=pool, limiter=limiter,
+                             run_started_at=run_started_at)
+            except Exception as e:
+                print(f'Error on {username}: {e}')
+
 def main():
     # parse refresh flag
     import argparse
     parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument('--refresh', action='store_true')
     parser.add_argument('--username', type=str, help='Fetch data for a single user')
+    parser.add_argument('--workers', type=int, help='Concurrent repo requests (default 8)')
+    parser.add_argument('--rate', type=float, help='Max requests per second, 0 = unlimited (default 10)')
     args, _ = parser.parse_known_args()
     global REFRESH
     REFRESH = args.refresh or os.environ.get('REFRESH_DATA') in ('1', 'true', 'True')
@@ -160,15 +157,7 @@ def main():
     else:
         users = list_users()
 
-    print(f"Fetching representative repos for {len(users)} users...")
-    for u in users:
-        username = u.get('login') if isinstance(u, dict) else u
-        if not username: continue
-        try:
-            process_user(username)
-        except Exception as e:
-            print(f'Error on {username}: {e}')
-        time.sleep(1)
+    fetch_representative_repos(users, refresh=REFRESH, workers=args.workers, rate=args.rate)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,13 +1,16 @@
-import requests
 import base64
-import json
 import os
-import time
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from tqdm import tqdm
 
+from storage import get_storage
+from github_client import GitHubClient, get_github_client, load_config, load_github_tokens
+from report_cache import evict_lru
+from user_repos import get_user_repos
+
 # --- Constants ---
-GITHUB_API_BASE = "https://api.github.com"
 TARGET_FILES = [
     # Dependency Management
     "package.json", "go.mod", "pom.xml", "requirements.txt", "Cargo.toml", "Gemfile",
@@ -16,78 +19,88 @@ TARGET_FILES = [
     # Cloud Native Configuration
     "k8s.yaml", "helm/Chart.yaml"
 ]
+# Root README variants (lower case) -> key stored under `files`; consumers read "README.md"
+README_FILES = [
+    ("readme.md", "README.md"), ("readme.markdown", "README.md"), ("readme", "README.md"),
+    ("readme.txt", "README.md"), ("readme.rst", "README.rst"),
+]
+# The contents API returns no content above 1 MB; such files were never used
+MAX_BLOB_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 8
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+BLOB_CACHE_DIR = os.path.join(os.path.dirname(SRC_DIR), "data", "blob_cache")
+# Eviction walks the whole directory, so it only runs every N stores
+EVICT_EVERY = 200
+
+
+class BlobCache:
+    """Decoded git blobs by SHA under `data/blob_cache/`; blobs never change, so entries never go stale."""
+
+    def __init__(self, cache_dir: str = BLOB_CACHE_DIR, max_bytes: int = 50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._stores = 0
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.cache_dir, sha[:2], f"{sha}.txt")
+
+    def get(self, sha: str) -> Optional[str]:
+        if self.max_bytes <= 0:
+            return None
+        path = self._path(sha)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            return None
+        return text
+
+    def put(self, sha: str, text: str):
+        if self.max_bytes <= 0:
+            return
+        path = self._path(sha)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._stores += 1
+                if self._stores % EVICT_EVERY == 1:
+                    evict_lru(self.cache_dir, self.max_bytes)
+        except OSError as e:
+            print(f"Failed to cache blob {sha}: {e}")
 
-# --- GitHub API Client ---
-class GitHubAPIClient:
-    """Manages GitHub API requests with token rotation and rate limiting."""
-    def __init__(self, tokens: List[str]):
-        self.tokens = [t for t in tokens if t]
-        self.token_index = 0
-
-    def _get_next_token(self) -> str:
-        if not self.tokens:
-            return ""
-        token = self.tokens[self.token_index]
-        self.token_index = (self.token_index + 1) % len(self.tokens)
-        return token
-    
-    def get(self, endpoint: str, params: Dict[str, Any] = None, headers: Dict[str, str] = None) -> requests.Response:
-        url = f"{GITHUB_API_BASE}{endpoint}" if not endpoint.startswith("http") else endpoint
-        
-        while True:
-            token = self._get_next_token()
-            current_headers = {
-                "Accept": "application/vnd.github.v3+json"
-            }
-            if token:
-                current_headers["Authorization"] = f"token {token}"
-                
-            if headers:
-                current_headers.update(headers) 
-            
-            try:
-                response = requests.get(url, headers=current_headers, params=params, timeout=15)
-                
-                if response.status_code == 403 and 'rate limit exceeded' in response.text:
-                    reset_time = int(response.headers.get('X-RateLimit-Reset', time.time() + 60))
-                    sleep_duration = reset_time - time.time()
-                    if sleep_duration < 0: sleep_duration = 60
-                    print(f"Token {token[:4]}... rate limit exceeded, waiting {sleep_duration:.2f} seconds...")
-                    time.sleep(sleep_duration + 5) 
-                    continue 
-                
-                return response
-            except requests.exceptions.RequestException as e:
-                print(f"Request error: {e}. Retrying...")
-                time.sleep(5)
-                continue
 
 # --- Helper Functions ---
-def get_file_content(client: GitHubAPIClient, owner: str, repo: str, file_path: str) -> Optional[str]:
+def truncate_content(text: str) -> str:
+    # Truncate to 200 lines or 3000 chars
+    lines = text.split('\n')
+    if len(lines) > 200:
+        text = '\n'.join(lines[:200]) + "\n... (truncated)"
+    if len(text) > 3000:
+        text = text[:3000] + "\n... (truncated)"
+    return text
+
+def get_file_content(client: GitHubClient, owner: str, repo: str, file_path: str) -> Optional[str]:
     """
     Fetches file content from GitHub, handles Base64 decoding, and truncates.
     Returns the processed content string or None if not found/error.
+    Only used when the repository tree cannot be listed.
     """
     endpoint = f"/repos/{owner}/{repo}/contents/{file_path}"
     response = client.get(endpoint)
-    
+
     if response.status_code == 200:
         data = response.json()
         if 'content' in data and data['encoding'] == 'base64':
             try:
-                # Decode Base64
-                decoded_bytes = base64.b64decode(data['content'])
-                decoded_str = decoded_bytes.decode('utf-8', errors='replace')
-                
-                # Truncate to 200 lines or 3000 chars
-                lines = decoded_str.split('\n')
-                if len(lines) > 200:
-                    decoded_str = '\n'.join(lines[:200]) + "\n... (truncated)"
-                
-                if len(decoded_str) > 3000:
-                    decoded_str = decoded_str[:3000] + "\n... (truncated)"
-                    
-                return decoded_str
+                decoded_str = base64.b64decode(data['content']).decode('utf-8', errors='replace')
+                return truncate_content(decoded_str)
             except Exception as e:
                 print(f"Error decoding/processing {file_path} in {owner}/{repo}: {e}")
                 return None
@@ -95,54 +108,118 @@ def get_file_content(client: GitHubAPIClient, owner: str, repo: str, file_path:
             # Handle cases where content might not be base64 (unlikely for files via this API but possible)
             # or if file is too large (API returns 'size' but no 'content' if > 1MB)
              return None
-    elif response.status_code == 404:
+    return None
+
+def list_repo_tree(client: GitHubClient, owner: str, repo: str, ref: str) -> Tuple[Optional[Dict[str, Dict[str, Any]]], bool]:
+    """
+    Lists the whole repository tree in one call.
+    Returns (lower-case path -> blob entry, truncated), or (None, False) if the tree is unavailable.
+    """
+    response = client.get(f"/repos/{owner}/{repo}/git/trees/{ref}", params={'recursive': '1'})
+    if response.status_code != 200:
+        # 409: empty repository; 404: missing ref
+        return None, False
+    data = response.json()
+    blobs = {e['path'].lower(): e for e in data.get('tree', []) if e.get('type') == 'blob'}
+    return blobs, bool(data.get('truncated'))
+
+def select_target_files(tree: Dict[str, Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """(key, tree entry) of every target file present, matched case-insensitively; README variants included."""
+    selected = []
+    for file_path in TARGET_FILES:
+        entry = tree.get(file_path.lower())
+        if entry:
+            selected.append((file_path, entry))
+    keys = set()
+    for name, key in README_FILES:
+        entry = tree.get(name)
+        if entry and key not in keys:
+            keys.add(key)
+            selected.append((key, entry))
+    return selected
+
+def get_blob_content(client: GitHubClient, owner: str, repo: str, entry: Dict[str, Any], blob_cache: Optional[BlobCache]) -> Optional[str]:
+    """Decoded (untruncated) text of a tree entry, from the blob cache when its SHA was seen before."""
+    sha = entry['sha']
+    if blob_cache is not None:
+        text = blob_cache.get(sha)
+        if text is not None:
+            return text
+    if (entry.get('size') or 0) > MAX_BLOB_SIZE:
         return None
-    else:
-        # print(f"Failed to fetch {file_path} from {owner}/{repo}: {response.status_code}")
+    response = client.get(f"/repos/{owner}/{repo}/git/blobs/{sha}")
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if data.get('encoding') != 'base64':
+        return None
+    try:
+        text = base64.b64decode(data.get('content') or '').decode('utf-8', errors='replace')
+    except Exception as e:
+        print(f"Error decoding {entry.get('path')} in {owner}/{repo}: {e}")
         return None
+    if blob_cache is not None:
+        blob_cache.put(sha, text)
+    return text
+
+def fetch_repo_files(client: GitHubClient, repo: Dict[str, Any], pool: Optional[ThreadPoolExecutor] = None,
+                     blob_cache: Optional[BlobCache] = None) -> Dict[str, str]:
+    """Target files + README of one repo: one tree listing, then only the files that exist (concurrently)."""
+    owner = (repo.get('owner') or {}).get('login') or repo.get('full_name', '/').split('/')[0]
+    name = repo.get('name')
+    tree, truncated = list_repo_tree(client, owner, name, repo.get('default_branch') or 'HEAD')
+    if tree is None:
+        return {}
+
+    selected = select_target_files(tree)
+
+    def fetch(item):
+        key, entry = item
+        text = get_blob_content(client, owner, name, entry, blob_cache)
+        return key, truncate_content(text) if text else None
 
-def fetch_top_original_repos_context(client: GitHubAPIClient, username: str) -> List[Dict[str, Any]]:
+    results = list(pool.map(fetch, selected)) if pool else [fetch(item) for item in selected]
+
+    if truncated:
+        # Very large trees come back incomplete; probe the targets the partial tree did not show
+        found = {key for key, _ in selected}
+        for file_path in TARGET_FILES + ["README.md", "README.rst"]:
+            if file_path not in found:
+                results.append((file_path, get_file_content(client, owner, name, file_path)))
+
+    # Only add files with content
+    return {key: text for key, text in results if text}
+
+def fetch_top_original_repos_context(client: GitHubClient, username: str, refresh: bool = False, storage=None,
+                                     pool: Optional[ThreadPoolExecutor] = None,
+                                     blob_cache: Optional[BlobCache] = None,
+                                     run_started_at: Optional[float] = None) -> List[Dict[str, Any]]:
     """
     Fetches context for the top 3 original repositories of a user.
     Returns a list of dictionaries containing repo info and file contents.
     """
-    # 1. Fetch User Repositories
-    repos = []
-    page = 1
-    while True:
-        response = client.get(f"/users/{username}/repos", params={'type': 'owner', 'per_page': 100, 'page': page})
-        if response.status_code != 200:
-            print(f"Error fetching repos for {username}: {response.status_code}")
-            break
-        
-        page_data = response.json()
-        if not page_data:
-            break
-            
-        repos.extend(page_data)
-        if 'next' not in response.links:
-            break
-        page += 1
-    
+    # 1. User Repositories (shared list, usually already fetched by get_all_metrics)
+    repos = get_user_repos(username, client, storage, refresh=refresh, run_started_at=run_started_at)
+
     # 2. Filter and Sort
     original_repos = [r for r in repos if not r.get('fork', False)]
     # Sort by stars descending
-    original_repos.sort(key=lambda x: x.get('stargazers_count', 0), reverse=True)
-    
+    original_repos.sort(key=lambda x: x.get('stargazers_count') or 0, reverse=True)
+
     # Top 3
     top_repos = original_repos[:3]
-    
+
     result = []
-    
+
     # 3. Process each repo
     for repo in top_repos:
         repo_pure_name = repo.get('name')
-        
+
         repo_data = {
             "name": repo.get('full_name'),
             "stars": repo.get('stargazers_count', 0),
             "description": repo.get('description') or "无",
-            "languages_breakdown": {}, 
+            "languages_breakdown": {},
             "files": {}
         }
 
@@ -156,45 +233,42 @@ def fetch_top_original_repos_context(client: GitHubAPIClient, username: str) ->
         except Exception as e:
             print(f"Error fetching languages for {repo_pure_name}: {e}")
 
-        # [Improved] Fetch README + Target Files
-        extended_target_files = TARGET_FILES + ["README.md", "README.rst"]
-        
-        for file_path in extended_target_files:
-            content = get_file_content(client, username, repo_pure_name, file_path)
-            if content: # Only add if content exists
-                repo_data["files"][file_path] = content 
-            
+        # [Improved] README + Target Files from one tree listing
+        repo_data["files"] = fetch_repo_files(client, repo, pool, blob_cache)
+
         result.append(repo_data)
-    
+
     return result
 
+def fetch_tech_stacks(users: List[str], client: Optional[GitHubClient] = None, refresh: bool = False, storage=None,
+                      workers: Optional[int] = None, run_started_at: Optional[float] = None):
+    """Pipeline stage: collect tech-stack context for each user into storage."""
+    storage = storage or get_storage()
+    client = client or get_github_client()
+    config = load_config()
+    workers = max(1, int(workers or config.get("tech_stack_workers", DEFAULT_WORKERS)))
+    blob_cache = BlobCache(max_bytes=int(float(config.get("blob_cache_max_mb", 50)) * 1024 * 1024))
+    print(f"--- Starting Technical Stack Analysis for {len(users)} Users ---\n")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for user in tqdm(users, desc="Fetching Tech Stacks"):
+            try:
+                # Skip if data already exists unless refresh requested
+                if storage.has_user_document(user, "tech_stack") and not refresh:
+                    continue
+
+                data = fetch_top_original_repos_context(client, user, refresh=refresh, storage=storage,
+                                                        pool=pool, blob_cache=blob_cache,
+                                                        run_started_at=run_started_at)
+
+                storage.save_user_document(user, "tech_stack", data)
+
+            except Exception as e:
+                print(f"Error processing {user}: {e}")
+
 # --- Main Execution ---
 def main():
-    # Setup Paths
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    root_dir = os.path.dirname(current_dir)
-    config_file = os.path.join(root_dir, "config.json")
-    user_list_file = os.path.join(root_dir, "data", "users_list.json")
-    
-    # Load Tokens
-    tokens = []
-    env_tokens = [t.strip() for t in (os.environ.get("GITHUB_TOKENS") or "").split(",") if t.strip()]
-    env_token = (os.environ.get("GITHUB_TOKEN") or "").strip()
-    if env_tokens:
-        tokens = env_tokens
-    elif env_token:
-        tokens = [env_token]
-    elif os.path.exists(config_file):
-        try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                tokens = config.get("github_tokens", [])
-                if not tokens and config.get("github_token"):
-                    tokens = [config.get("github_token")]
-        except Exception as e:
-            print(f"Error loading config.json: {e}")
-    
-    if not tokens:
+    if not load_github_tokens():
         print("No tokens found. Exiting.")
         return
 
@@ -202,50 +276,23 @@ def main():
     parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument('--refresh', action='store_true')
     parser.add_argument('--username', type=str, help='Fetch data for a single user')
+    parser.add_argument('--workers', type=int, help='Concurrent file downloads (default 8)')
     args, _ = parser.parse_known_args()
     refresh = args.refresh or os.environ.get('REFRESH_DATA') in ('1', 'true', 'True')
 
     # Load Users
+    storage = get_storage()
     users = []
     if args.username:
         users = [args.username]
-    elif os.path.exists(user_list_file):
-        with open(user_list_file, 'r', encoding='utf-8') as f:
-            users = json.load(f)
     else:
-        print(f"User list file not found: {user_list_file}")
-        return
+        users = storage.load_users()
+        if not users:
+            print("User list is empty or not found.")
+            return
 
-    # Init Client
-    client = GitHubAPIClient(tokens)
-    
     # Process All Users
-    print(f"--- Starting Technical Stack Analysis for {len(users)} Users ---\n")
-    
-    # Ensure raw_users directory exists
-    raw_users_dir = os.path.join(root_dir, "data", "raw_users")
-    if not os.path.exists(raw_users_dir):
-        os.makedirs(raw_users_dir)
-
-    for user in tqdm(users, desc="Fetching Tech Stacks"):
-        # print(f"Processing user: {user}...")
-        try:
-            user_dir = os.path.join(raw_users_dir, user)
-            if not os.path.exists(user_dir):
-                os.makedirs(user_dir)
-                
-            output_file = os.path.join(user_dir, "tech_stack.json")
-            # Skip if file already exists unless refresh requested
-            if os.path.exists(output_file) and not refresh:
-                continue
-
-            data = fetch_top_original_repos_context(client, user)
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-                
-        except Exception as e:
-            print(f"Error processing {user}: {e}")
+    fetch_tech_stacks(users, refresh=refresh, storage=storage, workers=args.workers)
 
 if __name__ == "__main__":
     main()
@@ -10,6 +10,8 @@ import argparse
 from tqdm import tqdm
 import numpy as np
 
+from storage import get_storage
+
 def load_json(file_path):
     """Load JSON file."""
     if not os.path.exists(file_path):
@@ -26,18 +28,19 @@ def normalize(value, min_val, max_val):
         return 0.0
     return (value - min_val) / (max_val - min_val)
 
-def generate_developer_vectors(username=None, refresh=False):
-    """Generate developer vectors."""
+def generate_developer_vectors(username=None, refresh=False, radar_scores=None):
+    """Generate developer vectors; `radar_scores` skips reloading scores the caller already has."""
     # Get base directories
     current_dir = os.path.dirname(os.path.abspath(__file__))
     root_dir = os.path.dirname(current_dir)
     data_dir = os.path.join(root_dir, "data")
     
+    storage = get_storage()
+
     # Load users list
-    users_list_file = os.path.join(data_dir, "users_list.json")
-    users = load_json(users_list_file)
+    users = storage.load_users()
     if not users:
-        print(f"Error: {users_list_file} not found or empty.")
+        print("Error: users list not found or empty.")
         return False
     
     # If username is specified, only process that user
@@ -48,15 +51,15 @@ def generate_developer_vectors(username=None, refresh=False):
             users = [username]
     
     # Load radar scores
-    radar_file = os.path.join(data_dir, "radar_scores.json")
-    radar_scores = load_json(radar_file)
+    if radar_scores is None:
+        radar_scores = storage.load_radar_scores()
     if not radar_scores:
-        print(f"Error: {radar_file} not found or empty.")
+        print("Error: radar scores not found or empty.")
         return False
     
     # Load existing vectors if refresh is False
     vectors_file = os.path.join(data_dir, "developer_vectors.json")
-    existing_vectors = load_json(vectors_file) if not refresh else {}
+    existing_vectors = (load_json(vectors_file) or {}) if not refresh else {}
     
     # Process each user
     for user in tqdm(users, desc="Generating vectors"):
@@ -65,21 +68,17 @@ def generate_developer_vectors(username=None, refresh=False):
             continue
         
         # Load user data
-        user_dir = os.path.join(data_dir, "raw_users", user)
-        if not os.path.exists(user_dir):
+        if not storage.has_user_data(user):
             continue
         
         # Load diversity data for technical tags
-        diversity_file = os.path.join(user_dir, f"{user}_diversity.json")
-        diversity_data = load_json(diversity_file)
+        diversity_data = storage.load_dimension(user, "diversity")
         
         # Load tech stack data
-        tech_stack_file = os.path.join(user_dir, "tech_stack.json")
-        tech_stack_data = load_json(tech_stack_file)
+        tech_stack_data = storage.load_user_document(user, "tech_stack")
         
         # Load representative repos data
-        repos_file = os.path.join(user_dir, "representative_repos.json")
-        repos_data = load_json(repos_file)
+        repos_data = storage.load_user_document(user, "representative_repos")
         
         # Load radar scores for this user
         user_radar = radar_scores.get(user, [50, 50, 50, 50, 50, 50])
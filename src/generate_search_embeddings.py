@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build / refresh the semantic-search embeddings in the vector store.
+
+Each user's search text (languages, topics, top repos and READMEs) is hashed;
+only users that are missing from the store, whose text hash changed (e.g.
+after a `--refresh` mine) or that were embedded with another model are sent
+to the embeddings API. The hash and model are stored with each vector.
+
+Run it offline with `python src/generate_search_embeddings.py`; the server
+runs the same job in a background thread.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+from embedding_client import EmbeddingClient
+from storage import get_storage
+from vector_store import SimpleVectorStore, VECTOR_STORE_FILE, create_index
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+CONFIG_FILE = os.path.join(ROOT_DIR, "config.json")
+
+# Serializes indexer runs (periodic task vs. post-mining insert) within a process
+_INDEX_LOCK = threading.Lock()
+
+
+def load_json(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def get_user_search_text(username: str, storage=None):
+    """Aggregate user data for search"""
+    storage = storage or get_storage()
+    text_parts = []
+
+    # 1. Diversity Data (Languages & Topics)
+    div_data = storage.load_dimension(username, "diversity")
+    if div_data:
+        try:
+            raw = div_data.get("raw_metrics", {})
+            langs = raw.get("distinct_languages", [])
+            topics = raw.get("distinct_topics", [])
+            if langs:
+                text_parts.append(f"Languages: {', '.join(langs)}")
+            if topics:
+                text_parts.append(f"Topics: {', '.join(topics)}")
+        except Exception as e:
+            print(f"Error reading diversity for {username}: {e}")
+
+    # 2. Tech Stack (Repo descriptions & READMEs)
+    stack_data = storage.load_user_document(username, "tech_stack")
+    if stack_data:
+        try:
+            if isinstance(stack_data, list):
+                for repo in stack_data:
+                    name = repo.get("name", "")
+                    desc = repo.get("description", "")
+                    if name:
+                        text_parts.append(f"Project: {name}")
+                    if desc:
+                        text_parts.append(f"Description: {desc}")
+
+                    files = repo.get("files", {})
+                    readme = files.get("README.md", "")
+                    if readme:
+                        # Truncate readme to avoid token limits (approx 500 chars)
+                        text_parts.append(f"Readme: {readme[:500]}")
+        except Exception as e:
+            print(f"Error reading tech stack for {username}: {e}")
+
+    return "\n".join(text_parts)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_stale(store: SimpleVectorStore, username: str, text_hash: str, model: str) -> bool:
+    meta = store.get_meta(username)
+    if meta is None:
+        return True
+    return meta.get("hash") != text_hash or meta.get("model") != model
+
+
+def index_users(store: SimpleVectorStore, client: EmbeddingClient, users, refresh=False, storage=None):
+    """
+    Re-embed users that are missing or stale, then save the store once.
+    Returns (embedded, skipped_up_to_date, failed).
+    """
+    storage = storage or get_storage()
+    with _INDEX_LOCK:
+        store.reload_if_changed()
+
+        pending = []  # (username, text, hash)
+        up_to_date = 0
+        for username in users:
+            if not storage.has_user_data(username):
+                continue
+            text = get_user_search_text(username, storage)
+            if not text:
+                continue
+            text_hash = content_hash(text)
+            if refresh or is_stale(store, username, text_hash, client.model):
+                pending.append((username, text, text_hash))
+            else:
+                up_to_date += 1
+
+        if not pending:
+            return 0, up_to_date, 0
+
+        print(f"Embedding {len(pending)} users ({up_to_date} up to date)...")
+        vectors = client.embed_many([text for _, text, _ in pending])
+        embedded = 0
+        for (username, _, text_hash), vec in zip(pending, vectors):
+            if not vec:
+                continue
+            try:
+                store.add(username, vec, meta={"hash": text_hash, "model": client.model})
+                embedded += 1
+            except ValueError as e:
+                print(f"Skipping embedding for {username}: {e}")
+        if embedded:
+            store.save()
+        return embedded, up_to_date, len(pending) - embedded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / refresh semantic search embeddings.")
+    parser.add_argument("--username", help="Process only this username")
+    parser.add_argument("--refresh", action="store_true", help="Re-embed users even if their text is unchanged")
+    args = parser.parse_args()
+
+    config = load_json(CONFIG_FILE)
+    llm_api_url = os.environ.get("LLM_API_URL") or config.get("LLM_api_url") or config.get("llm_api_url")
+    llm_api_key = os.environ.get("LLM_API_KEY") or config.get("LLM_api_key") or config.get("llm_api_key", "")
+    llm_embedding_model = os.environ.get("LLM_EMBEDDING_MODEL") or config.get("LLM_embedding_model") or config.get("llm_embedding_model")
+    api_url = os.environ.get("QWEN_API_URL") or llm_api_url or config.get("qwen_api_url", "https://api.deepseek.com")
+    api_key = os.environ.get("QWEN_API_KEY") or llm_api_key or config.get("qwen_api_key", "")
+    model = os.environ.get("QWEN_EMBEDDING_MODEL") or llm_embedding_model or config.get("qwen_embedding_model", "text-embedding-v4")
+    if not api_key:
+        print("Error: no embedding API key configured (LLM_api_key in config.json).")
+        exit(1)
+
+    client = EmbeddingClient(
+        api_url, api_key, model,
+        batch_size=int(config.get("embedding_batch_size", 10)),
+        max_concurrency=int(config.get("embedding_concurrency", 4)),
+    )
+    storage = get_storage()
+    store = SimpleVectorStore(
+        VECTOR_STORE_FILE,
+        storage=storage if storage.backend == "sqlite" else None,
+        index=create_index(
+            os.environ.get("VECTOR_INDEX") or config.get("vector_index", "exact"),
+            VECTOR_STORE_FILE,
+            nlist=config.get("vector_index_nlist"),
+            nprobe=config.get("vector_index_nprobe", 8),
+            min_vectors=config.get("vector_index_min_vectors", 10000),
+        ),
+    )
+
+    users = [args.username] if args.username else storage.load_users()
+    embedded, up_to_date, failed = index_users(store, client, users, refresh=args.refresh)
+    print(f"Embedded {embedded} users, {up_to_date} up to date, {failed} failed. Store size: {len(store)}.")
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 import math
 import requests
-import json
 import os
-import time
-from typing import Dict, Any, List, Set
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Set
 from tqdm import tqdm
 
+from storage import get_storage, DIMENSIONS
+from github_client import GitHubClient, get_github_client
+from user_repos import get_user_repos
+
 # -- 1. 配置与常量 --
-GITHUB_API_BASE = "https://api.github.com"
 OPENDIGGER_API_BASE = "https://oss.x-lab.info/open_digger/github" 
 
 SRC_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,73 +17,12 @@ ROOT_DIR = os.path.dirname(SRC_DIR)
 DATA_DIR = os.path.join(ROOT_DIR, "data")
 CONFIG_FILE = os.path.join(ROOT_DIR, "config.json")
 
-USER_LIST_FILE = os.path.join(DATA_DIR, "users_list.json")
-BASE_USER_DATA_DIR = os.path.join(DATA_DIR, "raw_users")
-
 FORCE_UPDATE = False # Force re-fetch even if data exists; can be set via --refresh or REFRESH_DATA
+WORKERS_PER_TOKEN = 4 # 每个 Token 同时处理的用户数（吞吐受请求延迟而非限额约束）
+MAX_WORKERS = 32
 
-# Load tokens from config.json
-TOKENS = []
-if os.path.exists(CONFIG_FILE):
-    try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            TOKENS = config.get("github_tokens", [])
-    except Exception as e:
-        print(f"Error loading config.json: {e}")
-
-if not TOKENS:
-    # Fallback or empty
-    TOKENS = os.getenv("GITHUB_TOKENS", "").split(',')
-    TOKENS = [t for t in TOKENS if t]
-    
-if not TOKENS:
-    print("Warning: No GitHub tokens found in config.json or environment variables.")
-
-# -- 2. GitHub API 客户端类 --
-class GitHubAPIClient:
-    """管理 GitHub API 请求和 Token 轮询"""
-    def __init__(self, tokens: List[str]):
-        self.tokens = [t for t in tokens if t]
-        self.token_index = 0
-
-    def _get_next_token(self) -> str:
-        if not self.tokens:
-             return ""
-        token = self.tokens[self.token_index]
-        self.token_index = (self.token_index + 1) % len(self.tokens)
-        return token
-    
-    def get(self, endpoint: str, params: Dict[str, Any] = None, headers: Dict[str, str] = None) -> requests.Response:
-        url = f"{GITHUB_API_BASE}{endpoint}"
-        
-        while True:
-            token = self._get_next_token()
-            current_headers = {
-                "Accept": "application/vnd.github.v3+json"
-            }
-            if token:
-                current_headers["Authorization"] = f"token {token}"
-                
-            if headers:
-                current_headers.update(headers) 
-            
-            try:
-                response = requests.get(url, headers=current_headers, params=params, timeout=15)
-                
-                if response.status_code == 403 and 'rate limit exceeded' in response.text:
-                    reset_time = int(response.headers.get('X-RateLimit-Reset', time.time() + 60))
-                    sleep_duration = reset_time - time.time()
-                    if sleep_duration < 0: sleep_duration = 60
-                    print(f"Token {token[:4]}... 速率限制，等待 {sleep_duration:.2f} 秒...")
-                    time.sleep(sleep_duration + 5) 
-                    continue 
-                
-                return response
-            except requests.exceptions.RequestException as e:
-                print(f"Request error: {e}. Retrying...")
-                time.sleep(5)
-                continue
+# -- 2. GitHub API 客户端 --
+# 共享的 github_client.GitHubClient：连接池 + 按响应头调度多个 Token
 
 # -- 3. 各维度数据获取函数 --
 
@@ -99,25 +40,17 @@ def get_opendigger_data(username: str) -> Dict[str, Any]:
         pass
     return {"openrank_value": 0}
 
-def get_influence_metrics(client: GitHubAPIClient, username: str) -> Dict[str, Any]:
+def get_influence_metrics(client: GitHubClient, username: str, repos: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
     total_stars = 0
     total_forks = 0
     total_issues = 0
-    page = 1
-    while True:
-        response = client.get(f"/users/{username}/repos", params={'type': 'owner', 'per_page': 100, 'page': page})
-        if response.status_code != 200:
-            print(f"Error fetching repos for {username}: Status {response.status_code}, Response: {response.text[:100]}")
-            break
-        repos = response.json()
-        if not repos: break
-        for repo in repos:
-            if repo.get('fork') == False:
-                total_stars += repo.get('stargazers_count', 0)
-                total_forks += repo.get('forks_count', 0)
-                total_issues += repo.get('open_issues_count', 0)
-        page += 1
-        if 'next' not in response.links: break
+    if repos is None:
+        repos = get_user_repos(username, client)
+    for repo in repos:
+        if repo.get('fork') == False:
+            total_stars += repo.get('stargazers_count') or 0
+            total_forks += repo.get('forks_count') or 0
+            total_issues += repo.get('open_issues_count') or 0
     
     return {
         "total_stars": total_stars,
@@ -141,7 +74,7 @@ def calculate_influence_score(metrics: Dict[str, Any]) -> float:
 
 # --- 3.2 贡献度 (Contribution) & 3.3 维护力 (Maintainership) & 3.4 活跃度 (Engagement) & 3.6 代码能力 (Code Capability) ---
 # 这三个维度都依赖 Events API，为了节省请求，我们合并获取
-def get_events_metrics(client: GitHubAPIClient, username: str, user_repos: Set[str]) -> Dict[str, Any]:
+def get_events_metrics(client: GitHubClient, username: str, user_repos: Set[str]) -> Dict[str, Any]:
     metrics = {
         "accepted_external_prs": 0,
         "created_issues": 0,
@@ -242,28 +175,20 @@ def calculate_engagement_score(metrics: Dict[str, Any]) -> float:
     return round(((norm_issue * 0.60) + (norm_pr * 0.40)) * 100, 2)
 
 # --- 3.5 多样性 (Diversity) ---
-def get_diversity_metrics(client: GitHubAPIClient, username: str) -> Dict[str, Any]:
+def get_diversity_metrics(client: GitHubClient, username: str, repos: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
     distinct_languages = set() 
     distinct_topics = set()
     total_repos = 0
     
-    page = 1
-    while True:
-        headers = {"Accept": "application/vnd.github.mercy-preview+json"} # For topics
-        response = client.get(f"/users/{username}/repos", params={'type': 'owner', 'per_page': 100, 'page': page}, headers=headers)
-        if response.status_code != 200: break
-        repos = response.json()
-        if not repos: break
-        
-        for repo in repos:
-            if repo.get('fork') == False:
-                total_repos += 1
-                if repo.get('language'):
-                    distinct_languages.add(repo['language'])
-                for topic in repo.get('topics', []):
-                    distinct_topics.add(topic)
-        page += 1
-        if 'next' not in response.links: break
+    if repos is None:
+        repos = get_user_repos(username, client)
+    for repo in repos:
+        if repo.get('fork') == False:
+            total_repos += 1
+            if repo.get('language'):
+                distinct_languages.add(repo['language'])
+            for topic in repo.get('topics') or []:
+                distinct_topics.add(topic)
         
     return {
         "distinct_languages": list(distinct_languages),
@@ -304,44 +229,21 @@ def calculate_code_capability_score(metrics: Dict[str, Any]) -> float:
     return score
 
 # -- 4. 主流程 --
-def process_user(username: str, client: GitHubAPIClient):
-    user_dir = os.path.join(BASE_USER_DATA_DIR, username)
-    if not os.path.exists(user_dir):
-        os.makedirs(user_dir)
-    
-    # Check if all files exist
-    files = [
-        f"{username}_influence.json",
-        f"{username}_contribution.json",
-        f"{username}_maintainership.json",
-        f"{username}_engagement.json",
-        f"{username}_diversity.json",
-        f"{username}_code_capability.json"
-    ]
-    
-    if not FORCE_UPDATE and all(os.path.exists(os.path.join(user_dir, f)) for f in files):
+def process_user(username: str, client: GitHubClient, refresh: Optional[bool] = None,
+                 run_started_at: Optional[float] = None):
+    storage = get_storage()
+    refresh = FORCE_UPDATE if refresh is None else refresh
+    if not refresh and storage.has_dimensions(username, DIMENSIONS):
         return # Skip if all data exists
 
-    # 1. Fetch Repos List (Required for multiple metrics)
-    user_repos = set()
-    try:
-        # Quick fetch for repo names to assist event filtering
-        page = 1
-        while True:
-            r = client.get(f"/users/{username}/repos", params={'type': 'owner', 'per_page': 100, 'page': page})
-            if r.status_code != 200: break
-            repos = r.json()
-            if not repos: break
-            for repo in repos: user_repos.add(repo['full_name'])
-            if 'next' not in r.links: break
-            page += 1
-    except:
-        pass
+    # 1. Fetch Repos List once (shared by influence, events, diversity and the later stages)
+    repos = get_user_repos(username, client, storage, refresh=refresh, run_started_at=run_started_at)
+    user_repos = {repo['full_name'] for repo in repos}
 
     # 2. Collect Data
     # Influence
     od_metrics = get_opendigger_data(username)
-    inf_metrics = get_influence_metrics(client, username)
+    inf_metrics = get_influence_metrics(client, username, repos)
     inf_metrics.update(od_metrics)
     inf_score = calculate_influence_score(inf_metrics)
     
@@ -355,32 +257,89 @@ def process_user(username: str, client: GitHubAPIClient):
     code_score = calculate_code_capability_score(evt_metrics)
     
     # Diversity
-    div_metrics = get_diversity_metrics(client, username)
+    div_metrics = get_diversity_metrics(client, username, repos)
     div_score = calculate_diversity_score(div_metrics)
     
-    # 3. Save Files
-    save_data(username, "influence", inf_metrics, inf_score)
-    save_data(username, "contribution", evt_metrics, cont_score) # Reuse event metrics subset
-    save_data(username, "maintainership", evt_metrics, maint_score) # Reuse event metrics subset
-    save_data(username, "engagement", evt_metrics, eng_score) # Reuse event metrics subset
-    save_data(username, "code_capability", evt_metrics, code_score) # Reuse event metrics subset
-    save_data(username, "diversity", div_metrics, div_score)
+    # 3. Save (one transaction with the SQLite backend)
+    with storage.transaction():
+        save_data(username, "influence", inf_metrics, inf_score)
+        save_data(username, "contribution", evt_metrics, cont_score) # Reuse event metrics subset
+        save_data(username, "maintainership", evt_metrics, maint_score) # Reuse event metrics subset
+        save_data(username, "engagement", evt_metrics, eng_score) # Reuse event metrics subset
+        save_data(username, "code_capability", evt_metrics, code_score) # Reuse event metrics subset
+        save_data(username, "diversity", div_metrics, div_score)
 
 def save_data(username, dimension, metrics, score):
-    data = {
-        "username": username,
-        "raw_metrics": metrics,
-        f"{dimension}_score_100": score
-    }
-    path = os.path.join(BASE_USER_DATA_DIR, username, f"{username}_{dimension}.json")
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    get_storage().save_dimension(username, dimension, metrics, score)
+
+def default_workers(client: GitHubClient) -> int:
+    """Concurrent users for the token pool: a few per token, one without any token."""
+    return min(MAX_WORKERS, WORKERS_PER_TOKEN * len(client.tokens)) or 1
+
+def collect_metrics(users: List[str], client: Optional[GitHubClient] = None, refresh: bool = False,
+                    graphql: bool = False, workers: Optional[int] = None, run_started_at: Optional[float] = None):
+    """Pipeline stage: fetch and score the six dimensions for each user.
+
+    Users are processed by `workers` threads (default: `default_workers`)
+    sharing the client, whose token pool spreads their requests over all
+    tokens; each user's files are written only by the thread handling it.
+    With `graphql`, repo lists and representative repos are first collected
+    in batched GraphQL queries (graphql_collector.py); the set of users
+    collected that way is returned. `run_started_at` is the start of the
+    pipeline run, see `user_repos.get_user_repos`.
+    """
+    client = client or get_github_client()
+    if not client.tokens:
+        print("Warning: No GitHub tokens found in config.json or environment variables.")
+
+    collected = set()
+    if graphql:
+        if not client.tokens:
+            print("GraphQL mode requires a GitHub token, falling back to REST.")
+        else:
+            from graphql_collector import collect_repo_data
+            try:
+                collected = collect_repo_data(users, client, refresh=refresh)
+            except Exception as e:
+                print(f"GraphQL collection failed, falling back to REST: {e}")
+
+    workers = max(1, workers or default_workers(client))
+    print(f"Starting comprehensive 5-dimension scan for {len(users)} users with {workers} workers...")
+    todo = iter(users)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool, tqdm(total=len(users), desc="Processing Users") as bar:
+        def submit_next():
+            # Keep a small window in flight instead of one future per user
+            for user in todo:
+                pending[pool.submit(process_user, user, client, refresh, run_started_at)] = user
+                return
+
+        try:
+            for _ in range(workers * 2):
+                submit_next()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    user = pending.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        tqdm.write(f"Error processing {user}: {e}")
+                    bar.update(1)
+                    submit_next()
+        except KeyboardInterrupt:
+            print("\nStopped by user.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    return collected
 
 def main():
     import argparse
     parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument('--refresh', action='store_true', help='Force refresh all fetched metrics')
     parser.add_argument('--username', type=str, help='Fetch data for a single user')
+    parser.add_argument('--graphql', action='store_true', help='Collect repository data with batched GraphQL queries')
+    parser.add_argument('--workers', type=int, help='Users processed concurrently (default: 4 per token, max 32)')
     args, _ = parser.parse_known_args()
     global FORCE_UPDATE
     FORCE_UPDATE = args.refresh or os.environ.get('REFRESH_DATA') in ('1', 'true', 'True')
@@ -389,27 +348,15 @@ def main():
         users = [args.username]
         print(f"Single user mode: Fetching data for {args.username}")
     else:
-        if not os.path.exists(USER_LIST_FILE):
-            print(f"User list file {USER_LIST_FILE} not found.")
+        users = get_storage().load_users()
+        if not users:
+            print("User list is empty or not found.")
             return
-
-        with open(USER_LIST_FILE, 'r', encoding='utf-8') as f:
-            users = json.load(f)
-    
-    client = GitHubAPIClient(TOKENS)
     
-    print(f"Starting comprehensive 5-dimension scan for {len(users)} users...")
-    # users = users[:5] # Uncomment for testing
-    for user in tqdm(users, desc="Processing Users"):
-        try:
-            # print(f"Processing {user}...")
-            process_user(user, client)
-        except KeyboardInterrupt:
-            print("\nStopped by user.")
-            break
-        except Exception as e:
-            print(f"Error processing {user}: {e}")
-            # pass
+    try:
+        collect_metrics(users, refresh=FORCE_UPDATE, graphql=args.graphql, workers=args.workers)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     main()
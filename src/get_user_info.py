@@ -1,26 +1,42 @@
-import argparse
-import requests
-import json
 import os
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
 from typing import Dict, Any, List, Optional
 from tqdm import tqdm
 
+from storage import get_storage
+from github_client import make_session
+
 # Constants
 BASE_URL = "https://oss.open-digger.cn/github"
 METRICS = [
     "openrank.json",
     "activity.json"
 ]
-
-def fetch_metric(username: str, metric: str) -> Optional[Dict[str, Any]]:
+SAVE_EVERY = 50
+# Users without a record for last month (inactive ones) are re-checked at most this often
+RECHECK_INTERVAL = 7 * 24 * 3600
+
+def expected_month(today: Optional[date] = None) -> str:
+    """Latest month OpenDigger can have published (it publishes each month's data after the month ends)."""
+    today = today or date.today()
+    return (today.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+def is_current(freshness, now: Optional[float] = None) -> bool:
+    """Whether a stored `(latest month, fetched_at)` has nothing newer to download."""
+    month, fetched_at = freshness
+    if month and month >= expected_month():
+        return True
+    return (now or time.time()) - (fetched_at or 0) < RECHECK_INTERVAL
+
+def fetch_metric(username: str, metric: str, session=None) -> Optional[Dict[str, Any]]:
     """
     Fetch a specific metric for a user.
     """
     url = f"{BASE_URL}/{username}/{metric}"
     try:
-        response = requests.get(url, timeout=10)
+        response = (session or make_session()).get(url, timeout=10)
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 404:
@@ -32,7 +48,7 @@ def fetch_metric(username: str, metric: str) -> Optional[Dict[str, Any]]:
         print(f"Error fetching {metric} for {username}: {e}")
         return None
 
-def fetch_user_data(username: str) -> Optional[Dict[str, Any]]:
+def fetch_user_data(username: str, session=None) -> Optional[Dict[str, Any]]:
     """
     Fetch all defined metrics for a single user.
     """
@@ -46,7 +62,7 @@ def fetch_user_data(username: str) -> Optional[Dict[str, Any]]:
     found_any = False
     for metric in METRICS:
         key = metric.replace(".json", "")
-        data = fetch_metric(username, metric)
+        data = fetch_metric(username, metric, session)
         if data:
             user_data[key] = data
             found_any = True
@@ -57,34 +73,36 @@ def fetch_user_data(username: str) -> Optional[Dict[str, Any]]:
     
     # We found at least some data
     user_data["status"] = "success"
+    user_data["fetched_at"] = int(time.time())
         
     return user_data
 
-def batch_fetch(users: List[str], max_workers: int = 5, output_file: str = "./_users_info.json", refresh: bool = False) -> Dict[str, Any]:
+def batch_fetch(users: List[str], max_workers: int = 5, storage=None, refresh: bool = False) -> Dict[str, Any]:
     """
     Fetch data for multiple users concurrently with progress bar and periodic saving.
+    Without `refresh` users with a record are skipped; with it, only users whose
+    record lacks the latest published month. Every checkpoint writes just the
+    users fetched since the previous one. Returns the records fetched.
     """
+    storage = storage or get_storage()
+    # Only the requested users' records are read (one shard / row each)
+    freshness = storage.macro_freshness(users)
+
+    if refresh:
+        now = time.time()
+        users_to_fetch = [u for u in users if u not in freshness or not is_current(freshness[u], now)]
+    else:
+        users_to_fetch = [u for u in users if u not in freshness]
+    print(f"Total users: {len(users)}. Up to date: {len(users) - len(users_to_fetch)}. To fetch: {len(users_to_fetch)}")
+
     results = {}
-    
-    # Load existing results if any, to avoid re-fetching (optional, but good practice)
-    if not refresh and os.path.exists(output_file):
-        try:
-            with open(output_file, 'r', encoding='utf-8') as f:
-                results = json.load(f)
-                if not isinstance(results, dict):
-                    results = {}
-        except:
-            results = {}
-
-    # Filter out users already fetched
-    users_to_fetch = [u for u in users if u not in results]
-    print(f"Total users: {len(users)}. Already fetched: {len(results)}. To fetch: {len(users_to_fetch)}")
-    
     if not users_to_fetch:
         return results
 
+    pending = {}  # fetched since the last checkpoint
+    session = make_session(pool_size=max_workers)
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_user = {executor.submit(fetch_user_data, user): user for user in users_to_fetch}
+        future_to_user = {executor.submit(fetch_user_data, user, session): user for user in users_to_fetch}
         
         # Use tqdm for progress bar
         pbar = tqdm(total=len(users_to_fetch), desc="Fetching users", unit="user")
@@ -95,7 +113,7 @@ def batch_fetch(users: List[str], max_workers: int = 5, output_file: str = "./_u
             try:
                 data = future.result()
                 if data: # Only add if data was successfully fetched (not None)
-                    results[user] = data
+                    results[user] = pending[user] = data
             except Exception as e:
                 # Log error silently or to a file, don't clutter console
                 # For failed users, we simply don't add them to results
@@ -104,29 +122,34 @@ def batch_fetch(users: List[str], max_workers: int = 5, output_file: str = "./_u
             pbar.update(1)
             count += 1
             
-            # Save every 50 users
-            if count % 50 == 0:
+            if count % SAVE_EVERY == 0 and pending:
                 try:
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        json.dump(results, f, indent=2, ensure_ascii=False)
+                    storage.save_macro_users(pending)
+                    pending = {}
                 except Exception as e:
                     pbar.write(f"Error saving checkpoint: {e}")
                     
         pbar.close()
-                
+
+    if pending:
+        storage.save_macro_users(pending)
     return results
 
+def fetch_macro_data(users: List[str], refresh: bool = False, storage=None, max_workers: int = 5) -> Dict[str, Any]:
+    """Pipeline stage: fetch OpenDigger data for `users` and upsert it into storage."""
+    storage = storage or get_storage()
+    start_time = time.time()
+    print(f"Starting batch fetch for {len(users)} users...")
+    data = batch_fetch(users, max_workers, storage, refresh=refresh)
+    duration = time.time() - start_time
+
+    print(f"\nCompleted in {duration:.2f} seconds.")
+    print(f"Data saved for {len(data)} users ({storage.backend} storage)")
+    return data
+
 def main():
     # Configuration - Hardcoded parameters
-    SRC_DIR = os.path.dirname(os.path.abspath(__file__))
-    ROOT_DIR = os.path.dirname(SRC_DIR)
-    DATA_DIR = os.path.join(ROOT_DIR, "data")
-    
-    USERS_FILE = os.path.join(DATA_DIR, "users_list.json")
-    MACRO_DATA_DIR = os.path.join(DATA_DIR, "macro_data")
-    if not os.path.exists(MACRO_DATA_DIR):
-        os.makedirs(MACRO_DATA_DIR)
-    OUTPUT_FILE = os.path.join(MACRO_DATA_DIR, "macro_data_results.json")
+    storage = get_storage()
     
     MAX_WORKERS = 5
     
@@ -139,23 +162,8 @@ def main():
     if MANUAL_USERS:
         user_list.extend(MANUAL_USERS)
     
-    # Load from file if exists
-    if USERS_FILE and os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                if USERS_FILE.endswith('.json'):
-                    loaded_data = json.load(f)
-                    if isinstance(loaded_data, list):
-                        user_list.extend(loaded_data)
-                    else:
-                        print("Warning: JSON file does not contain a list.")
-                else:
-                    user_list.extend([line.strip() for line in f if line.strip()])
-            print(f"Loaded users from {USERS_FILE}")
-        except Exception as e:
-            print(f"Error reading file {USERS_FILE}: {e}")
-    elif USERS_FILE:
-        print(f"Warning: File {USERS_FILE} not found.")
+    # Load from storage
+    user_list.extend(storage.load_users())
 
     # Remove duplicates
     user_list = list(set(user_list))
@@ -167,7 +175,6 @@ def main():
     print(f"Starting batch fetch for {len(user_list)} users...")
     print(f"Metrics to fetch: {', '.join(METRICS)}")
     
-    start_time = time.time()
     # parse refresh flag
     import argparse
     parser = argparse.ArgumentParser(add_help=False)
@@ -180,23 +187,8 @@ def main():
         user_list = [args.username]
         print(f"Single user mode: Fetching data for {args.username}")
     else:
-        # Load from file if exists
-        if USERS_FILE and os.path.exists(USERS_FILE):
-            try:
-                with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                    if USERS_FILE.endswith('.json'):
-                        loaded_data = json.load(f)
-                        if isinstance(loaded_data, list):
-                            user_list.extend(loaded_data)
-                        else:
-                            print("Warning: JSON file does not contain a list.")
-                    else:
-                        user_list.extend([line.strip() for line in f if line.strip()])
-                print(f"Loaded users from {USERS_FILE}")
-            except Exception as e:
-                print(f"Error reading file {USERS_FILE}: {e}")
-        elif USERS_FILE:
-            print(f"Warning: File {USERS_FILE} not found.")
+        # Load from storage
+        user_list.extend(storage.load_users())
 
         # Remove duplicates
         user_list = list(set(user_list))
@@ -205,17 +197,7 @@ def main():
             print("No users provided. Using default sample list.")
             user_list = ["torvalds", "frank-zsy", "X-lab2017", "yyx990803"]
 
-    print(f"Starting batch fetch for {len(user_list)} users...")
-    data = batch_fetch(user_list, MAX_WORKERS, OUTPUT_FILE, refresh=refresh)
-    duration = time.time() - start_time
-    
-    print(f"\nCompleted in {duration:.2f} seconds.")
-    
-    # Save to file
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-        
-    print(f"Data saved to {OUTPUT_FILE}")
+    fetch_macro_data(user_list, refresh=refresh, storage=storage, max_workers=MAX_WORKERS)
 
 if __name__ == "__main__":
     main()
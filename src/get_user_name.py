@@ -1,206 +1,309 @@
-import requests
 import time
-import os
-import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
 
-# (其他辅助函数 load_existing_users, save_users, fetch_page 保持不变)
+from storage import get_storage
+from github_client import get_github_client, load_config
 
-def load_existing_users(file_path):
-    # ... (保持不变)
-    if not os.path.exists(file_path):
-        return set()
-    
+# The search API returns at most 1000 results per query
+SEARCH_RESULT_LIMIT = 1000
+PER_PAGE = 100
+# Frontier ranges are sized to hold about this many users
+TARGET_PER_RANGE = 800
+MAX_STEP = 5000
+MAX_FOLLOWERS = 1_000_000
+# A single follower count with more than 1000 users is split by account creation date
+GITHUB_LAUNCH = "2007-10-01"
+SAVE_EVERY = 500          # new users between checkpoints
+SAVE_INTERVAL = 60        # seconds between checkpoints
+
+def load_existing_users(storage):
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return set(data)
-            return set()
+        return set(storage.load_users())
     except Exception as e:
-        print(f"Warning: Could not load existing file {file_path}: {e}")
+        print(f"Warning: Could not load existing users: {e}")
         return set()
 
-def save_users(users, file_path):
-    # ... (保持不变)
+def save_users(users, storage):
     sorted_users = sorted(list(users))
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(sorted_users, f, indent=2, ensure_ascii=False)
-
-def fetch_page(query, page, token, per_page=100):
-    # ... (保持不变)
-    base_url = "https://api.github.com/search/users"
-    headers = {
-        "Accept": "application/vnd.github.v3+json"
-    }
-    if token:
-        headers["Authorization"] = f"token {token}"
-        
+    storage.save_users(sorted_users)
+
+def fetch_page(query, page, client, per_page=100):
+    """One page of user search results; rate limits are handled by the shared GitHubClient."""
     params = {
         "q": query,
         "per_page": per_page,
         "page": page
     }
-    
+
     while True:
         try:
-            response = requests.get(base_url, headers=headers, params=params, timeout=10)
-            
-            # Rate Limit Handling
-            if response.status_code == 403:
-                reset_time = int(response.headers.get("X-RateLimit-Reset", 0))
-                wait_seconds = max(reset_time - time.time(), 0) + 1
-                print(f"Rate limit exceeded. Waiting for {wait_seconds:.0f} seconds...")
-                time.sleep(wait_seconds)
-                continue
-                
+            response = client.get("/search/users", params=params, timeout=10)
+
             if response.status_code == 422:
                 # 422 means we hit the >1000 results limit for this query
                 return None, 422
-                
+
             if response.status_code != 200:
                 print(f"Error: {response.status_code} - {response.text}")
                 return None, response.status_code
-            
+
             data = response.json()
             return data, 200
-            
+
         except Exception as e:
             print(f"Request error: {e}")
             time.sleep(2)
             continue
 
 
-def get_github_users_adaptive(start_followers=100, target_limit=1000, token=None, output_file="users_list.json"):
+def range_query(r):
+    query = f"followers:{r['lo']}..{r['hi']}"
+    if r.get("created"):
+        query += f" created:{r['created'][0]}..{r['created'][1]}"
+    return query
+
+def split_range(r):
+    """Two disjoint halves of a range with more than 1000 results, or None if it cannot be split."""
+    lo, hi = r["lo"], r["hi"]
+    if hi > lo:
+        mid = (lo + hi) // 2
+        return [{"lo": lo, "hi": mid}, {"lo": mid + 1, "hi": hi}]
+    start, end = r.get("created") or (GITHUB_LAUNCH, date.today().isoformat())
+    d0, d1 = date.fromisoformat(start).toordinal(), date.fromisoformat(end).toordinal()
+    if d1 <= d0:
+        return None
+    mid = (d0 + d1) // 2
+    return [
+        {"lo": lo, "hi": hi, "created": [start, date.fromordinal(mid).isoformat()]},
+        {"lo": lo, "hi": hi, "created": [date.fromordinal(mid + 1).isoformat(), end]},
+    ]
+
+
+class DiscoveryEngine:
     """
-    Adaptive slicing strategy to bypass 1000-result limit.
+    Follower-range discovery over the search API with several requests in flight.
+
+    New ranges are cut from a frontier (`next_min`, `step`) that moves up the
+    follower axis; the step follows the density seen so far so each range
+    holds about TARGET_PER_RANGE users. A range with more than 1000 results is
+    split in half (by followers, then by account creation date), and every
+    page of a valid range is its own task, so `workers` requests - spread over
+    the token pool - run at once. The frontier and the pages already done of
+    every open range are saved as a cursor next to the user list, so an
+    interrupted run resumes where it stopped.
     """
-    existing_users = load_existing_users(output_file)
-    print(f"Loaded {len(existing_users)} existing users.")
-    
-    total_fetched = 0
-    
-    # Adaptive range strategy
-    current_min = start_followers
-    current_step = 50 # Initial step guess
-    
-    while total_fetched < target_limit:
-        
-        # Ensure we don't end up with step=0
-        current_step = max(1, current_step)
-        current_max = current_min + current_step
-        
-        query = f"followers:{current_min}..{current_max}"
-        print(f"\nProbing range: {query}")
-        
-        data, status = fetch_page(query, 1, token, per_page=1)
-        
-        if status == 422:
-            print(f"Range {current_min}..{current_max} too large (hit 1000 limit). Shrinking step...")
-            current_step = max(1, current_step // 2)
-            continue
-            
-        if not data:
-            print("Failed to get data, stopping.")
-            break
-            
-        total_count = data.get("total_count", 0)
-        print(f"Range total count: {total_count}")
-        
-        if total_count > 1000:
-            
-            # === START OF CRITICAL FIX ===
-            if current_step == 1:
-                # If step is already 1, and total_count is still > 1000, 
-                # this means two consecutive follower counts (e.g., 100 and 101) 
-                # combined have > 1000 users. GitHub API won't allow fetching this.
-                # We must skip this small, dense region and move on, while increasing step for the next range.
-                print(f"CRITICAL: Range {current_min}..{current_max} is the smallest step (1) but still exceeds 1000 users. Skipping this dense range.")
-                
-                # Move to the next range immediately
-                current_min = current_max + 1
-                
-                # Try increasing step size for the next search to speed things up later
-                current_step = min(current_step * 20, 5000) 
-                continue # Skip the rest of the fetching logic for this bad range
-            
-            # If step > 1, shrink it further (original logic)
-            print(f"Range {current_min}..{current_max} has {total_count} users (>1000). Shrinking step...")
-            current_step = max(1, current_step // 2)
-            continue
-            # === END OF CRITICAL FIX ===
-            
-        # If we are here, total_count <= 1000, so we can fetch all pages safely
-        print(f"Valid range found! Fetching {total_count} users...")
-        
-        pages = (total_count // 100) + 1
-        range_users_found = 0
-        
-        for page in range(1, pages + 1):
-            data, status = fetch_page(query, page, token, per_page=100)
-            if status != 200 or not data:
-                break
-                
-            items = data.get("items", [])
-            if not items:
-                break
-                
-            for item in items:
-                username = item["login"]
-                if username not in existing_users:
-                    existing_users.add(username)
-                    total_fetched += 1
-                    range_users_found += 1
-                    
-                    if total_fetched % 500 == 0:
-                        print(f"Reached {total_fetched} new users. Saving progress...")
-                        save_users(existing_users, output_file)
-            
-            if total_fetched >= target_limit:
-                break
-            
-            time.sleep(0.5) 
-            
-        print(f"Finished range {current_min}..{current_max}. Found {range_users_found} new users.")
-        
-        # Move to next range
-        current_min = current_max + 1
-        
-        # If the last range was very sparse (or we didn't find many), we can try increasing step size
-        if total_count < 500 and current_step < 5000:
-            current_step = min(current_step * 2, 5000) 
-            
-        save_users(existing_users, output_file)
-        
-        if total_fetched >= target_limit:
+
+    def __init__(self, client, storage, start_followers=100, workers=1, max_followers=MAX_FOLLOWERS, resume=True):
+        self.client = client
+        self.storage = storage
+        self.workers = max(1, workers)
+        self.max_followers = max_followers
+        self.users = load_existing_users(storage)
+        self.queue = deque()  # ("probe" | "page", range, page)
+        self.ranges = []      # open ranges, saved in the cursor
+        self.failed = False
+
+        cursor = storage.load_discovery_cursor() if resume else None
+        if cursor and not cursor.get("ranges") and cursor.get("next_min", 0) > max_followers:
+            # A finished scan left behind by an older version; start a new pass
+            cursor = None
+        if cursor and cursor.get("start_followers") == start_followers:
+            self.next_min = cursor["next_min"]
+            self.step = cursor["step"]
+            for r in cursor.get("ranges", []):
+                self._open(r)
+            print(f"Resuming discovery at followers {self.next_min} (step {self.step}, {len(self.ranges)} open ranges).")
+        else:
+            self.next_min = start_followers
+            self.step = 50  # Initial step guess
+        self.start_followers = start_followers
+
+    def _open(self, r):
+        """Queue the remaining work of a range (a probe, or the pages not done yet)."""
+        r.setdefault("pages_done", [])
+        self.ranges.append(r)
+        if r.get("total") is None:
+            self.queue.append(("probe", r, 1))
+        else:
+            for page in range(1, self._pages(r) + 1):
+                if page not in r["pages_done"]:
+                    self.queue.append(("page", r, page))
+
+    @staticmethod
+    def _pages(r):
+        total = min(r["total"], SEARCH_RESULT_LIMIT)
+        return max(1, -(-total // PER_PAGE))
+
+    def _close(self, r):
+        if r in self.ranges:
+            self.ranges.remove(r)
+
+    def _next_task(self):
+        if self.failed:
+            # What is left stays in the cursor and is retried by the next run
+            return None
+        if self.queue:
+            return self.queue.popleft()
+        if self.next_min > self.max_followers:
+            return None
+        r = {"lo": self.next_min, "hi": self.next_min + max(1, self.step) - 1, "frontier": True}
+        self.next_min = r["hi"] + 1
+        self.ranges.append(r)
+        r["pages_done"] = []
+        return ("probe", r, 1)
+
+    def _run(self, task):
+        _, r, page = task
+        return fetch_page(range_query(r), page, self.client, per_page=PER_PAGE)
+
+    def _add(self, items):
+        new = 0
+        for item in items:
+            username = item["login"]
+            if username not in self.users:
+                self.users.add(username)
+                new += 1
+        return new
+
+    def _handle(self, task, data, status):
+        """Apply one finished request; returns the number of new users."""
+        kind, r, page = task
+        if kind == "probe" and (status == 422 or (data and data.get("total_count", 0) > SEARCH_RESULT_LIMIT)):
+            total = data.get("total_count") if data else None
+            halves = split_range(r)
+            if r.get("frontier") and total:
+                self.step = max(1, min(self.step, (r["hi"] - r["lo"] + 1) * TARGET_PER_RANGE // total))
+            elif r.get("frontier"):
+                self.step = max(1, self.step // 2)
+            if halves:
+                print(f"Range {range_query(r)} has {total or '>1000'} users. Splitting...")
+                self._close(r)
+                for half in reversed(halves):
+                    half["pages_done"] = []
+                    self.ranges.append(half)
+                    self.queue.appendleft(("probe", half, 1))
+                # The probe's own page is still a page of real users
+                return self._add(data.get("items", [])) if data else 0
+            # One follower count on one day: only the first 1000 are reachable
+            print(f"Range {range_query(r)} cannot be split further, fetching its first {SEARCH_RESULT_LIMIT} users.")
+            if not data:
+                r["total"] = SEARCH_RESULT_LIMIT
+                for extra in range(1, self._pages(r) + 1):
+                    self.queue.append(("page", r, extra))
+                return 0
+        if kind == "page" and status == 422:
+            # The result set shrank below this page since the probe
+            data = {"items": []}
+        if status not in (200, 422) or not data:
+            print(f"Failed to fetch {range_query(r)} page {page}, stopping after the requests in flight.")
+            self.failed = True
+            return 0
+
+        if kind == "probe":
+            r["total"] = data.get("total_count", 0)
+            if r.get("frontier") and r["total"] <= SEARCH_RESULT_LIMIT:
+                width = r["hi"] - r["lo"] + 1
+                self.step = max(1, min(MAX_STEP, width * TARGET_PER_RANGE // max(r["total"], 1)))
+            for extra in range(2, self._pages(r) + 1):
+                self.queue.append(("page", r, extra))
+        r["pages_done"].append(page)
+        if len(r["pages_done"]) >= self._pages(r):
+            print(f"Finished range {range_query(r)} ({r['total']} users).")
+            self._close(r)
+        return self._add(data.get("items", []))
+
+    @property
+    def finished(self):
+        """The frontier passed max_followers and every range is done."""
+        return not self.failed and not self.queue and not self.ranges and self.next_min > self.max_followers
+
+    def checkpoint(self):
+        # Users first: a cursor must never point past users that were not saved
+        save_users(self.users, self.storage)
+        if self.finished:
+            # The next run starts a new pass from start_followers, picking up users whose follower count grew
+            self.storage.clear_discovery_cursor()
+            return
+        self.storage.save_discovery_cursor({
+            "start_followers": self.start_followers,
+            "next_min": self.next_min,
+            "step": self.step,
+            "ranges": [{k: v for k, v in r.items() if k != "frontier"} for r in self.ranges],
+            "updated_at": int(time.time()),
+        })
+
+    def run(self, target_limit=1000):
+        print(f"Loaded {len(self.users)} existing users.")
+        total_new = 0
+        since_save = 0
+        last_save = time.time()
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while True:
+                    while len(in_flight) < self.workers and total_new < target_limit:
+                        task = self._next_task()
+                        if task is None:
+                            break
+                        in_flight[pool.submit(self._run, task)] = task
+                    if not in_flight:
+                        break
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = in_flight.pop(future)
+                        data, status = future.result()
+                        new = self._handle(task, data, status)
+                        total_new += new
+                        since_save += new
+                    if since_save >= SAVE_EVERY or time.time() - last_save > SAVE_INTERVAL:
+                        print(f"Reached {total_new} new users. Saving progress...")
+                        self.checkpoint()
+                        since_save, last_save = 0, time.time()
+            finally:
+                # Tasks never started stay in the cursor's open ranges
+                self.checkpoint()
+        if total_new >= target_limit:
             print("Target limit reached.")
-            break
+        elif self.finished:
+            print(f"Scanned every follower range up to {self.max_followers}; the next run starts over from {self.start_followers}.")
+        print(f"Discovery finished: {total_new} new users, {len(self.users)} in total.")
+        return total_new
 
-    return list(existing_users)
+
+def get_github_users_adaptive(start_followers=100, target_limit=1000, client=None, storage=None, workers=None, resume=True):
+    """
+    Adaptive slicing strategy to bypass 1000-result limit.
+    Ranges are probed concurrently (`workers`, default one per token) and the run resumes from the saved cursor.
+    """
+    storage = storage or get_storage()
+    client = client or get_github_client()
+    if workers is None:
+        workers = int(load_config().get("discovery_workers") or max(1, len(client.tokens)))
+    engine = DiscoveryEngine(client, storage, start_followers=start_followers, workers=workers, resume=resume)
+    engine.run(target_limit)
+    return list(engine.users)
 
 def main():
-    SRC_DIR = os.path.dirname(os.path.abspath(__file__))
-    ROOT_DIR = os.path.dirname(SRC_DIR)
-    DATA_DIR = os.path.join(ROOT_DIR, "data")
-    CONFIG_FILE = os.path.join(ROOT_DIR, "config.json")
-    OUTPUT_FILE = os.path.join(DATA_DIR, "users_list.json")
-    
-    # Load configuration
-    TOKEN = os.environ.get("GITHUB_TOKEN")
-    if not TOKEN and os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            TOKEN = config.get("github_token")
-    if not TOKEN:
-        print("Warning: config.json not found. Please create it in the root directory.")
-
-    START_FOLLOWERS = 500
-    LIMIT = 500 
-    
+    import argparse
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--start', type=int, default=500, help='Lowest follower count to search from')
+    parser.add_argument('--limit', type=int, default=500, help='New users to discover in this run')
+    parser.add_argument('--workers', type=int, help='Concurrent search requests (default: one per token)')
+    parser.add_argument('--reset', action='store_true', help='Ignore the saved cursor and start from --start')
+    args, _ = parser.parse_known_args()
+
+    client = get_github_client()
+    if not client.tokens:
+        print("Warning: no GitHub token found in config.json or the environment; search is limited to 10 requests per minute.")
+
     get_github_users_adaptive(
-        start_followers=START_FOLLOWERS, 
-        target_limit=LIMIT, 
-        token=TOKEN, 
-        output_file=OUTPUT_FILE
+        start_followers=args.start,
+        target_limit=args.limit,
+        client=client,
+        workers=args.workers,
+        resume=not args.reset,
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+"""
+Shared GitHub REST client for the pipeline scripts (and token scheduling for server.py).
+
+`GitHubClient` sends every request through one pooled `requests.Session`
+(with retries on 5xx) and asks a `TokenPool` which token to use. The pool
+reads `X-RateLimit-Remaining` / `X-RateLimit-Reset` from every response,
+per token and per rate-limit resource (core, search, graphql), and always
+hands out the token with the most budget left. A secondary rate limit
+(`Retry-After`) parks only the token that hit it; the client sleeps only
+when every token is exhausted, until the earliest reset.
+
+GET responses that carry an ETag / Last-Modified are kept in an on-disk
+`HTTPCache` (`data/http_cache/`, shared with server.py, size set by
+`github_cache_max_mb`) keyed by URL, query parameters and `Accept`. Later
+requests for the same resource are sent conditionally and a `304 Not
+Modified` - which GitHub does not count against the rate limit - is
+answered from the cache.
+
+Tokens come from `GITHUB_TOKENS` / `GITHUB_TOKEN` and config.json
+(`github_tokens` / `github_token`), merged and de-duplicated.
+"""
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from http_cache import HTTPCache
+
+# GITHUB_API_URL points the client at GitHub Enterprise or a local stub server
+GITHUB_API_BASE = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+# GraphQL lives at /graphql on github.com but at /api/graphql next to GitHub Enterprise's /api/v3
+GITHUB_GRAPHQL_URL = (os.environ.get("GITHUB_GRAPHQL_URL") or (
+    f"{GITHUB_API_BASE[:-len('/v3')]}/graphql" if GITHUB_API_BASE.endswith("/api/v3") else f"{GITHUB_API_BASE}/graphql"
+)).rstrip("/")
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+CONFIG_FILE = os.path.join(ROOT_DIR, "config.json")
+HTTP_CACHE_DIR = os.path.join(ROOT_DIR, "data", "http_cache")
+
+# Requests per window before any rate-limit header has been seen
+DEFAULT_LIMITS = {"core": 5000, "search": 30, "graphql": 5000}
+ANONYMOUS_LIMITS = {"core": 60, "search": 10, "graphql": 0}
+# GitHub asks clients to wait at least a minute after a secondary limit without Retry-After
+SECONDARY_LIMIT_WAIT = 60
+
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading config.json: {e}")
+    return {}
+
+
+def load_github_tokens(config=None):
+    """All configured tokens, environment first, without duplicates."""
+    if config is None:
+        config = load_config()
+    tokens = [t.strip() for t in (os.environ.get("GITHUB_TOKENS") or "").split(",")]
+    tokens.append(os.environ.get("GITHUB_TOKEN") or "")
+    tokens.extend(config.get("github_tokens") or [])
+    tokens.append(config.get("github_token") or "")
+    return [t for t in dict.fromkeys(t.strip() for t in tokens if t) if t]
+
+
+def rate_limit_resource(url):
+    path = urlparse(url).path
+    if path == urlparse(GITHUB_GRAPHQL_URL).path:
+        return "graphql"
+    base_path = urlparse(GITHUB_API_BASE).path
+    if base_path and path.startswith(base_path):
+        # GitHub Enterprise: /api/v3/search/... is the search resource
+        path = path[len(base_path):]
+    if path.startswith("/search/"):
+        return "search"
+    return "core"
+
+
+def cache_key_url(url, params=None):
+    """`url` with its query parameters in a stable order, so equal requests share a cache entry."""
+    if not params:
+        return url
+    query = urlencode(sorted((str(k), v) for k, v in dict(params).items()), doseq=True)
+    return f"{url}{'&' if '?' in url else '?'}{query}"
+
+
+def cached_response(entry, response):
+    """A 200 response rebuilt from a cache `entry`, for the `304` reply `response`."""
+    cached = requests.Response()
+    cached.status_code = entry.get("status") or 200
+    cached._content = (entry.get("body") or "").encode("utf-8")
+    cached.encoding = "utf-8"
+    cached.headers = response.headers
+    if entry.get("link"):
+        cached.headers["Link"] = entry["link"]
+    cached.url = response.url
+    cached.request = response.request
+    cached.from_cache = True
+    return cached
+
+
+def make_session(pool_size=20):
+    """Pooled session; 500/502/503/504 are retried 5 times with backoff."""
+    session = requests.Session()
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class TokenPool:
+    """Per-token, per-resource rate-limit budget fed by response headers. Thread-safe."""
+
+    def __init__(self, tokens):
+        # "" stands for unauthenticated requests when no token is configured
+        self.tokens = [t for t in dict.fromkeys(tokens) if t] or [""]
+        self._state = {}  # (token, resource) -> {"limit", "remaining", "reset", "blocked_until"}
+        self._lock = threading.Lock()
+
+    def _entry(self, token, resource):
+        entry = self._state.get((token, resource))
+        if entry is None:
+            limit = (DEFAULT_LIMITS if token else ANONYMOUS_LIMITS).get(resource, 60)
+            entry = self._state[(token, resource)] = {"limit": limit, "remaining": limit, "reset": 0.0, "blocked_until": 0.0}
+        return entry
+
+    def _budget(self, entry, now):
+        if entry["blocked_until"] > now:
+            return 0
+        if entry["reset"] and entry["reset"] <= now:
+            # The window rolled over since the last response
+            return entry["limit"]
+        return entry["remaining"]
+
+    def acquire(self, resource="core"):
+        """`(token, 0)` for the token with the most budget left, or `(None, seconds)` when all are exhausted."""
+        with self._lock:
+            now = time.time()
+            entries = [(t, self._entry(t, resource)) for t in self.tokens]
+            token, entry = max(entries, key=lambda te: self._budget(te[1], now))
+            if self._budget(entry, now) > 0:
+                if entry["reset"] and entry["reset"] <= now:
+                    entry["remaining"], entry["reset"] = entry["limit"], 0.0
+                # Reserve the call so concurrent threads spread across tokens
+                entry["remaining"] -= 1
+                return token, 0
+            return None, max(min(self._ready_at(e, now) for _, e in entries) - now, 1)
+
+    @staticmethod
+    def _ready_at(entry, now):
+        ready = max(entry["blocked_until"], now)
+        if entry["remaining"] <= 0:
+            ready = max(ready, entry["reset"] if entry["reset"] > now else now + SECONDARY_LIMIT_WAIT)
+        return ready
+
+    def update(self, token, resource, response):
+        """Record the rate-limit headers of `response`; True if it was rate limited and should be retried."""
+        headers = response.headers
+        now = time.time()
+        with self._lock:
+            entry = self._entry(token, resource)
+            if headers.get("X-RateLimit-Remaining") is not None:
+                try:
+                    entry["remaining"] = int(headers["X-RateLimit-Remaining"])
+                    entry["limit"] = int(headers.get("X-RateLimit-Limit") or entry["limit"])
+                    entry["reset"] = float(headers.get("X-RateLimit-Reset") or 0)
+                except ValueError:
+                    pass
+            if response.status_code not in (403, 429):
+                return False
+            retry_after = headers.get("Retry-After")
+            if retry_after:
+                try:
+                    entry["blocked_until"] = now + float(retry_after)
+                except ValueError:
+                    entry["blocked_until"] = now + SECONDARY_LIMIT_WAIT
+                return True
+            if headers.get("X-RateLimit-Remaining") == "0":
+                entry["remaining"] = 0
+                return True
+            if "rate limit" in response.text.lower():
+                entry["blocked_until"] = now + SECONDARY_LIMIT_WAIT
+                return True
+            return False
+
+    def discard(self, token):
+        """Drop a token GitHub rejected (401); falls back to unauthenticated requests when none are left."""
+        with self._lock:
+            if token and token in self.tokens:
+                print(f"GitHub token {token[:4]}... was rejected, removing it from the pool.")
+                self.tokens.remove(token)
+                if not self.tokens:
+                    self.tokens = [""]
+
+
+class RateLimiter:
+    """Token bucket shared by threads: `rate` calls per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.allowance = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call may be made; a rate of 0 or less means unlimited."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.allowance = min(self.capacity, self.allowance + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.allowance >= 1:
+                    self.allowance -= 1
+                    return
+                wait = (1 - self.allowance) / self.rate
+            time.sleep(wait)
+
+
+class GitHubClient:
+    def __init__(self, tokens=None, session=None, timeout=15, max_attempts=5, pool_size=20, cache=None):
+        """`cache` is an `HTTPCache` for conditional GETs, or None to always download."""
+        self.pool = TokenPool(load_github_tokens() if tokens is None else tokens)
+        self.session = session or make_session(pool_size)
+        self.cache = cache
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    @property
+    def tokens(self):
+        return [t for t in self.pool.tokens if t]
+
+    def request(self, method, endpoint, params=None, headers=None, json_body=None, timeout=None) -> requests.Response:
+        url = endpoint if endpoint.startswith("http") else f"{GITHUB_API_BASE}{endpoint}"
+        resource = rate_limit_resource(url)
+        errors = 0
+        while True:
+            token, wait = self.pool.acquire(resource)
+            if token is None:
+                print(f"All GitHub tokens exhausted ({resource}), waiting {wait:.0f} seconds...")
+                time.sleep(wait)
+                continue
+
+            current_headers = {"Accept": "application/vnd.github.v3+json"}
+            if token:
+                current_headers["Authorization"] = f"token {token}"
+            if headers:
+                current_headers.update(headers)
+            entry = None
+            if self.cache is not None and method == "GET":
+                accept = current_headers.get("Accept", "")
+                entry = self.cache.lookup(cache_key_url(url, params), accept)
+                current_headers.update(HTTPCache.conditional_headers(entry))
+
+            try:
+                response = self.session.request(method, url, headers=current_headers, params=params,
+                                                json=json_body, timeout=timeout or self.timeout)
+            except requests.exceptions.RequestException as e:
+                errors += 1
+                if errors >= self.max_attempts:
+                    raise
+                print(f"Request error: {e}. Retrying...")
+                time.sleep(min(2 ** errors, 30))
+                continue
+
+            if response.status_code == 401 and token:
+                self.pool.discard(token)
+                continue
+            if self.pool.update(token, resource, response):
+                continue
+            if entry is not None and response.status_code == 304:
+                return cached_response(entry, response)
+            if self.cache is not None and method == "GET" and response.status_code == 200:
+                self.cache.store(cache_key_url(url, params), accept, 200, response.headers, response.text)
+            return response
+
+    def get(self, endpoint, params=None, headers=None, timeout=None) -> requests.Response:
+        return self.request("GET", endpoint, params=params, headers=headers, timeout=timeout)
+
+    def post(self, endpoint, json_body=None, headers=None, timeout=None) -> requests.Response:
+        return self.request("POST", endpoint, headers=headers, json_body=json_body, timeout=timeout)
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_github_client():
+    """Process-wide client, so every stage shares the connection pool and the token budgets."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            config = load_config()
+            max_mb = float(config.get("github_cache_max_mb", 100))
+            cache = HTTPCache(HTTP_CACHE_DIR, max_bytes=int(max_mb * 1024 * 1024))
+            _default_client = GitHubClient(tokens=load_github_tokens(config), cache=cache)
+        return _default_client
@@ -0,0 +1,301 @@
+"""
+Batched GraphQL (v4) collection of the repository-based metrics.
+
+The REST stages page through `/users/{u}/repos` and then call `/languages`
+and `/contributors` once per repository. Here the same data comes from a few
+aliased GraphQL queries covering several users at a time:
+
+1. repos:         `uN: user(login:)` with every owned public repository
+                  (stars, forks, open issues + PRs, primary language, topics,
+                  language sizes, default branch), 100 per page.
+2. languages:     `uN: node(id:)` with the next page of a repository's
+                  languages, for the few repos with more than the 25
+                  listed in the repos query, so the language map is as
+                  complete as the REST `/languages` one.
+3. contributions: `uN: nodes(ids:)` with the number of default-branch commits
+                  authored by the user in each repository (what the REST
+                  `/contributors` count reports).
+
+The results are written in the REST layouts: the shared repo list
+(`raw_users/<u>/repos.json`, see user_repos.py) that the influence and
+diversity metrics are computed from, and `representative_repos.json`.
+Events-based dimensions have no GraphQL equivalent and stay on REST.
+
+Query size follows the `rateLimit` block returned with every query: the
+points one alias cost last time bound how many aliases go into the next
+query (at most `graphql_max_query_cost` points, never more than the token
+has left). Queries that time out or exceed GitHub's node limits are split
+in half and retried. Queries go to `GITHUB_GRAPHQL_URL` (`/api/graphql` on
+GitHub Enterprise). Point `GITHUB_API_URL` at a stub server that replays
+recorded responses to run the collector offline.
+"""
+import json
+import time
+
+from github_client import GITHUB_API_BASE, GITHUB_GRAPHQL_URL, get_github_client, load_config
+from storage import get_storage, DIMENSIONS
+from user_repos import save_user_repos
+from fetch_representative_repos import build_repo_entry
+
+REPO_FRAGMENT = """
+fragment RepoFields on Repository {
+  id name nameWithOwner url description isFork isArchived stargazerCount forkCount diskUsage pushedAt
+  owner { login }
+  primaryLanguage { name }
+  defaultBranchRef { name }
+  issues(states: OPEN) { totalCount }
+  pullRequests(states: OPEN) { totalCount }
+  repositoryTopics(first: 20) { nodes { topic { name } } }
+  languages(first: 25, orderBy: {field: SIZE, direction: DESC}) { pageInfo { hasNextPage endCursor } edges { size node { name } } }
+}
+"""
+RATE_LIMIT_FIELDS = "rateLimit { cost remaining resetAt limit }"
+# Errors that mean "this query was too big", not "this user is broken"
+SPLIT_ERRORS = {"MAX_NODE_LIMIT_EXCEEDED", "RESOURCE_LIMITS_EXCEEDED"}
+NODES_PER_ALIAS = 100
+
+
+def repos_query(units):
+    """`units` are `(login, cursor)`; alias `uN` lists one page of the user's repos."""
+    parts = []
+    for i, (login, cursor) in enumerate(units):
+        after = f", after: {json.dumps(cursor)}" if cursor else ""
+        parts.append(
+            f"u{i}: user(login: {json.dumps(login)}) {{ id login "
+            f"repositories(first: 100{after}, ownerAffiliations: OWNER, privacy: PUBLIC, "
+            f"orderBy: {{field: PUSHED_AT, direction: DESC}}) "
+            f"{{ pageInfo {{ hasNextPage endCursor }} nodes {{ ...RepoFields }} }} }}"
+        )
+    return "query {\n" + RATE_LIMIT_FIELDS + "\n" + "\n".join(parts) + "\n}\n" + REPO_FRAGMENT
+
+
+def languages_query(units):
+    """`units` are `(login, repo_id, cursor)`; alias `uN` lists the next 100 languages of one repo."""
+    parts = []
+    for i, (_, repo_id, cursor) in enumerate(units):
+        parts.append(
+            f"u{i}: node(id: {json.dumps(repo_id)}) {{ ... on Repository {{ "
+            f"languages(first: 100, after: {json.dumps(cursor)}, orderBy: {{field: SIZE, direction: DESC}}) "
+            f"{{ pageInfo {{ hasNextPage endCursor }} edges {{ size node {{ name }} }} }} }} }}"
+        )
+    return "query {\n" + RATE_LIMIT_FIELDS + "\n" + "\n".join(parts) + "\n}"
+
+
+def contributions_query(units):
+    """`units` are `(login, user_id, repo_ids)`; alias `uN` counts the user's commits per repo."""
+    parts = []
+    for i, (_, user_id, repo_ids) in enumerate(units):
+        parts.append(
+            f"u{i}: nodes(ids: {json.dumps(repo_ids)}) {{ ... on Repository {{ nameWithOwner "
+            f"defaultBranchRef {{ target {{ ... on Commit {{ history(first: 1, author: {{id: {json.dumps(user_id)}}}) "
+            f"{{ totalCount }} }} }} }} }} }}"
+        )
+    return "query {\n" + RATE_LIMIT_FIELDS + "\n" + "\n".join(parts) + "\n}"
+
+
+def rest_repo(node):
+    """A GraphQL repository node in the REST `/users/{u}/repos` field names."""
+    full_name = node.get("nameWithOwner")
+    language_conn = node.get("languages") or {}
+    languages = {e["node"]["name"]: e["size"] for e in language_conn.get("edges", [])}
+    language_page = language_conn.get("pageInfo") or {}
+    return {
+        "name": node.get("name"),
+        "full_name": full_name,
+        "owner": {"login": (node.get("owner") or {}).get("login")},
+        "html_url": node.get("url"),
+        "description": node.get("description"),
+        "fork": bool(node.get("isFork")),
+        "archived": bool(node.get("isArchived")),
+        "language": (node.get("primaryLanguage") or {}).get("name"),
+        "topics": [t["topic"]["name"] for t in (node.get("repositoryTopics") or {}).get("nodes", [])],
+        "stargazers_count": node.get("stargazerCount") or 0,
+        "forks_count": node.get("forkCount") or 0,
+        # REST counts open pull requests as issues too
+        "open_issues_count": (node.get("issues") or {}).get("totalCount", 0)
+                             + (node.get("pullRequests") or {}).get("totalCount", 0),
+        "size": node.get("diskUsage"),
+        "default_branch": (node.get("defaultBranchRef") or {}).get("name"),
+        "languages_url": f"{GITHUB_API_BASE}/repos/{full_name}/languages",
+        "pushed_at": node.get("pushedAt"),
+        # Not part of the REST listing; used for representative_repos
+        "node_id": node.get("id"),
+        "languages": languages,
+        # Set while more languages remain to be fetched (see fetch_languages)
+        "languages_cursor": language_page.get("endCursor") if language_page.get("hasNextPage") else None,
+    }
+
+
+class GraphQLCollector:
+    def __init__(self, client=None, max_aliases=None, max_query_cost=None):
+        config = load_config()
+        self.client = client or get_github_client()
+        self.max_aliases = max(1, int(max_aliases or config.get("graphql_users_per_query", 20)))
+        self.max_query_cost = float(max_query_cost or config.get("graphql_max_query_cost", 50))
+        self.batch_size = self.max_aliases
+        self.unit_cost = None  # points per alias in the last query
+        self.remaining = None  # points the last token had left
+        self.queries = 0
+        self.points = 0
+
+    def next_batch_size(self):
+        size = self.batch_size
+        if self.unit_cost:
+            size = min(size, int(self.max_query_cost // self.unit_cost))
+            if self.remaining is not None:
+                size = min(size, int(self.remaining // self.unit_cost))
+        return max(1, size)
+
+    def query(self, query):
+        """`(data, cost)` of a query, or None if it was too big and should be split."""
+        while True:
+            response = self.client.post(GITHUB_GRAPHQL_URL, json_body={"query": query}, timeout=60)
+            if response.status_code in (502, 504):
+                # GitHub answers queries that hit its 10 s execution limit with 502
+                return None
+            if response.status_code != 200:
+                raise RuntimeError(f"GraphQL request failed: {response.status_code} {response.text[:200]}")
+            payload = response.json()
+            errors = payload.get("errors") or []
+            types = {e.get("type") for e in errors}
+            if "RATE_LIMITED" in types:
+                # The client parked this token from the response headers; retry picks another or waits
+                print("GraphQL rate limit hit, retrying...")
+                time.sleep(1)
+                continue
+            if types & SPLIT_ERRORS:
+                return None
+            data = payload.get("data")
+            if data is None:
+                if any("timeout" in (e.get("message") or "").lower() for e in errors):
+                    return None
+                raise RuntimeError(f"GraphQL query failed: {errors[:1]}")
+            rate = data.pop("rateLimit", None) or {}
+            cost = rate.get("cost") or 1
+            self.queries += 1
+            self.points += cost
+            if rate.get("remaining") is not None:
+                self.remaining = rate["remaining"]
+            return data, cost
+
+    def run_batched(self, units, build_query, handle):
+        """Run `units` through aliased queries; `handle(unit, result)` may return follow-up units."""
+        queue = list(units)
+        while queue:
+            n = min(self.next_batch_size(), len(queue))
+            chunk = queue[:n]
+            result = self.query(build_query(chunk))
+            if result is None:
+                if n > 1:
+                    self.batch_size = max(1, n // 2)
+                    continue
+                print(f"GraphQL query for {chunk[0][0]} is too large even on its own, skipping.")
+                handle(chunk[0], None)
+                queue = queue[1:]
+                continue
+            data, cost = result
+            queue = queue[n:]
+            self.unit_cost = cost / n
+            # Grow back after a split once queries succeed again
+            self.batch_size = min(self.max_aliases, self.batch_size * 2)
+            for i, unit in enumerate(chunk):
+                queue.extend(handle(unit, data.get(f"u{i}")) or [])
+
+    def fetch_repos(self, logins):
+        """`{login: {"id", "repos": [...]}}` for the users that exist; repos in REST field names."""
+        users = {}
+        failed = set()
+
+        def handle(unit, user):
+            login, _ = unit
+            if user is None:
+                failed.add(login)
+                return []
+            entry = users.setdefault(login, {"id": user.get("id"), "repos": []})
+            connection = user.get("repositories") or {}
+            entry["repos"].extend(rest_repo(node) for node in connection.get("nodes") or [] if node)
+            page_info = connection.get("pageInfo") or {}
+            if page_info.get("hasNextPage"):
+                return [(login, page_info.get("endCursor"))]
+            return []
+
+        self.run_batched([(login, None) for login in logins], repos_query, handle)
+        for login in failed:
+            users.pop(login, None)
+        return users
+
+    def fetch_languages(self, users):
+        """Complete the `languages` of repos that have more than the first page (as returned by `fetch_repos`)."""
+        units = [(login, r["node_id"], r["languages_cursor"])
+                 for login, entry in users.items() for r in entry["repos"] if r.get("languages_cursor")]
+
+        def handle(unit, node):
+            login, repo_id, _ = unit
+            repo = next(r for r in users[login]["repos"] if r.get("node_id") == repo_id)
+            repo["languages_cursor"] = None
+            connection = (node or {}).get("languages") or {}
+            for edge in connection.get("edges") or []:
+                repo["languages"][edge["node"]["name"]] = edge["size"]
+            page_info = connection.get("pageInfo") or {}
+            if page_info.get("hasNextPage"):
+                repo["languages_cursor"] = page_info.get("endCursor")
+                return [(login, repo_id, page_info.get("endCursor"))]
+            return []
+
+        if units:
+            self.run_batched(units, languages_query, handle)
+
+    def fetch_contributions(self, users):
+        """Fill `contributions_by_user` on every repo of `users` (as returned by `fetch_repos`)."""
+        units = []
+        for login, entry in users.items():
+            ids = [r["node_id"] for r in entry["repos"] if r.get("node_id")]
+            for start in range(0, len(ids), NODES_PER_ALIAS):
+                units.append((login, entry["id"], ids[start:start + NODES_PER_ALIAS]))
+            for repo in entry["repos"]:
+                repo["contributions_by_user"] = 0
+
+        def handle(unit, nodes):
+            login = unit[0]
+            by_name = {r["full_name"]: r for r in users[login]["repos"]}
+            for node in nodes or []:
+                repo = by_name.get((node or {}).get("nameWithOwner"))
+                target = ((node or {}).get("defaultBranchRef") or {}).get("target") or {}
+                if repo is not None:
+                    repo["contributions_by_user"] = (target.get("history") or {}).get("totalCount", 0)
+            return []
+
+        self.run_batched(units, contributions_query, handle)
+
+
+def collect_repo_data(users, client=None, refresh=False, storage=None, collector=None):
+    """Fetch repo lists and representative repos for `users` via GraphQL; returns the users collected.
+
+    Users that already have all dimensions and representative repos are
+    skipped unless `refresh`. Users GraphQL could not fetch are left to the
+    REST stages.
+    """
+    storage = storage or get_storage()
+    collector = collector or GraphQLCollector(client)
+    pending = [u for u in users if refresh or not storage.has_dimensions(u, DIMENSIONS)
+               or not storage.has_user_document(u, "representative_repos")]
+    if not pending:
+        return set()
+
+    print(f"Collecting repositories for {len(pending)} users via GraphQL...")
+    start = time.time()
+    fetched_at = time.time()
+    collected = collector.fetch_repos(pending)
+    collector.fetch_languages(collected)
+    collector.fetch_contributions(collected)
+
+    for login, entry in collected.items():
+        repos = entry["repos"]
+        save_user_repos(login, repos, storage, fetched_at)
+        representative = [build_repo_entry(r, r["languages"], r["contributions_by_user"]) for r in repos]
+        representative.sort(key=lambda x: x['stars'], reverse=True)
+        storage.save_user_document(login, "representative_repos", representative)
+
+    print(f"GraphQL: {len(collected)}/{len(pending)} users in {collector.queries} queries "
+          f"({collector.points} points, {time.time() - start:.1f}s).")
+    return set(collected)
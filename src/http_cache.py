@@ -0,0 +1,83 @@
+"""
+On-disk cache of HTTP responses with their validators (ETag / Last-Modified).
+
+Callers send `conditional_headers(entry)` with the next request for the same
+URL; on `304 Not Modified` the stored body is reused. GitHub does not count
+304 responses against the rate limit, so revalidating is free. Entries are
+keyed by URL plus the `Accept` header (raw README vs. JSON) and the
+directory is kept under `max_bytes` with LRU eviction.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from report_cache import evict_lru
+
+# Eviction walks the whole directory, so it only runs every N stores
+EVICT_EVERY = 100
+
+
+class HTTPCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 100 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._stores = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, url: str, accept: str = "") -> str:
+        key = hashlib.sha256(f"{accept}\0{url}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def lookup(self, url: str, accept: str = ""):
+        """Stored entry `{"etag", "last_modified", "status", "body"}` (plus `"link"` if paginated) or None."""
+        if not self.enabled:
+            return None
+        path = self._path(url, accept)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry) -> dict:
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, accept: str, status: int, headers, body: str):
+        """Store a response if it carries a validator; `headers` is any case-insensitive mapping."""
+        if not self.enabled:
+            return
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if not etag and not last_modified:
+            return
+        path = self._path(url, accept)
+        entry = {"url": url, "etag": etag, "last_modified": last_modified, "status": status, "body": body}
+        if headers.get("link"):
+            # Pagination links, which a 304 reply does not repeat
+            entry["link"] = headers.get("link")
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                self._stores += 1
+                if self._stores % EVICT_EVERY == 1:
+                    evict_lru(self.cache_dir, self.max_bytes)
+            except OSError as e:
+                print(f"Failed to cache response for {url}: {e}")
@@ -0,0 +1,48 @@
+"""
+Shared pooled async HTTP clients for the server's outbound calls.
+
+One `httpx.AsyncClient` per upstream service (GitHub API, avatar CDN, LLM,
+embeddings, MaxKB) keeps connections alive between requests. Because every
+service talks to a single host, the per-client connection limit is
+effectively a per-host limit, and each service gets its own timeouts (MaxKB
+runs can take minutes, GitHub calls should fail fast).
+"""
+import httpx
+
+# service -> (connect, read) timeout in seconds
+SERVICE_TIMEOUTS = {
+    "github": (10, 20),
+    "avatars": (10, 20),
+    "llm": (10, 120),
+    "embeddings": (10, 30),
+    "maxkb": (10, 300),
+}
+DEFAULT_TIMEOUT = (10, 30)
+
+
+class AsyncHTTPClients:
+    def __init__(self, max_connections_per_host: int = 20, max_keepalive: int = 10, timeouts=None):
+        self.limits = httpx.Limits(
+            max_connections=max(1, int(max_connections_per_host)),
+            max_keepalive_connections=max(1, int(max_keepalive)),
+        )
+        self.timeouts = dict(SERVICE_TIMEOUTS, **(timeouts or {}))
+        self._clients = {}
+
+    def get(self, service: str) -> httpx.AsyncClient:
+        """The pooled client for `service`, created on first use inside the running event loop."""
+        client = self._clients.get(service)
+        if client is None or client.is_closed:
+            connect, read = self.timeouts.get(service, DEFAULT_TIMEOUT)
+            client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=httpx.Timeout(read, connect=connect),
+                follow_redirects=True,
+            )
+            self._clients[service] = client
+        return client
+
+    async def aclose(self):
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
@@ -0,0 +1,220 @@
+"""
+Bounded job queue for on-demand user mining.
+
+A fixed pool of worker threads runs the pipeline for one username at a time
+each, so a burst of unknown-profile visits queues up instead of forking a
+pipeline per request. Jobs are deduplicated per username, ordered by priority
+(interactive before batch, then oldest first), and their state - including
+per-step progress - lives in a small SQLite database so it survives restarts
+and is visible to every server worker.
+
+A running job is leased: the process running it is recorded as its `owner`
+and refreshes `heartbeat_at` every HEARTBEAT_INTERVAL seconds. Only jobs
+whose lease has expired (owner crashed or was stopped) are re-queued, so a
+second server process sharing the database never re-runs a live job.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+ACTIVE_STATES = ("queued", "running")
+POLL_INTERVAL = 5.0
+HEARTBEAT_INTERVAL = 30.0
+# A running job whose heartbeat is older than this is considered abandoned
+LEASE_TIMEOUT = 120.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mining_jobs (
+    username    TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    priority    INTEGER NOT NULL,
+    steps       TEXT NOT NULL DEFAULT '[]',
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    owner       TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_mining_jobs_queue ON mining_jobs (status, priority, created_at);
+"""
+
+
+class MiningQueue:
+    def __init__(self, db_path: str, runner, workers: int = 2, max_pending: int = 100):
+        """`runner(username, on_step)` mines one user and returns True on success.
+
+        `on_step(index, total, description, state)` is called by the runner as
+        each pipeline step starts ("running") and ends ("done" / "failed").
+        """
+        self.db_path = db_path
+        self.runner = runner
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._threads = []
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(mining_jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE mining_jobs ADD COLUMN {column} {kind}")
+        # Unique per process (and per queue), so leases of other processes are never touched
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._heartbeat = None
+
+    def start(self):
+        with self._lock:
+            self._requeue_expired()
+            self._stopping = False
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="mining-heartbeat", daemon=True)
+            self._heartbeat.start()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"mining-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _requeue_expired(self):
+        """Re-queue running jobs whose owner stopped renewing the lease (caller holds the lock)."""
+        requeued = self._conn.execute(
+            "UPDATE mining_jobs SET status = 'queued', started_at = NULL, owner = NULL, heartbeat_at = NULL "
+            "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+            (time.time() - LEASE_TIMEOUT,),
+        ).rowcount
+        if requeued:
+            print(f"Re-queued {requeued} mining job(s) whose worker stopped.")
+
+    def _heartbeat_loop(self):
+        # Keeps running after stop(): jobs still finishing in daemon threads keep their lease
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                self._conn.execute("UPDATE mining_jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+                                   (time.time(), self.owner))
+
+    def stop(self):
+        """Stop taking new jobs; a job already running finishes in its daemon thread (or is re-queued once its lease expires)."""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+        self._threads = []
+
+    def submit(self, username: str, priority: int = PRIORITY_BATCH):
+        """Queue a job for `username`; returns its status dict, or None if the queue is full.
+
+        A user who is already queued or running keeps their job (raised to the
+        higher priority if needed) instead of getting a second one.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT status, priority FROM mining_jobs WHERE username = ?", (username,)).fetchone()
+            if row and row["status"] in ACTIVE_STATES:
+                if priority < row["priority"]:
+                    self._conn.execute("UPDATE mining_jobs SET priority = ? WHERE username = ?", (priority, username))
+            else:
+                pending = self._conn.execute("SELECT COUNT(*) FROM mining_jobs WHERE status = 'queued'").fetchone()[0]
+                if pending >= self.max_pending:
+                    return None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO mining_jobs (username, status, priority, steps, error, created_at, started_at, finished_at) "
+                    "VALUES (?, 'queued', ?, '[]', NULL, ?, NULL, NULL)",
+                    (username, priority, now),
+                )
+                self._wakeup.notify()
+            return self._status_locked(username)
+
+    def status(self, username: str):
+        """`{"username", "status", "steps", ...}` for the user's latest job, or None if never queued."""
+        with self._lock:
+            return self._status_locked(username)
+
+    def _status_locked(self, username):
+        row = self._conn.execute("SELECT * FROM mining_jobs WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["steps"] = json.loads(job["steps"] or "[]")
+        if job["status"] == "queued":
+            job["position"] = self._conn.execute(
+                "SELECT COUNT(*) FROM mining_jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND created_at < ?))",
+                (job["priority"], job["priority"], job["created_at"]),
+            ).fetchone()[0] + 1
+        return job
+
+    def _next_job(self):
+        with self._lock:
+            while not self._stopping:
+                # Jobs of a process that died are picked up without waiting for a restart
+                self._requeue_expired()
+                row = self._conn.execute(
+                    "SELECT username FROM mining_jobs WHERE status = 'queued' ORDER BY priority, created_at LIMIT 1"
+                ).fetchone()
+                if row:
+                    # Conditional claim, so two server processes sharing the database never take the same job
+                    now = time.time()
+                    claimed = self._conn.execute(
+                        "UPDATE mining_jobs SET status = 'running', started_at = ?, owner = ?, heartbeat_at = ? "
+                        "WHERE username = ? AND status = 'queued'",
+                        (now, self.owner, now, row["username"]),
+                    ).rowcount
+                    if claimed:
+                        return row["username"]
+                    continue
+                # Jobs queued by another process do not notify us, so poll as well
+                self._wakeup.wait(POLL_INTERVAL)
+            return None
+
+    def _set_steps(self, username, steps):
+        with self._lock:
+            self._conn.execute("UPDATE mining_jobs SET steps = ?, heartbeat_at = ? WHERE username = ? AND owner = ?",
+                               (json.dumps(steps, ensure_ascii=False), time.time(), username, self.owner))
+
+    def _worker(self):
+        while True:
+            username = self._next_job()
+            if username is None:
+                return
+            steps = []
+
+            def on_step(index, total, description, state):
+                while len(steps) < total:
+                    steps.append({"step": len(steps) + 1, "description": None, "status": "pending", "duration": None})
+                step = steps[index]
+                step["description"] = description
+                step["status"] = state
+                if state == "running":
+                    step["started_at"] = time.time()
+                elif step.get("started_at"):
+                    step["duration"] = round(time.time() - step.pop("started_at"), 1)
+                self._set_steps(username, steps)
+
+            print(f"Starting background mining for {username}")
+            error = None
+            try:
+                ok = self.runner(username, on_step)
+                if not ok:
+                    error = "Pipeline step failed"
+            except Exception as e:
+                error = str(e)
+            status = "failed" if error else "done"
+            print(f"Mining for {username} {'failed: ' + error if error else 'completed.'}")
+            with self._lock:
+                # A job whose lease expired meanwhile belongs to whoever re-claimed it
+                self._conn.execute(
+                    "UPDATE mining_jobs SET status = ?, error = ?, finished_at = ?, owner = NULL "
+                    "WHERE username = ? AND owner = ?",
+                    (status, error, time.time(), username, self.owner),
+                )
@@ -0,0 +1,124 @@
+"""
+On-disk cache of generated reports (MaxKB analyses, repo summaries).
+
+Reports are keyed by a hash of their inputs, e.g. the three
+`generate_payload` strings plus the agent configuration, so a user's cached
+report goes stale by itself as soon as re-mining changes any of their
+underlying data. Entries live in `<cache_dir>/<hash of name>/<key>.json`,
+where `name` is a username or `owner/repo` (hashed, so a name can never point
+outside `cache_dir`); storing a new report for a name drops its older ones,
+and the whole directory is kept under `max_bytes` by evicting the least
+recently used files.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def report_key(inputs_data: dict, agent_config=()) -> str:
+    h = hashlib.sha256()
+    for name in ("tech_hunter_payload", "code_auditor_payload", "six_dimension_payload"):
+        h.update(name.encode("utf-8") + b"\0" + (inputs_data.get(name) or "").encode("utf-8") + b"\0")
+    for item in agent_config:
+        h.update(str(item).encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+
+class ReportCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 200 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _name_dir(self, name: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(name.encode("utf-8")).hexdigest())
+
+    def _path(self, name: str, key: str) -> str:
+        if not all(c in "0123456789abcdef" for c in key):
+            raise ValueError(f"Invalid cache key: {key!r}")
+        return os.path.join(self._name_dir(name), f"{key}.json")
+
+    def _inside(self, path: str) -> bool:
+        root = os.path.realpath(self.cache_dir)
+        return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+    def _clear(self, name_dir: str, keep=None):
+        """Remove the cached files of one name directory, never anything outside `cache_dir`."""
+        if not os.path.isdir(name_dir) or not self._inside(name_dir):
+            return
+        for entry in os.listdir(name_dir):
+            path = os.path.join(name_dir, entry)
+            if entry != keep and os.path.isfile(path) and self._inside(path):
+                os.remove(path)
+
+    def get(self, name: str, key: str):
+        if not self.enabled:
+            return None
+        try:
+            path = self._path(name, key)
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)  # mtime doubles as the LRU clock
+        except (OSError, ValueError):
+            return None
+        return entry.get("report")
+
+    def put(self, name: str, key: str, report):
+        if not self.enabled:
+            return
+        path = self._path(name, key)
+        name_dir = os.path.dirname(path)
+        with self._lock:
+            try:
+                os.makedirs(name_dir, exist_ok=True)
+                # Reports for older inputs of this name can never be hit again
+                self._clear(name_dir, keep=f"{key}.json")
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"name": name, "created_at": int(time.time()), "report": report},
+                              f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+                evict_lru(self.cache_dir, self.max_bytes)
+            except OSError as e:
+                print(f"Failed to cache report for {name}: {e}")
+
+    def invalidate(self, name: str):
+        with self._lock:
+            try:
+                self._clear(self._name_dir(name))
+            except OSError as e:
+                print(f"Failed to invalidate cached reports for {name}: {e}")
+
+
+def evict_lru(cache_dir: str, max_bytes: int):
+    """Delete the least recently used (oldest mtime) files until `cache_dir` fits in `max_bytes`."""
+    files = []
+    total = 0
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return
+    files.sort()
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            if not os.listdir(os.path.dirname(path)):
+                os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
@@ -1,92 +1,117 @@
-import subprocess
 import os
 import sys
 import time
 import argparse
-import json
 
-def run_step(script_name, description, username=None):
-    """Run a python script located in the same directory as this runner."""
+from storage import get_storage
+
+def run_step(stage, description):
+    """Run one pipeline stage (a function call) and report whether it succeeded."""
     print(f"\n{'='*60}")
     print(f"STEP: {description}")
-    print(f"Running: {script_name}")
     print(f"{'='*60}\n")
-    
-    # Get absolute path of the script to run
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    script_path = os.path.join(current_dir, script_name)
-    
-    if not os.path.exists(script_path):
-        print(f"Error: Script {script_name} not found at {script_path}")
-        return False
-        
+
     start_time = time.time()
     try:
-        # Use the same python interpreter as the current process
-        cmd = [sys.executable, script_path]
-        if username and script_name != "calculate_radar.py" and script_name != "get_user_name.py":
-            cmd.extend(["--username", username])
-            
-        result = subprocess.run(cmd, check=True)
+        result = stage()
+        if result is False:
+            raise RuntimeError("stage reported failure")
         duration = time.time() - start_time
         print(f"\n>>> Step '{description}' completed in {duration:.1f}s.")
         return True
-    except subprocess.CalledProcessError as e:
-        print(f"\n!!! Step '{description}' failed with exit code {e.returncode}.")
-        return False
     except KeyboardInterrupt:
         print("\nInterrupted by user.")
         return False
+    except Exception as e:
+        print(f"\n!!! Step '{description}' failed: {e}")
+        return False
 
 def add_user_to_list(username):
-    """Add user to users_list.json if not present"""
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    root_dir = os.path.dirname(current_dir)
-    data_dir = os.path.join(root_dir, "data")
-    users_file = os.path.join(data_dir, "users_list.json")
-    
-    users = []
-    if os.path.exists(users_file):
-        with open(users_file, 'r', encoding='utf-8') as f:
-            try:
-                users = json.load(f)
-            except:
-                users = []
-    
-    if username not in users:
-        print(f"Adding {username} to {users_file}")
-        users.append(username)
-        with open(users_file, 'w', encoding='utf-8') as f:
-            json.dump(users, f, indent=2)
+    """Add user to the users list if not present"""
+    if get_storage().add_user(username):
+        print(f"Adding {username} to users list")
+
+def run_pipeline(username=None, on_step=None, refresh=None, graphql=False):
+    """Run every pipeline step in order; `on_step(index, total, description, state)` reports progress.
+
+    Stages are called in-process: they share one storage instance, one pooled
+    GitHub client and the radar scores computed along the way. With `graphql`
+    the metrics stage also collects representative repos, so step 6 only
+    handles the users GraphQL could not fetch.
+    """
+    # Imported here so `import run_pipeline` stays cheap for the server
+    import get_user_name
+    from get_user_info import fetch_macro_data
+    import get_all_metrics
+    from calculate_radar import update_radar
+    import fetch_tech_stack_context
+    import fetch_representative_repos
+    from generate_developer_vectors import generate_developer_vectors
+    from github_client import get_github_client
 
-def run_pipeline(username=None):
     print("Starting OpenScout Data Pipeline...")
+    if refresh is None:
+        refresh = os.environ.get('REFRESH_DATA') in ('1', 'true', 'True')
+    storage = get_storage()
     if username:
         print(f"Target User: {username}")
         add_user_to_list(username)
     else:
         print("Target: All users in users_list.json")
-    
-    # Define steps: (script_name, description)
+
+    def target_users():
+        # Resolved per stage: discovery may have grown the list
+        return [username] if username else storage.load_users()
+
+    # One pooled client: every stage shares its connections and the per-token rate-limit budgets
+    client = get_github_client()
+    # Repo lists are fetched once per run (raw_users/<user>/repos.json) and reused by later stages;
+    # the run's own start time, not a process global, so concurrent runs in the server stay apart
+    context = {"run_started_at": time.time()}
+
+    def metrics_stage():
+        context["graphql_users"] = get_all_metrics.collect_metrics(target_users(), client, refresh=refresh, graphql=graphql,
+                                                                run_started_at=context["run_started_at"])
+
+    def radar_stage():
+        # Single-user runs score against the population snapshot instead of rescoring everyone
+        context["radar_scores"] = update_radar(username, refresh=refresh, storage=storage)
+        return context["radar_scores"] is not None
+
+    def tech_stack_stage():
+        if not client.tokens:
+            print("No tokens found. Skipping.")
+            return
+        fetch_tech_stack_context.fetch_tech_stacks(target_users(), client, refresh=refresh, storage=storage,
+                                                   run_started_at=context["run_started_at"])
+
+    # Define steps: (stage, description)
     steps = [
-        ("get_user_info.py", "2. Metric Agent: Fetching OpenDigger Data (OpenRank & Activity)"),
-        ("get_all_metrics.py", "3. Metric Agent: Fetching 6-Dimension Raw Metrics"),
-        ("calculate_radar.py", "4. Analysis Agent: Calculating Radar Scores"),
-        ("fetch_tech_stack_context.py", "5. Context Agent: Fetching Tech Stack Context (Optional)"),
-        ("fetch_representative_repos.py", "6. Context Agent: Fetching Representative Repos (Optional)"),
-        ("generate_developer_vectors.py", "7. Vector Agent: Generating Developer Vectors")  # New step for smart search
+        (lambda: fetch_macro_data(target_users(), refresh=refresh, storage=storage), "2. Metric Agent: Fetching OpenDigger Data (OpenRank & Activity)"),
+        (metrics_stage, "3. Metric Agent: Fetching 6-Dimension Raw Metrics"),
+        (radar_stage, "4. Analysis Agent: Calculating Radar Scores"),
+        (tech_stack_stage, "5. Context Agent: Fetching Tech Stack Context (Optional)"),
+        (lambda: fetch_representative_repos.fetch_representative_repos(
+            [u for u in target_users() if u not in context.get("graphql_users", ())], refresh=refresh, client=client,
+            run_started_at=context["run_started_at"]),
+         "6. Context Agent: Fetching Representative Repos (Optional)"),
+        (lambda: generate_developer_vectors(username, refresh, radar_scores=context.get("radar_scores")),
+         "7. Vector Agent: Generating Developer Vectors")  # New step for smart search
     ]
     
     # If not running for specific user, include discovery
     if not username:
-        steps.insert(0, ("get_user_name.py", "1. Scout Agent: Discovering Users"))
+        steps.insert(0, (get_user_name.main, "1. Scout Agent: Discovering Users"))
 
-    for script, desc in steps:
-        success = run_step(script, desc, username)
+    for i, (stage, desc) in enumerate(steps):
+        if on_step:
+            on_step(i, len(steps), desc, "running")
+        success = run_step(stage, desc)
+        if on_step:
+            on_step(i, len(steps), desc, "done" if success else "failed")
         if not success:
             print("\nPipeline stopped due to error or interruption.")
-            # If we are running as a subprocess (imported), we might not want to exit the whole process
-            # But here we are a script or subprocess, so exit code matters
+            # Only the CLI exits; callers such as the server's mining queue get False back
             if __name__ == "__main__":
                 sys.exit(1)
             else:
@@ -100,9 +125,11 @@ def run_pipeline(username=None):
 def main():
     parser = argparse.ArgumentParser(description="OpenScout Data Pipeline")
     parser.add_argument("--username", help="Run pipeline for a specific user only")
+    parser.add_argument("--refresh", action="store_true", help="Re-fetch data that already exists")
+    parser.add_argument("--graphql", action="store_true", help="Collect repository data with batched GraphQL queries")
     args = parser.parse_args()
-    
-    run_pipeline(args.username)
+
+    run_pipeline(args.username, refresh=args.refresh or None, graphql=args.graphql)
 
 if __name__ == "__main__":
     main()
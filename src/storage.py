@@ -0,0 +1,793 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storage layer shared by server.py and the pipeline scripts.
+
+Two interchangeable backends expose the same methods:
+
+* `JSONStorage` (default): the original file tree under `data/`
+  (`users_list.json`, `radar_scores.json` (plus `radar_scores/<user>.json` for
+  users scored incrementally since the last full pass), `radar_stats.json`,
+  `discovery_cursor.json`,
+  `macro_data/users/<user>.json` (one OpenDigger shard per user; the older
+  combined `macro_data/macro_data_results.json` is still read) and
+  `raw_users/<user>/*.json`).
+* `SQLiteStorage`: a single `data/openscout.db` with indexed tables for users,
+  dimension metrics, radar scores, monthly OpenRank/activity, repos, per-user
+  documents and embeddings. Writes are transactional.
+
+Select the backend with `"storage_backend": "sqlite"` in config.json (or the
+`OPENSCOUT_STORAGE` environment variable). Migrate an existing tree with:
+
+    python src/storage.py migrate
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from data_cache import JSONFileCache, load_json_cached
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+CONFIG_FILE = os.path.join(ROOT_DIR, "config.json")
+DEFAULT_DB_FILE = os.path.join(DATA_DIR, "openscout.db")
+
+DIMENSIONS = ["influence", "contribution", "maintainership", "engagement", "diversity", "code_capability"]
+# Per-user JSON documents stored next to the dimension files
+DOCUMENT_KINDS = ("github_profile", "tech_stack", "representative_repos", "repos")
+MACRO_METRICS = ("openrank", "activity")
+MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def _load_config():
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading config.json: {e}")
+    return {}
+
+
+def _write_json(path, data, indent=2):
+    """Write JSON atomically (temp file + rename) so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A unique temp file per write: server mining threads, discovery and the CLI may write the same file at once
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def latest_month(record):
+    """Latest `YYYY-MM` period in a macro record (any metric), or None."""
+    months = [p for metric in MACRO_METRICS for p in (record.get(metric) or {}) if MONTH_RE.match(p)]
+    return max(months) if months else None
+
+
+def dimension_document(username, dimension, metrics, score):
+    """The `<user>_<dimension>.json` layout written by get_all_metrics."""
+    return {
+        "username": username,
+        "raw_metrics": metrics,
+        f"{dimension}_score_100": score
+    }
+
+
+class JSONStorage:
+    backend = "json"
+
+    def __init__(self, data_dir=DATA_DIR, cache_documents=False):
+        self.data_dir = data_dir
+        self.raw_users_dir = os.path.join(data_dir, "raw_users")
+        self.users_file = os.path.join(data_dir, "users_list.json")
+        self.radar_file = os.path.join(data_dir, "radar_scores.json")
+        self.radar_dir = os.path.join(data_dir, "radar_scores")
+        self.radar_stats_file = os.path.join(data_dir, "radar_stats.json")
+        self.discovery_cursor_file = os.path.join(data_dir, "discovery_cursor.json")
+        self.macro_file = os.path.join(data_dir, "macro_data", "macro_data_results.json")
+        self.macro_dir = os.path.join(data_dir, "macro_data", "users")
+        self.cache_documents = cache_documents
+        self._users_cache = JSONFileCache(self.users_file, list)
+        self._radar_cache = JSONFileCache(self.radar_file, dict)
+        self._macro_cache = JSONFileCache(self.macro_file, dict)
+        self._write_lock = threading.Lock()
+
+    # --- helpers ---
+    @contextmanager
+    def transaction(self):
+        """Interface parity with SQLiteStorage; each file write is atomic on its own."""
+        yield None
+
+    def user_dir(self, username, create=False):
+        path = os.path.join(self.raw_users_dir, username)
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def _document_path(self, username, kind):
+        if kind in DIMENSIONS:
+            return os.path.join(self.raw_users_dir, username, f"{username}_{kind}.json")
+        return os.path.join(self.raw_users_dir, username, f"{kind}.json")
+
+    def _read(self, path, default=None):
+        if not os.path.exists(path):
+            return default
+        try:
+            if self.cache_documents:
+                return load_json_cached(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading {path}: {e}")
+            return default
+
+    # --- users ---
+    def load_users(self):
+        try:
+            users = self._users_cache.get()
+        except Exception as e:
+            print(f"Error loading {self.users_file}: {e}")
+            return []
+        return list(users) if isinstance(users, list) else []
+
+    def save_users(self, users):
+        _write_json(self.users_file, list(users))
+
+    def add_user(self, username):
+        with self._write_lock:
+            users = self.load_users()
+            if username in users:
+                return False
+            users.append(username)
+            self.save_users(users)
+            return True
+
+    def has_user_data(self, username):
+        return os.path.isdir(self.user_dir(username))
+
+    # --- per-user documents (profile, tech stack, representative repos) ---
+    def load_user_document(self, username, kind, default=None):
+        return self._read(self._document_path(username, kind), default)
+
+    def has_user_document(self, username, kind):
+        return os.path.exists(self._document_path(username, kind))
+
+    def save_user_document(self, username, kind, data):
+        self.user_dir(username, create=True)
+        _write_json(self._document_path(username, kind), data)
+
+    # --- dimension metrics ---
+    def load_dimension(self, username, dimension):
+        return self._read(self._document_path(username, dimension))
+
+    def has_dimensions(self, username, dimensions=DIMENSIONS):
+        return all(os.path.exists(self._document_path(username, d)) for d in dimensions)
+
+    def save_dimension(self, username, dimension, metrics, score):
+        self.save_user_document(username, dimension, dimension_document(username, dimension, metrics, score))
+
+    def dimension_stamps(self):
+        """`username -> change stamp` for every user with stored data, without reading any file.
+
+        Every save is a temp file renamed into `raw_users/<user>/`, which bumps
+        the directory's mtime, so one stat per user detects changed metrics.
+        """
+        stamps = {}
+        if not os.path.isdir(self.raw_users_dir):
+            return stamps
+        with os.scandir(self.raw_users_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    stamps[entry.name] = entry.stat().st_mtime
+        return stamps
+
+    # --- radar scores ---
+    def _radar_path(self, username):
+        return os.path.join(self.radar_dir, f"{username}.json")
+
+    def _full_radar_scores(self):
+        try:
+            return self._radar_cache.get()
+        except Exception as e:
+            print(f"Error loading {self.radar_file}: {e}")
+            return {}
+
+    def load_radar_scores(self):
+        """Scores of the last full pass overlaid with the users scored incrementally since."""
+        scores = self._full_radar_scores()
+        if not os.path.isdir(self.radar_dir):
+            return scores
+        scores = dict(scores)
+        with os.scandir(self.radar_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    radar = self._read(entry.path)
+                    if radar is not None:
+                        scores[entry.name[:-len(".json")]] = radar
+        return scores
+
+    def get_radar(self, username):
+        radar = self._read(self._radar_path(username))
+        if radar is None:
+            radar = self._full_radar_scores().get(username)
+        return radar
+
+    def save_radar_scores(self, scores):
+        """Replace all scores (a full pass); the shards of the users it covers are removed."""
+        _write_json(self.radar_file, scores)
+        if os.path.isdir(self.radar_dir):
+            for name in os.listdir(self.radar_dir):
+                # A user scored incrementally while the pass ran keeps their shard
+                if name.endswith(".json") and name[:-len(".json")] in scores:
+                    os.remove(os.path.join(self.radar_dir, name))
+
+    def save_radar_user(self, username, radar):
+        """Upsert one user's scores (incremental scoring): writes only that user's shard."""
+        _write_json(self._radar_path(username), radar, indent=None)
+
+    def load_radar_stats(self):
+        """Population statistics snapshot of the last full radar run, or None."""
+        return self._read(self.radar_stats_file)
+
+    def save_radar_stats(self, stats):
+        _write_json(self.radar_stats_file, stats)
+
+    # --- user discovery ---
+    def load_discovery_cursor(self):
+        """Resume point of get_user_name discovery, or None."""
+        return self._read(self.discovery_cursor_file)
+
+    def save_discovery_cursor(self, cursor):
+        _write_json(self.discovery_cursor_file, cursor)
+
+    def clear_discovery_cursor(self):
+        if os.path.exists(self.discovery_cursor_file):
+            os.remove(self.discovery_cursor_file)
+
+    # --- OpenDigger macro data ---
+    def _macro_path(self, username):
+        return os.path.join(self.macro_dir, f"{username}.json")
+
+    def _legacy_macro_data(self):
+        try:
+            return self._macro_cache.get()
+        except Exception as e:
+            print(f"Error loading {self.macro_file}: {e}")
+            return {}
+
+    def load_macro_data(self):
+        """All records: the combined legacy file overlaid with the per-user shards."""
+        data = dict(self._legacy_macro_data())
+        if os.path.isdir(self.macro_dir):
+            with os.scandir(self.macro_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        record = self._read(entry.path)
+                        if record:
+                            data[entry.name[:-len(".json")]] = record
+        return data
+
+    def get_macro(self, username):
+        record = self._read(self._macro_path(username))
+        if record is None:
+            record = self._legacy_macro_data().get(username)
+        return record
+
+    def macro_freshness(self, usernames=None):
+        """`username -> (latest month, fetched_at)` of the stored records of `usernames` (default: all)."""
+        if usernames is None:
+            records = self.load_macro_data()
+        else:
+            # One shard per requested user, not a scan of the whole directory
+            records = {u: self.get_macro(u) for u in usernames}
+        return {u: (latest_month(r), r.get("fetched_at") or 0) for u, r in records.items() if r}
+
+    def save_macro_data(self, data):
+        """Replace all records (shards of users not in `data` are removed)."""
+        if os.path.isdir(self.macro_dir):
+            for name in os.listdir(self.macro_dir):
+                if name.endswith(".json") and name[:-len(".json")] not in data:
+                    os.remove(os.path.join(self.macro_dir, name))
+        self.save_macro_users(data)
+        if os.path.exists(self.macro_file):
+            os.remove(self.macro_file)
+
+    def save_macro_users(self, users_data):
+        """Upsert `username -> macro record` entries; only the given users' shards are written."""
+        for username, record in users_data.items():
+            _write_json(self._macro_path(username), record, indent=None)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username   TEXT PRIMARY KEY,
+    position   INTEGER NOT NULL,
+    added_at   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_position ON users(position);
+
+CREATE TABLE IF NOT EXISTS dimension_metrics (
+    username    TEXT NOT NULL,
+    dimension   TEXT NOT NULL,
+    score       REAL,
+    raw_metrics TEXT NOT NULL,
+    updated_at  INTEGER NOT NULL,
+    PRIMARY KEY (username, dimension)
+);
+CREATE INDEX IF NOT EXISTS idx_dimension_metrics_dimension ON dimension_metrics(dimension);
+
+CREATE TABLE IF NOT EXISTS radar_scores (
+    username        TEXT PRIMARY KEY,
+    influence       REAL,
+    contribution    REAL,
+    maintainership  REAL,
+    engagement      REAL,
+    diversity       REAL,
+    code_capability REAL,
+    updated_at      INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    name       TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS macro_users (
+    username   TEXT PRIMARY KEY,
+    status     TEXT,
+    updated_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS monthly_metrics (
+    username TEXT NOT NULL,
+    metric   TEXT NOT NULL,
+    period   TEXT NOT NULL,
+    value    REAL,
+    PRIMARY KEY (username, metric, period)
+);
+
+CREATE TABLE IF NOT EXISTS repos (
+    username  TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    position  INTEGER NOT NULL,
+    stars     INTEGER,
+    data      TEXT NOT NULL,
+    PRIMARY KEY (username, full_name)
+);
+CREATE INDEX IF NOT EXISTS idx_repos_stars ON repos(stars);
+
+CREATE TABLE IF NOT EXISTS user_documents (
+    username   TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    data       TEXT NOT NULL,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (username, kind)
+);
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    username TEXT PRIMARY KEY,
+    dim      INTEGER NOT NULL,
+    norm     REAL NOT NULL,
+    vector   BLOB NOT NULL,
+    meta     TEXT
+);
+"""
+
+
+class SQLiteStorage:
+    """
+    SQLite-backed storage with the same interface as JSONStorage.
+
+    Avatars stay as files under `raw_users/<user>/` (see `user_dir`).
+    """
+    backend = "sqlite"
+
+    def __init__(self, db_file=DEFAULT_DB_FILE, data_dir=DATA_DIR):
+        self.db_file = db_file
+        self.data_dir = data_dir
+        self.raw_users_dir = os.path.join(data_dir, "raw_users")
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self.conn.executescript(SCHEMA)
+
+    @property
+    def conn(self):
+        # sqlite3 connections are per-thread; transactions are managed explicitly
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        `with storage.transaction() as conn:` commits on success and rolls back on
+        error. Nested blocks join the outermost transaction.
+        """
+        conn = self.conn
+        depth = self._local.depth
+        self._local.depth = depth + 1
+        try:
+            if depth == 0:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            if depth == 0:
+                conn.execute("COMMIT")
+        except BaseException:
+            if depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.depth = depth
+
+    def user_dir(self, username, create=False):
+        path = os.path.join(self.raw_users_dir, username)
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    # --- users ---
+    def load_users(self):
+        rows = self.conn.execute("SELECT username FROM users ORDER BY position").fetchall()
+        return [r[0] for r in rows]
+
+    def save_users(self, users):
+        now = int(time.time())
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM users")
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (username, position, added_at) VALUES (?, ?, ?)",
+                [(u, i, now) for i, u in enumerate(users)],
+            )
+
+    def add_user(self, username):
+        with self.transaction() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO users (username, position, added_at) "
+                "VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM users), ?)",
+                (username, int(time.time())),
+            )
+            return cur.rowcount > 0
+
+    def has_user_data(self, username):
+        row = self.conn.execute(
+            "SELECT 1 FROM dimension_metrics WHERE username = ? "
+            "UNION ALL SELECT 1 FROM user_documents WHERE username = ? LIMIT 1",
+            (username, username),
+        ).fetchone()
+        return row is not None
+
+    # --- per-user documents ---
+    def load_user_document(self, username, kind, default=None):
+        if kind in DIMENSIONS:
+            return self.load_dimension(username, kind) or default
+        if kind == "representative_repos":
+            rows = self.conn.execute(
+                "SELECT data FROM repos WHERE username = ? ORDER BY position", (username,)
+            ).fetchall()
+            if not rows and not self.has_user_document(username, kind):
+                return default
+            return [json.loads(r[0]) for r in rows]
+        row = self.conn.execute(
+            "SELECT data FROM user_documents WHERE username = ? AND kind = ?", (username, kind)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def has_user_document(self, username, kind):
+        if kind in DIMENSIONS:
+            return self.has_dimensions(username, [kind])
+        row = self.conn.execute(
+            "SELECT 1 FROM user_documents WHERE username = ? AND kind = ?", (username, kind)
+        ).fetchone()
+        return row is not None
+
+    def save_user_document(self, username, kind, data):
+        if kind in DIMENSIONS:
+            self.save_dimension(username, kind, data.get("raw_metrics", {}), data.get(f"{kind}_score_100"))
+            return
+        now = int(time.time())
+        with self.transaction() as conn:
+            if kind == "representative_repos":
+                # Repos get their own rows; the document row only marks the list as fetched
+                conn.execute("DELETE FROM repos WHERE username = ?", (username,))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO repos (username, full_name, position, stars, data) VALUES (?, ?, ?, ?, ?)",
+                    [(username, r.get("full_name") or r.get("name") or str(i), i, r.get("stars"),
+                      json.dumps(r, ensure_ascii=False)) for i, r in enumerate(data or [])],
+                )
+                payload = "[]"
+            else:
+                payload = json.dumps(data, ensure_ascii=False)
+            conn.execute(
+                "INSERT OR REPLACE INTO user_documents (username, kind, data, updated_at) VALUES (?, ?, ?, ?)",
+                (username, kind, payload, now),
+            )
+
+    # --- dimension metrics ---
+    def load_dimension(self, username, dimension):
+        row = self.conn.execute(
+            "SELECT score, raw_metrics FROM dimension_metrics WHERE username = ? AND dimension = ?",
+            (username, dimension),
+        ).fetchone()
+        if row is None:
+            return None
+        return dimension_document(username, dimension, json.loads(row[1]), row[0])
+
+    def has_dimensions(self, username, dimensions=DIMENSIONS):
+        placeholders = ",".join("?" * len(dimensions))
+        row = self.conn.execute(
+            f"SELECT COUNT(*) FROM dimension_metrics WHERE username = ? AND dimension IN ({placeholders})",
+            (username, *dimensions),
+        ).fetchone()
+        return row[0] == len(dimensions)
+
+    def dimension_stamps(self):
+        return dict(self.conn.execute(
+            "SELECT username, MAX(updated_at) FROM dimension_metrics GROUP BY username"
+        ).fetchall())
+
+    def save_dimension(self, username, dimension, metrics, score):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO dimension_metrics (username, dimension, score, raw_metrics, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (username, dimension, score, json.dumps(metrics, ensure_ascii=False), int(time.time())),
+            )
+
+    # --- radar scores ---
+    def load_radar_scores(self):
+        rows = self.conn.execute(f"SELECT username, {', '.join(DIMENSIONS)} FROM radar_scores").fetchall()
+        return {r[0]: list(r[1:]) for r in rows}
+
+    def get_radar(self, username):
+        row = self.conn.execute(
+            f"SELECT {', '.join(DIMENSIONS)} FROM radar_scores WHERE username = ?", (username,)
+        ).fetchone()
+        return list(row) if row else None
+
+    def save_radar_scores(self, scores):
+        now = int(time.time())
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM radar_scores")
+            conn.executemany(
+                f"INSERT INTO radar_scores (username, {', '.join(DIMENSIONS)}, updated_at) "
+                f"VALUES (?, {', '.join('?' * len(DIMENSIONS))}, ?)",
+                [(u, *(list(v) + [None] * len(DIMENSIONS))[:len(DIMENSIONS)], now) for u, v in scores.items()],
+            )
+
+    def save_radar_user(self, username, radar):
+        with self.transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO radar_scores (username, {', '.join(DIMENSIONS)}, updated_at) "
+                f"VALUES (?, {', '.join('?' * len(DIMENSIONS))}, ?)",
+                (username, *(list(radar) + [None] * len(DIMENSIONS))[:len(DIMENSIONS)], int(time.time())),
+            )
+
+    def load_radar_stats(self):
+        row = self.conn.execute("SELECT data FROM snapshots WHERE name = 'radar_stats'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_radar_stats(self, stats):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (name, data, updated_at) VALUES ('radar_stats', ?, ?)",
+                (json.dumps(stats, ensure_ascii=False), int(time.time())),
+            )
+
+    # --- user discovery ---
+    def load_discovery_cursor(self):
+        row = self.conn.execute("SELECT data FROM snapshots WHERE name = 'discovery_cursor'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_discovery_cursor(self, cursor):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (name, data, updated_at) VALUES ('discovery_cursor', ?, ?)",
+                (json.dumps(cursor, ensure_ascii=False), int(time.time())),
+            )
+
+    def clear_discovery_cursor(self):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM snapshots WHERE name = 'discovery_cursor'")
+
+    # --- OpenDigger macro data ---
+    def _macro_records(self, where="", params=()):
+        records = {}
+        for username, status, updated_at in self.conn.execute(
+                f"SELECT username, status, updated_at FROM macro_users {where}", params):
+            records[username] = {"username": username, "fetched_at": updated_at}
+            if status:
+                records[username]["status"] = status
+        for username, metric, period, value in self.conn.execute(
+                f"SELECT username, metric, period, value FROM monthly_metrics {where} ORDER BY rowid", params):
+            if username in records:
+                records[username].setdefault(metric, {})[period] = value
+        return records
+
+    def load_macro_data(self):
+        return self._macro_records()
+
+    def get_macro(self, username):
+        return self._macro_records("WHERE username = ?", (username,)).get(username)
+
+    def macro_freshness(self, usernames=None):
+        if usernames is None:
+            return self._macro_freshness("", ())
+        freshness = {}
+        usernames = list(dict.fromkeys(usernames))
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(usernames), 500):
+            chunk = usernames[start:start + 500]
+            freshness.update(self._macro_freshness(f"AND username IN ({', '.join('?' * len(chunk))})", chunk))
+        return freshness
+
+    def _macro_freshness(self, where, params):
+        freshness = {u: (None, fetched_at) for u, fetched_at in
+                     self.conn.execute(f"SELECT username, updated_at FROM macro_users WHERE 1 {where}", params)}
+        for username, period in self.conn.execute(
+                "SELECT username, MAX(period) FROM monthly_metrics "
+                f"WHERE period GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]' {where} GROUP BY username", params):
+            if username in freshness:
+                freshness[username] = (period, freshness[username][1])
+        return freshness
+
+    def save_macro_users(self, users_data):
+        with self.transaction() as conn:
+            for username, record in users_data.items():
+                conn.execute("DELETE FROM monthly_metrics WHERE username = ?", (username,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO macro_users (username, status, updated_at) VALUES (?, ?, ?)",
+                    # Records from before fetched_at was kept count as never fetched
+                    (username, record.get("status"), int(record.get("fetched_at") or 0)),
+                )
+                conn.executemany(
+                    "INSERT INTO monthly_metrics (username, metric, period, value) VALUES (?, ?, ?, ?)",
+                    [(username, metric, period, value)
+                     for metric in MACRO_METRICS
+                     for period, value in (record.get(metric) or {}).items()],
+                )
+
+    def save_macro_data(self, data):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM macro_users")
+            conn.execute("DELETE FROM monthly_metrics")
+            self.save_macro_users(data)
+
+    # --- embeddings (read and written by vector_store.SimpleVectorStore) ---
+    def load_embeddings(self):
+        """`(username, dim, norm, vector bytes, meta json)` rows in insertion order (= vector store rows)."""
+        return self.conn.execute("SELECT username, dim, norm, vector, meta FROM embeddings ORDER BY rowid").fetchall()
+
+    def save_embeddings(self, items):
+        """items: iterable of (username, normalized float32 ndarray, norm, meta dict)."""
+        with self.transaction() as conn:
+            # Upsert keeps an updated user's rowid, so the row order stays stable
+            conn.executemany(
+                "INSERT INTO embeddings (username, dim, norm, vector, meta) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET dim = excluded.dim, norm = excluded.norm, "
+                "vector = excluded.vector, meta = excluded.meta",
+                [(u, int(vec.shape[0]), float(norm), vec.tobytes(), json.dumps(meta or {}))
+                 for u, vec, norm, meta in items],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (name, data, updated_at) VALUES ('embeddings_version', ?, ?)",
+                (json.dumps(uuid.uuid4().hex), int(time.time())),
+            )
+
+    def embeddings_stamp(self):
+        """Changes on every save_embeddings, so other processes can tell when to reload."""
+        row = self.conn.execute("SELECT data FROM snapshots WHERE name = 'embeddings_version'").fetchone()
+        return row[0] if row else None
+
+
+_default_storage = None
+_default_lock = threading.Lock()
+
+
+def open_storage(config=None, cache_documents=False):
+    """Create the storage backend selected in config.json / OPENSCOUT_STORAGE."""
+    config = _load_config() if config is None else config
+    backend = (os.environ.get("OPENSCOUT_STORAGE") or config.get("storage_backend") or "json").lower()
+    if backend == "sqlite":
+        db_file = os.environ.get("OPENSCOUT_DB") or config.get("storage_db") or DEFAULT_DB_FILE
+        if not os.path.isabs(db_file):
+            db_file = os.path.join(ROOT_DIR, db_file)
+        return SQLiteStorage(db_file)
+    if backend != "json":
+        print(f"Unknown storage backend '{backend}', using json.")
+    return JSONStorage(cache_documents=cache_documents)
+
+
+def get_storage():
+    """Process-wide storage instance for the pipeline scripts."""
+    global _default_storage
+    with _default_lock:
+        if _default_storage is None:
+            _default_storage = open_storage()
+        return _default_storage
+
+
+def migrate_json_to_sqlite(db_file=DEFAULT_DB_FILE, data_dir=DATA_DIR):
+    """Copy the JSON file tree (and the vector store) into an SQLite database."""
+    src = JSONStorage(data_dir)
+    dst = SQLiteStorage(db_file, data_dir)
+
+    users = src.load_users()
+    # Users that only exist as raw_users/ directories are migrated too
+    if os.path.isdir(src.raw_users_dir):
+        listed = set(users)
+        users += sorted(u for u in os.listdir(src.raw_users_dir)
+                        if u not in listed and os.path.isdir(os.path.join(src.raw_users_dir, u)))
+
+    start = time.time()
+    with dst.transaction():
+        dst.save_users(users)
+        for username in users:
+            for dimension in DIMENSIONS:
+                doc = src.load_dimension(username, dimension)
+                if doc:
+                    dst.save_dimension(username, dimension, doc.get("raw_metrics", {}),
+                                       doc.get(f"{dimension}_score_100"))
+            for kind in DOCUMENT_KINDS:
+                doc = src.load_user_document(username, kind)
+                if doc is not None:
+                    dst.save_user_document(username, kind, doc)
+        dst.save_radar_scores(src.load_radar_scores())
+        radar_stats = src.load_radar_stats()
+        if radar_stats:
+            dst.save_radar_stats(radar_stats)
+        cursor = src.load_discovery_cursor()
+        if cursor:
+            dst.save_discovery_cursor(cursor)
+        dst.save_macro_data(src.load_macro_data())
+
+    migrated_vectors = 0
+    try:
+        from vector_store import SimpleVectorStore, VECTOR_STORE_FILE, LEGACY_EMBEDDINGS_FILES
+        store = SimpleVectorStore(os.path.join(data_dir, os.path.basename(VECTOR_STORE_FILE)),
+                                  legacy_files=[os.path.join(data_dir, os.path.basename(f)) for f in LEGACY_EMBEDDINGS_FILES])
+        dst.save_embeddings(
+            (key, store.matrix[row], store.norms[row], store.row_meta[row])
+            for row, key in enumerate(store.ids)
+        )
+        migrated_vectors = len(store)
+    except ImportError as e:
+        print(f"Skipping embeddings: {e}")
+
+    print(f"Migrated {len(users)} users and {migrated_vectors} embeddings to {db_file} "
+          f"in {time.time() - start:.1f}s.")
+    return dst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenScout storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Migrate the data/ JSON tree into SQLite")
+    migrate.add_argument("--db", default=DEFAULT_DB_FILE, help="Target database file")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_json_to_sqlite(args.db)
+
+
+if __name__ == "__main__":
+    main()
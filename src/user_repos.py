@@ -0,0 +1,94 @@
+"""
+Each user's owned-repository list, fetched once and shared by the pipeline stages.
+
+get_all_metrics (influence, diversity, event filtering), fetch_tech_stack_context
+and fetch_representative_repos all need the same `/users/{u}/repos?type=owner`
+pages. The first stage that asks fetches them and saves a trimmed copy as the
+`repos` user document (`raw_users/<u>/repos.json`) with a `fetched_at`
+timestamp; the other stages reuse it. A stored list is fresh for
+`repo_list_max_age` seconds (config.json, default one day); with `refresh`
+only lists fetched since `run_started_at` are reused, so a refresh run still
+downloads every list exactly once. run_pipeline passes its own start time
+to every stage, so concurrent in-process runs do not share it.
+"""
+import time
+
+from storage import get_storage
+from github_client import get_github_client, load_config
+
+DOCUMENT_KIND = "repos"
+DEFAULT_MAX_AGE = 24 * 3600
+
+# The repo fields any stage reads; the full objects are ~6 KB each
+REPO_FIELDS = (
+    "name", "full_name", "html_url", "description", "fork", "archived", "language", "topics",
+    "stargazers_count", "forks_count", "open_issues_count", "size", "default_branch",
+    "languages_url", "pushed_at",
+)
+
+# A standalone stage script is its own run
+PROCESS_STARTED_AT = time.time()
+
+
+def trim_repo(repo):
+    trimmed = {k: repo.get(k) for k in REPO_FIELDS}
+    trimmed["owner"] = {"login": (repo.get("owner") or {}).get("login")}
+    return trimmed
+
+
+def fetch_repo_list(username, client=None):
+    """All owned repos, most recently pushed first; `(repos, complete)`."""
+    client = client or get_github_client()
+    repos = []
+    page = 1
+    while True:
+        # mercy-preview includes `topics` in the listing
+        response = client.get(f"/users/{username}/repos",
+                              params={'type': 'owner', 'sort': 'pushed', 'per_page': 100, 'page': page},
+                              headers={"Accept": "application/vnd.github.mercy-preview+json"}, timeout=60)
+        if response.status_code != 200:
+            print(f"Error fetching repos for {username}: Status {response.status_code}, Response: {response.text[:100]}")
+            return repos, False
+        batch = response.json()
+        if not batch:
+            break
+        repos.extend(trim_repo(r) for r in batch)
+        if 'next' not in response.links:
+            break
+        page += 1
+    return repos, True
+
+
+def get_user_repos(username, client=None, storage=None, refresh=False, max_age=None, run_started_at=None):
+    """The user's owned repos from the stored list if it is fresh enough, else from the API.
+
+    With `refresh`, only a list fetched since `run_started_at` (default: when
+    this process started) is reused.
+    """
+    storage = storage or get_storage()
+    if max_age is None:
+        max_age = float(load_config().get("repo_list_max_age", DEFAULT_MAX_AGE))
+    if refresh:
+        since = PROCESS_STARTED_AT if run_started_at is None else run_started_at
+    else:
+        since = time.time() - max_age
+
+    doc = storage.load_user_document(username, DOCUMENT_KIND)
+    if isinstance(doc, dict) and doc.get("fetched_at", 0) >= since:
+        return doc.get("repos", [])
+
+    fetched_at = time.time()
+    repos, complete = fetch_repo_list(username, client)
+    # A partial list (error mid-way) is used for this call but not stored
+    if complete:
+        save_user_repos(username, repos, storage, fetched_at)
+    return repos
+
+
+def save_user_repos(username, repos, storage=None, fetched_at=None):
+    """Store a complete repo list (REST field names) for the other stages to reuse."""
+    (storage or get_storage()).save_user_document(username, DOCUMENT_KIND, {
+        "username": username,
+        "fetched_at": time.time() if fetched_at is None else fetched_at,
+        "repos": [trim_repo(r) for r in repos],
+    })
@@ -0,0 +1,505 @@
+"""
+Developer embedding store used by semantic search.
+
+`SimpleVectorStore` keeps every embedding in one contiguous float32 matrix
+(memory-mapped from disk) and answers exact cosine top-k queries with a
+single matrix-vector product. `IVFIndex` is an optional approximate index
+(inverted file over spherical k-means centroids) that restricts a query to
+the `nprobe` closest clusters once the store gets large.
+"""
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+
+# Binary vector store: raw float32 matrix (memory-mapped) + JSON sidecar with ids/norms
+VECTOR_STORE_FILE = os.path.join(DATA_DIR, "vector_store.f32")
+# Legacy JSON stores, migrated on first start
+LEGACY_EMBEDDINGS_FILES = [
+    os.path.join(DATA_DIR, "vector_store.json"),
+    os.path.join(DATA_DIR, "user_embeddings_cache.json"),
+]
+
+INDEX_TYPES = ("exact", "ivf")
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over the normalized rows of a SimpleVectorStore.
+
+    Rows are clustered with spherical k-means; a query scores the centroids,
+    then only the rows listed under the `nprobe` best clusters. Raising
+    `nprobe` trades latency for recall (nprobe == nlist is exact search).
+    New rows are assigned to their nearest centroid on insert; the centroids
+    are retrained once the store has grown by `retrain_ratio` since training.
+    """
+    def __init__(self, index_file, nlist=None, nprobe=8, min_vectors=10000, retrain_ratio=2.0, seed=0):
+        self.index_file = index_file
+        self.requested_nlist = nlist
+        self.nprobe = max(1, int(nprobe))
+        self.min_vectors = int(min_vectors)
+        self.retrain_ratio = float(retrain_ratio)
+        self.seed = seed
+        self.centroids = None                          # (nlist, dim) normalized
+        self.assignments = np.zeros(0, dtype=np.int32) # row -> cluster
+        self.lists = []                                # cluster -> np.array of rows
+        self.trained_rows = 0
+        self.dirty = False
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    @property
+    def nlist(self):
+        return 0 if self.centroids is None else self.centroids.shape[0]
+
+    def _default_nlist(self, n):
+        return max(1, min(n, int(round(4 * math.sqrt(n)))))
+
+    def _assign(self, rows):
+        """Nearest centroid (max inner product) for each row, in chunks to bound memory."""
+        out = np.empty(rows.shape[0], dtype=np.int32)
+        for start in range(0, rows.shape[0], 8192):
+            chunk = rows[start:start + 8192]
+            out[start:start + chunk.shape[0]] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return out
+
+    def _rebuild_lists(self):
+        order = np.argsort(self.assignments, kind="stable").astype(np.int32)
+        bounds = np.searchsorted(self.assignments[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+
+    def build(self, matrix, n, niter=10, sample_per_list=64):
+        """Train centroids on (a sample of) the first n rows and assign all of them."""
+        rows = matrix[:n]
+        nlist = min(self.requested_nlist or self._default_nlist(n), n)
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(n, nlist * sample_per_list)
+        sample = rows[np.sort(rng.choice(n, size=sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        self.centroids = centroids
+        for _ in range(niter):
+            labels = self._assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty clusters from random sample points
+                sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+            self.centroids = centroids
+
+        self.assignments = self._assign(rows)
+        self._rebuild_lists()
+        self.trained_rows = n
+        self.dirty = True
+
+    def needs_retrain(self, n):
+        if not self.trained:
+            return n >= self.min_vectors
+        return n >= self.trained_rows * self.retrain_ratio
+
+    def add(self, row, vector):
+        """Assign a new or updated row to its nearest centroid."""
+        if not self.trained:
+            return
+        cluster = int(np.argmax(self.centroids @ vector))
+        if row < self.assignments.shape[0]:
+            old = int(self.assignments[row])
+            if old == cluster:
+                return
+            if old >= 0:
+                self.lists[old] = self.lists[old][self.lists[old] != row]
+        else:
+            grown = np.full(row + 1, -1, dtype=np.int32)
+            grown[:self.assignments.shape[0]] = self.assignments
+            self.assignments = grown
+        self.assignments[row] = cluster
+        self.lists[cluster] = np.append(self.lists[cluster], np.int32(row))
+        self.dirty = True
+
+    def candidates(self, query, nprobe=None):
+        """Rows stored under the nprobe centroids closest to the (normalized) query."""
+        nprobe = min(max(1, int(nprobe or self.nprobe)), self.nlist)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+        return np.concatenate([self.lists[c] for c in probe])
+
+    def load(self, dim, n):
+        """Load centroids/assignments from index_file if they match the store."""
+        if not os.path.exists(self.index_file):
+            return False
+        try:
+            with np.load(self.index_file) as data:
+                centroids = data["centroids"].astype(np.float32)
+                assignments = data["assignments"].astype(np.int32)
+                trained_rows = int(data["trained_rows"])
+        except Exception as e:
+            print(f"Failed to load vector index: {e}")
+            return False
+        if centroids.ndim != 2 or centroids.shape[1] != dim or assignments.shape[0] > n:
+            print("Vector index does not match the vector store, it will be rebuilt.")
+            return False
+        self.centroids = centroids
+        self.assignments = assignments
+        self.trained_rows = trained_rows
+        self._rebuild_lists()
+        self.dirty = False
+        return True
+
+    def save(self):
+        if not self.trained or not self.dirty:
+            return
+        tmp_file = f"{self.index_file}.tmp.npz"
+        np.savez(tmp_file, centroids=self.centroids, assignments=self.assignments,
+                 trained_rows=np.int64(self.trained_rows))
+        os.replace(tmp_file, self.index_file)
+        self.dirty = False
+
+
+class SimpleVectorStore:
+    """
+    Embedding index backed by one contiguous float32 matrix.
+
+    Rows are L2-normalized on insert so a search is a single matrix-vector
+    product; the original norms are kept so `get` returns the vector as added.
+
+    On disk the matrix is a headerless float32 file opened with `np.memmap`
+    (copy-on-write), next to a `.meta.json` sidecar holding ids, norms and the
+    dimension. `save` appends new rows and patches updated rows in place
+    instead of rewriting the whole store. Each row can also carry a small
+    metadata dict (e.g. content hash and embedding model) kept in the sidecar.
+
+    With an SQLite `storage` (the `sqlite` storage backend), rows are kept in
+    its `embeddings` table instead of the matrix file: `save` upserts only new
+    and changed rows, and a store found in the old files is copied into the
+    table on first load.
+
+    With an `IVFIndex` attached, searches on stores of at least
+    `index.min_vectors` rows only score the probed clusters; smaller stores
+    (or `exact=True`) use the brute-force scan.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, storage_file=VECTOR_STORE_FILE, legacy_files=None, index=None, storage=None):
+        self.storage_file = storage_file
+        self.storage = storage
+        self.meta_file = os.path.splitext(storage_file)[0] + ".meta.json"
+        self.legacy_files = LEGACY_EMBEDDINGS_FILES if legacy_files is None else legacy_files
+        self.index = index
+        self._lock = threading.RLock()
+        self._reset()
+        self.load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reset(self):
+        self.ids = []            # row -> username
+        self.id_to_row = {}      # username -> row
+        self.dim = 0
+        self.matrix = np.zeros((0, 0), dtype=np.float32)  # normalized rows, over-allocated
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.row_meta = []        # row -> metadata dict
+        self._persisted_rows = 0  # rows already present in storage_file
+        self._dirty_rows = set()  # persisted rows modified since the last save
+        self._meta_mtime = None   # sidecar mtime as of our last load/save
+        self._db_stamp = None     # storage.embeddings_stamp() as of our last load/save
+
+    def _load_dict(self, vectors):
+        self._reset()
+        for key, vector in (vectors or {}).items():
+            try:
+                self.add(key, vector)
+            except ValueError as e:
+                print(f"Skipping vector for {key}: {e}")
+
+    def _ensure_capacity(self, rows):
+        if rows <= self.matrix.shape[0]:
+            return
+        capacity = max(rows, self.matrix.shape[0] * 2, 64)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        n = len(self.ids)
+        matrix[:n] = self.matrix[:n]
+        norms[:n] = self.norms[:n]
+        self.matrix = matrix
+        self.norms = norms
+
+    def _load_binary(self):
+        with open(self.meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        ids = meta.get("ids", [])
+        dim = int(meta.get("dim", 0))
+        count = len(ids)
+        if count and os.path.getsize(self.storage_file) < count * dim * 4:
+            raise ValueError(f"{self.storage_file} is shorter than its metadata")
+
+        self.ids = list(ids)
+        self.id_to_row = {key: row for row, key in enumerate(self.ids)}
+        self.dim = dim
+        self.norms = np.asarray(meta.get("norms", []), dtype=np.float32)
+        row_meta = meta.get("row_meta") or []
+        self.row_meta = [dict(m or {}) for m in row_meta[:count]] + [{} for _ in range(count - len(row_meta))]
+        if count:
+            # Copy-on-write: pages are shared with the page cache until a row is modified
+            self.matrix = np.memmap(self.storage_file, dtype=np.float32, mode='c', shape=(count, dim))
+        else:
+            self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self._persisted_rows = count
+        self._meta_mtime = os.path.getmtime(self.meta_file)
+
+    def _load_db(self):
+        """Load the rows of the storage's embeddings table; False if it is empty."""
+        stamp = self.storage.embeddings_stamp()
+        rows = self.storage.load_embeddings()
+        if not rows:
+            return False
+        dim = int(rows[0][1])
+        rows = [r for r in rows if int(r[1]) == dim]
+        self.dim = dim
+        self.ids = [r[0] for r in rows]
+        self.id_to_row = {key: row for row, key in enumerate(self.ids)}
+        self.matrix = np.zeros((len(rows), dim), dtype=np.float32)
+        for row, r in enumerate(rows):
+            self.matrix[row] = np.frombuffer(r[3], dtype=np.float32, count=dim)
+        self.norms = np.asarray([r[2] for r in rows], dtype=np.float32)
+        self.row_meta = [json.loads(r[4] or "{}") for r in rows]
+        self._persisted_rows = len(rows)
+        self._db_stamp = stamp
+        return True
+
+    def _load_index(self):
+        n = len(self.ids)
+        if self.index is None or not n:
+            return
+        if self.index.load(self.dim, n):
+            # Catch up on rows added after the index was last saved
+            for row in range(self.index.assignments.shape[0], n):
+                self.index.add(row, self.matrix[row])
+        if self.index.needs_retrain(n):
+            self.build_index()
+
+    def build_index(self):
+        """(Re)train the attached ANN index on the current rows."""
+        with self._lock:
+            n = len(self.ids)
+            if self.index is None or not n:
+                return
+            print(f"Building vector index over {n} vectors...")
+            self.index.build(self.matrix, n)
+            self.index.save()
+
+    def load(self):
+        with self._lock:
+            self._reset()
+            if self.storage is not None:
+                try:
+                    if self._load_db():
+                        self._load_index()
+                        return
+                except Exception as e:
+                    print(f"Failed to load vectors from the database: {e}")
+                    self._reset()
+
+            if os.path.exists(self.meta_file) and os.path.exists(self.storage_file):
+                try:
+                    self._load_binary()
+                    if self.storage is not None:
+                        # First start on the database: copy the file store into the embeddings table
+                        print(f"Copying {len(self.ids)} vectors from {self.storage_file} to the database")
+                        self._persisted_rows = 0
+                        self.save()
+                    self._load_index()
+                    return
+                except Exception as e:
+                    print(f"Failed to load vector store: {e}")
+                    self._reset()
+
+            # Migrate from the legacy JSON stores
+            for legacy_file in self.legacy_files:
+                if not os.path.exists(legacy_file):
+                    continue
+                try:
+                    with open(legacy_file, 'r', encoding='utf-8') as f:
+                        self._load_dict(json.load(f))
+                    print(f"Migrating {len(self.ids)} vectors from {legacy_file} to {self.storage_file}")
+                    self.save()
+                    self._load_index()
+                    return
+                except Exception as e:
+                    print(f"Failed to migrate {legacy_file}: {e}")
+                    self._reset()
+
+    def _save_db(self, n):
+        rows = sorted(self._dirty_rows) + list(range(self._persisted_rows, n))
+        if rows:
+            self.storage.save_embeddings(
+                (self.ids[row], self.matrix[row], self.norms[row], self.row_meta[row]) for row in rows
+            )
+        self._db_stamp = self.storage.embeddings_stamp()
+
+    def _save_file(self, n):
+        if n:
+            row_bytes = self.dim * 4
+            mode = 'r+b' if os.path.exists(self.storage_file) and self._persisted_rows else 'wb'
+            with open(self.storage_file, mode) as f:
+                # Patch rows that changed in place
+                for row in sorted(self._dirty_rows):
+                    f.seek(row * row_bytes)
+                    f.write(np.ascontiguousarray(self.matrix[row]).tobytes())
+                # Drop any partial tail left by an interrupted save, then append new rows
+                f.truncate(self._persisted_rows * row_bytes)
+                f.seek(self._persisted_rows * row_bytes)
+                f.write(np.ascontiguousarray(self.matrix[self._persisted_rows:n]).tobytes())
+
+        meta = {
+            "version": self.FORMAT_VERSION,
+            "dtype": "float32",
+            "dim": self.dim,
+            "ids": self.ids,
+            "norms": [float(x) for x in self.norms[:n]],
+            "row_meta": self.row_meta,
+        }
+        tmp_file = f"{self.meta_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, self.meta_file)
+        self._meta_mtime = os.path.getmtime(self.meta_file)
+
+    def save(self):
+        with self._lock:
+            n = len(self.ids)
+            try:
+                if self.storage is not None:
+                    self._save_db(n)
+                else:
+                    self._save_file(n)
+                self._persisted_rows = n
+                self._dirty_rows.clear()
+
+                if self.index is not None:
+                    if self.index.needs_retrain(n):
+                        self.build_index()
+                    else:
+                        self.index.save()
+            except Exception as e:
+                print(f"Failed to save vector store: {e}")
+
+    def reload_if_changed(self):
+        """Reload from disk if another process (e.g. the indexer CLI) saved the store."""
+        with self._lock:
+            if self.storage is not None:
+                if self.storage.embeddings_stamp() == self._db_stamp:
+                    return False
+                self.load()
+                return True
+            if not os.path.exists(self.meta_file):
+                return False
+            if os.path.getmtime(self.meta_file) == self._meta_mtime:
+                return False
+            self.load()
+            return True
+
+    def add(self, key, vector, meta=None):
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vec.size == 0:
+            raise ValueError("empty vector")
+        with self._lock:
+            if not self.ids:
+                self.dim = vec.size
+                self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+            elif vec.size != self.dim:
+                raise ValueError(f"dimension {vec.size} does not match store dimension {self.dim}")
+
+            norm = float(np.linalg.norm(vec))
+            row = self.id_to_row.get(key)
+            if row is None:
+                row = len(self.ids)
+                self._ensure_capacity(row + 1)
+                self.ids.append(key)
+                self.id_to_row[key] = row
+                self.row_meta.append({})
+            elif row < self._persisted_rows:
+                self._dirty_rows.add(row)
+            self.matrix[row] = vec / norm if norm > 0 else 0.0
+            self.norms[row] = norm
+            self.row_meta[row] = dict(meta or {})
+            if self.index is not None:
+                self.index.add(row, self.matrix[row])
+
+    def get(self, key):
+        row = self.id_to_row.get(key)
+        if row is None:
+            return None
+        return (self.matrix[row] * self.norms[row]).tolist()
+
+    def get_meta(self, key):
+        row = self.id_to_row.get(key)
+        if row is None:
+            return None
+        return self.row_meta[row]
+
+    def has(self, key):
+        return key in self.id_to_row
+
+    def search(self, query_vector, limit=10, nprobe=None, exact=False):
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            n = len(self.ids)
+            if n == 0 or limit <= 0 or query.size != self.dim:
+                return []
+            query_norm = float(np.linalg.norm(query))
+            if query_norm == 0:
+                return []
+            query = query / query_norm
+            k = min(int(limit), n)
+
+            rows = None
+            use_index = (not exact and self.index is not None and self.index.trained
+                         and n >= self.index.min_vectors)
+            if use_index:
+                rows = self.index.candidates(query, nprobe)
+                if rows.shape[0] < k:
+                    rows = None  # Too few candidates in the probed clusters, scan everything
+
+            if rows is None:
+                scores = self.matrix[:n] @ query
+            else:
+                scores = self.matrix[rows] @ query
+
+            if k < scores.shape[0]:
+                top = np.argpartition(-scores, k - 1)[:k]
+            else:
+                top = np.arange(scores.shape[0])
+            top = top[np.argsort(-scores[top], kind="stable")]
+            if rows is not None:
+                return [(self.ids[rows[i]], float(scores[i])) for i in top]
+            return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def create_index(index_type, storage_file=VECTOR_STORE_FILE, **options):
+    """Build the ANN index selected in config ("exact" means no index)."""
+    index_type = (index_type or "exact").lower()
+    if index_type not in INDEX_TYPES:
+        print(f"Unknown vector index type '{index_type}', falling back to exact search.")
+        return None
+    if index_type == "exact":
+        return None
+    index_file = os.path.splitext(storage_file)[0] + ".ivf.npz"
+    return IVFIndex(index_file, **{k: v for k, v in options.items() if v is not None})
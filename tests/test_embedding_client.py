@@ -0,0 +1,36 @@
+import json
+import threading
+import time
+
+from embedding_client import EmbeddingClient
+
+
+def test_embed_many_splits_batches_and_keeps_order(stub_server):
+    requests_seen = []
+    completed = []
+    lock = threading.Lock()
+
+    def embeddings(path, body):
+        texts = json.loads(body)["input"]
+        with lock:
+            requests_seen.append((path, texts))
+        if "t4" in texts:
+            return 500, b'{"error": "upstream failure"}'
+        # Earlier batches answer last, so batches complete out of order
+        time.sleep(0.05 * (6 - int(texts[0][1:])))
+        with lock:
+            completed.append(texts[0])
+        data = [{"index": i, "embedding": [float(text[1:])]} for i, text in enumerate(texts)]
+        return 200, json.dumps({"data": data[::-1]}).encode()
+
+    url = stub_server(embeddings)
+    client = EmbeddingClient(url, "test-key", "test-model", batch_size=2, max_concurrency=4)
+    texts = [f"t{i}" for i in range(7)]
+
+    vectors = client.embed_many(texts)
+
+    assert all(path == "/v1/embeddings" for path, _ in requests_seen)
+    assert sorted(batch for _, batch in requests_seen) == [["t0", "t1"], ["t2", "t3"], ["t4", "t5"], ["t6"]]
+    assert completed == ["t6", "t2", "t0"]
+    # The failing batch comes back as None entries; the others stay in input order
+    assert vectors == [[0.0], [1.0], [2.0], [3.0], None, None, [6.0]]
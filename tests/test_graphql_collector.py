@@ -0,0 +1,78 @@
+import json
+import os
+import re
+
+import graphql_collector
+from conftest import FIXTURES_DIR
+from github_client import GitHubClient
+from graphql_collector import GraphQLCollector, collect_repo_data
+from storage import JSONStorage
+
+with open(os.path.join(FIXTURES_DIR, "graphql_responses.json"), encoding="utf-8") as f:
+    RECORDED = json.load(f)
+
+ALIAS_RE = re.compile(r'^(u\d+): (user\(login: "([^"]+)"|node\(id: "([^"]+)"|nodes\(ids: (\[[^\]]*\]))')
+AFTER_RE = re.compile(r'after: "([^"]+)"')
+
+
+def replay(path, body, log):
+    """Answer a query alias by alias from the recorded payloads; oversized queries fail like GitHub does."""
+    query = json.loads(body)["query"]
+    aliases = [ALIAS_RE.match(line) for line in query.splitlines()]
+    aliases = [m for m in aliases if m]
+    kind = "repos" if aliases[0].group(3) else "languages" if aliases[0].group(4) else "contributions"
+    log.append((path, kind, len(aliases)))
+    if kind == "repos" and len(aliases) > 2:
+        return 200, json.dumps(RECORDED["node_limit_error"]).encode()
+    if kind == "contributions" and len(aliases) > 1:
+        return 502, b'{"message": "Server Error"}'
+
+    data = {"rateLimit": RECORDED["rate_limit"]}
+    for m in aliases:
+        after = AFTER_RE.search(m.string)
+        if kind == "repos":
+            key = m.group(3) + (f"@{after.group(1)}" if after else "")
+            data[m.group(1)] = RECORDED["repos"][key]
+        elif kind == "languages":
+            data[m.group(1)] = RECORDED["languages"][f"{m.group(4)}@{after.group(1)}"]
+        else:
+            data[m.group(1)] = [RECORDED["contributions"][i] for i in json.loads(m.group(5))]
+    return 200, json.dumps({"data": data}).encode()
+
+
+def test_collect_repo_data_against_recorded_responses(stub_server, monkeypatch, tmp_path):
+    log = []
+    url = stub_server(lambda path, body: replay(path, body, log))
+    monkeypatch.setattr(graphql_collector, "GITHUB_GRAPHQL_URL", f"{url}/api/graphql")
+    storage = JSONStorage(str(tmp_path))
+    collector = GraphQLCollector(GitHubClient(tokens=["test-token"]), max_aliases=20, max_query_cost=50)
+
+    collected = collect_repo_data(["alice", "bob", "ghost-user"], storage=storage, collector=collector)
+
+    # Unknown users are left to the REST stages
+    assert collected == {"alice", "bob"}
+    assert all(path == "/api/graphql" for path, _, _ in log)
+    # The node-limit error splits the first repos query and the 502 the contributions query;
+    # batches grow back once queries succeed (alice, bob + ghost-user, alice's second page)
+    assert [n for _, kind, n in log if kind == "repos"] == [3, 1, 2, 1]
+    assert [n for _, kind, n in log if kind == "contributions"] == [2, 1, 1]
+    assert [n for _, kind, n in log if kind == "languages"] == [1]
+
+    # repos.json: both pages, REST field names
+    alice_repos = storage.load_user_document("alice", "repos")["repos"]
+    assert [r["full_name"] for r in alice_repos] == ["alice/polyglot", "alice/dotfiles"]
+    polyglot = alice_repos[0]
+    assert polyglot["open_issues_count"] == 5
+    assert polyglot["topics"] == ["compilers"]
+    assert polyglot["owner"] == {"login": "alice"}
+    assert polyglot["languages_url"].endswith("/repos/alice/polyglot/languages")
+    assert storage.load_user_document("bob", "repos")["repos"][0]["fork"] is True
+    assert not storage.has_user_document("ghost-user", "repos")
+
+    # representative_repos: sorted by stars, complete language map, commit counts
+    representative = storage.load_user_document("alice", "representative_repos")
+    assert [r["full_name"] for r in representative] == ["alice/polyglot", "alice/dotfiles"]
+    assert representative[0]["languages"] == {"Python": 40960, "C": 10240, "Makefile": 512}
+    assert representative[0]["contributions_by_user"] == 57
+    assert representative[1]["contributions_by_user"] == 9
+    assert representative[0]["stars"] == 120 and representative[0]["forks"] == 8